@@ -10,4 +10,5 @@ class CreateMultimeterDTO(BaseModel):
     updated_at: Optional[datetime] = Field(default_factory=datetime.now)
     com_protocol: StrictStr
     com_configure: object
+    vision_configure: Optional[object] = None
     created_by: StrictStr
\ No newline at end of file
@@ -10,4 +10,5 @@ class UpdateMultimeterDTO(BaseModel):
     updated_at: Optional[datetime] = None
     com_protocol: Optional[StrictStr]
     com_configure: Optional[object]
+    vision_configure: Optional[object]
     
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, StrictStr
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 
 
@@ -13,4 +13,5 @@ class MultimeterResDTO(BaseModel):
     created_by: StrictStr
     com_protocol: StrictStr
     com_configure: object
+    vision_configure: Optional[object] = None
     
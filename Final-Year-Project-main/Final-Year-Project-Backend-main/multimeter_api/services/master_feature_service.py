@@ -0,0 +1,80 @@
+import json
+import os
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# The vision service owns the master feature store (its master_features.py
+# defines the layout), so features are computed and removed through it.
+VISION_SERVICE_URL = os.getenv("VISION_SERVICE_URL", "http://localhost:3000")
+VISION_SERVICE_TIMEOUT = 120
+
+executor = ThreadPoolExecutor(max_workers=2)
+
+
+""" Vision Service Request """
+
+
+def visionServiceRequest(method, path, body=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    req = urllib.request.Request(
+        VISION_SERVICE_URL + path,
+        data=data,
+        method=method,
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(req, timeout=VISION_SERVICE_TIMEOUT) as response:
+        return json.loads(response.read())
+
+
+""" Store Master Features """
+
+
+def storeMasterFeatures(model_id, photo, vision_configure=None):
+    return visionServiceRequest(
+        "POST",
+        "/master_features",
+        {
+            "model_id": str(model_id),
+            "master": photo,
+            "vision_configure": vision_configure,
+        },
+    )["path"]
+
+
+""" Log Result """
+
+
+def logResult(future, done, failed):
+    if future.exception() is None:
+        print(f"{done}: {future.result()}")
+    else:
+        print(f"{failed}: {future.exception()}")
+
+
+""" Precompute Master Features """
+
+
+def precomputeMasterFeatures(model_id, photo, vision_configure=None):
+    future = executor.submit(storeMasterFeatures, model_id, photo, vision_configure)
+    future.add_done_callback(
+        lambda f: logResult(
+            f, "Master features precomputed", "Master feature precompute failed"
+        )
+    )
+    return future
+
+
+""" Remove Master Features """
+
+
+def removeMasterFeatures(model_id):
+    future = executor.submit(
+        visionServiceRequest, "DELETE", f"/master_features/{model_id}"
+    )
+    future.add_done_callback(
+        lambda f: logResult(f, "Master features removed", "Master feature removal failed")
+    )
+    return future
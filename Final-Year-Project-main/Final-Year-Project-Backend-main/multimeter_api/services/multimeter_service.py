@@ -5,6 +5,10 @@ from multimeter_api.dto.req.update_multimeter_dto import UpdateMultimeterDTO
 from multimeter_api.dto.res.multimeter_res_dto import MultimeterResDTO
 from datetime import datetime
 from middleware.upload_photos import upload_image
+from multimeter_api.services.master_feature_service import (
+    precomputeMasterFeatures,
+    removeMasterFeatures,
+)
 from pymodbus.client import ModbusSerialClient
 from pymodbus.exceptions import ModbusException
 import struct
@@ -45,7 +49,10 @@ def createMultimeter(DB, multimeter):
         raise (Exception("Please provide image!"))
     multimeter["photo"] = cover_image
     multimeter = CreateMultimeterDTO(**multimeter)
-    DB.insert_one(multimeter.dict())
+    inserted = DB.insert_one(multimeter.dict())
+    precomputeMasterFeatures(
+        inserted.inserted_id, multimeter.photo, multimeter.vision_configure
+    )
     data, total, page, limit = handlePagination(DB)
     return (
         jsonify(
@@ -131,6 +138,17 @@ def updateMultimeter(DB, updated_data, id):
     updated_data_dict = updated_data.dict(exclude_unset=True)
     updated_data_dict["updated_at"] = datetime.now()
     DB.find_one_and_update({"_id": id}, {"$set": updated_data_dict})
+    vision_configure = updated_data_dict.get(
+        "vision_configure", existing_multimeter.get("vision_configure")
+    )
+    if (photo and photo != existing_multimeter["photo"]) or (
+        vision_configure != existing_multimeter.get("vision_configure")
+    ):
+        precomputeMasterFeatures(
+            id,
+            updated_data_dict.get("photo", existing_multimeter["photo"]),
+            vision_configure,
+        )
     data, total, page, limit = handlePagination(DB)
     return (
         jsonify(
@@ -156,6 +174,7 @@ def deleteMultimeter(DB, id):
     if not existing_multimeter:
         raise (Exception("Multimeter not found!"))
     DB.delete_one({"_id": id})
+    removeMasterFeatures(id)
     data, total, page, limit = handlePagination(DB)
     return (
         jsonify(
@@ -195,6 +214,7 @@ def getList(DB):
                 "model": model["model"],
                 "com_protocol": model["com_protocol"],
                 "com_configure": model["com_configure"],
+                "vision_configure": model.get("vision_configure"),
                 "image": model["photo"],
             }
         )
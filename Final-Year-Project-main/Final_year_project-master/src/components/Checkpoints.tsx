@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useDispatch, useSelector } from 'react-redux';
-import { checkMeter, createInspection, getMeters, resetInspectionStatus, changeCapture, changeMasterImage, changeDiff, resetod, getSerialNumber, changeSerialNumber, saveImages } from '../slices/inspectionSlice';
+import { checkMeter, createInspection, getMeters, resetInspectionStatus, changeCapture, changeMasterImage, changeDiff, resetod, getSerialNumber, changeSerialNumber, saveImages, selectCameraFormat, startAutoCapture, stopAutoCapture, autoCaptureResult } from '../slices/inspectionSlice';
 import useErrorNotifier from '../hooks/useErrorNotifier';
 import { set } from 'react-datepicker/dist/date_utils';
 
@@ -28,20 +28,60 @@ const Checkpoints: React.FC = () => {
         client: ''
     });
     const [currentMeter, setCurrentMeter] = useState<any>();
+    const [autoCapture, setAutoCapture] = useState(false);
     const masterRef = useRef<HTMLImageElement>(null);
     const captureRef = useRef<HTMLButtonElement>(null);
     const captureButtonRef = useRef<HTMLButtonElement>(null);
     const retryButtonRef = useRef<HTMLButtonElement>(null);
     const continueButtonRef = useRef<HTMLButtonElement>(null);
     const submitButtonRef = useRef<HTMLButtonElement>(null);
+    // The running checkMeter, aborted when the page is left
+    const checkRef = useRef<any>(null);
 
-    const capture = () => {
+    const meterData = (meter: any) => {
+        const data = {};
+        Object.entries(meter).map(([key, value]) => {
+            if (key === 'image') {
+                return;
+            }
+            data[key] = value;
+        })
+        return data;
+    };
+
+    const capture = async () => {
         const model_type = meters.find((meter: any) => meter.id === inspectionForm.meter_id).model;
         const captured_data = {
             model_type: model_type,
+            model_id: inspectionForm.meter_id,
+            vision_configure: currentMeter?.vision_configure,
             master: masterImage,
+            // New for every placed meter, so only this capture can pick up
+            // the inspection started while its serial number is read
+            speculation_id: `${Date.now()}-${Math.random().toString(36).slice(2)}`,
         }
-        dispatch(checkMeter(captured_data));
+        // The vision service captures and inspects while the serial number
+        // is read, and the capture below picks up that inspection
+        await dispatch(getSerialNumber({ ...meterData(currentMeter), speculate: captured_data }));
+        checkRef.current = dispatch(checkMeter(captured_data));
+    };
+
+    // The vision service inspects on its own once a meter is placed and
+    // still, and pushes each result over server-sent events
+    const toggleAutoCapture = () => {
+        if (autoCapture) {
+            dispatch(stopAutoCapture());
+            setAutoCapture(false);
+            return;
+        }
+        const model_type = meters.find((meter: any) => meter.id === inspectionForm.meter_id).model;
+        dispatch(startAutoCapture({
+            model_type: model_type,
+            model_id: inspectionForm.meter_id,
+            vision_configure: currentMeter?.vision_configure,
+            master: masterImage,
+        }));
+        setAutoCapture(true);
     };
 
     const retry = () => {
@@ -121,6 +161,7 @@ const Checkpoints: React.FC = () => {
             const selectedMeter = meters.find((meter: any) => meter.id === value);
             if (selectedMeter) {
                 dispatch(changeMasterImage(selectedMeter.image))
+                dispatch(selectCameraFormat(selectedMeter.vision_configure))
                 setCurrentMeter(selectedMeter);
             }
         }
@@ -139,17 +180,24 @@ const Checkpoints: React.FC = () => {
     }, [dispatch]);
 
     useEffect(() => {
-        if (inspectionStatus === 'pass' || inspectionStatus === 'fail') {
-            const data = {};
-            Object.entries(currentMeter).map(([key, value]) => {
-                if (key === 'image') {
-                    return;
-                }
-                data[key] = value;
-            })
-            dispatch(getSerialNumber(data));
+        return () => {
+            checkRef.current?.abort();
+        };
+    }, []);
+
+    useEffect(() => {
+        if (!autoCapture) {
+            return;
         }
-    }, [inspectionStatus, od, currentMeter, dispatch]);
+        const events = new EventSource('http://localhost:3000/auto_capture/events');
+        events.addEventListener('result', (event: MessageEvent) => {
+            dispatch(autoCaptureResult(JSON.parse(event.data)));
+            dispatch(getSerialNumber(meterData(currentMeter)));
+        });
+        return () => {
+            events.close();
+        };
+    }, [autoCapture, currentMeter, dispatch]);
 
     useEffect(() => {
         const handleKeyDown = (event: KeyboardEvent) => {
@@ -332,6 +380,13 @@ const Checkpoints: React.FC = () => {
                             >
                                 {capturedImage ? 'Retry' : checkLoading ? 'Processing...' : 'Capture'}
                             </button>
+                            <button
+                                onClick={toggleAutoCapture}
+                                disabled={!inspectionForm.meter_id}
+                                className={`text-white py-2 px-4 ml-2 rounded transition duration-300 w-1/3 ${autoCapture ? 'bg-purple-600 hover:bg-purple-700' : 'bg-gray-600 hover:bg-gray-700'} ${!inspectionForm.meter_id ? 'opacity-50 cursor-not-allowed' : ''}`}
+                            >
+                                {autoCapture ? 'Auto: On' : 'Auto: Off'}
+                            </button>
                         </div>
                         <div className='flex justify-between gap-10'>
                             <button
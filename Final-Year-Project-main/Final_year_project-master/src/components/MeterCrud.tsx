@@ -5,6 +5,7 @@ import { useDispatch, useSelector } from 'react-redux';
 import Tooltip from '@mui/material/Tooltip';
 import { addMeter, captureMaster, deleteMeter, getMeters, resetMasterImage, updateExistMeter } from '../slices/adminSlice';
 import '../styles/customScrollbar.css';
+import RoiEditor from './RoiEditor';
 
 
 const theme = createTheme({
@@ -65,6 +66,14 @@ interface createMeter {
     'serial_no_register': string;
     'date_register': string;
   }
+  vision_configure: {
+    'detector'?: string;
+    'matcher'?: string;
+    'alignment'?: string;
+    'roi'?: number[][];
+    'aoi'?: number[];
+    'binning'?: string;
+  }
 }
 
 interface updateMeter {
@@ -85,6 +94,14 @@ interface updateMeter {
     'serial_no_register'?: string;
     'date_register'?: string;
   }
+  vision_configure?: {
+    'detector'?: string;
+    'matcher'?: string;
+    'alignment'?: string;
+    'roi'?: number[][];
+    'aoi'?: number[];
+    'binning'?: string;
+  }
 }
 
 const modbusFields = [
@@ -107,6 +124,13 @@ const usbFields = [
   'byte_size',
 ]
 
+const visionOptions = {
+  detector: ['sift', 'orb', 'akaze'],
+  matcher: ['bf', 'flann'],
+  alignment: ['full', 'pyramid'],
+  binning: ['1', '2', '4'],
+}
+
 const nameTolabelMap = {
   model: "Meter Name",
   description: "Meter Description",
@@ -121,7 +145,11 @@ const nameTolabelMap = {
   stop_bits: "Stop Bits",
   byte_size: "Byte Size",
   ip: "IP",
-  port: "Port"
+  port: "Port",
+  detector: "Feature Detector",
+  matcher: "Feature Matcher",
+  alignment: "Alignment Mode",
+  binning: "Sensor Binning"
 }
 
 const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
@@ -142,6 +170,11 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
       register_count: '',
       serial_no_register: '',
       date_register: '',
+    },
+    vision_configure: {
+      detector: 'sift',
+      matcher: 'bf',
+      alignment: 'full',
     }
   });
   const [selectedMeter, setSelectedMeter] = useState<any>(null);
@@ -220,6 +253,41 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
     });
   }
 
+  const handleVisionConfigure = (event, type: 'create' | 'update') => {
+    const { name, value } = event.target;
+    if (type === 'create') {
+      setCreateMeter({
+        ...createMeter,
+        vision_configure: {
+          ...createMeter.vision_configure,
+          [name]: value
+        }
+      });
+    } else {
+      setUpdateMeter({
+        ...updateMeter,
+        vision_configure: {
+          ...updateMeter.vision_configure,
+          [name]: value
+        }
+      });
+    }
+  }
+
+  const handleRoiChange = (roi: number[][], type: 'create' | 'update') => {
+    if (type === 'create') {
+      setCreateMeter({
+        ...createMeter,
+        vision_configure: { ...createMeter.vision_configure, roi }
+      });
+    } else {
+      setUpdateMeter({
+        ...updateMeter,
+        vision_configure: { ...updateMeter.vision_configure, roi }
+      });
+    }
+  }
+
   const handleUpdate = (event) => {
     const { name, value } = event.target;
     setUpdateMeter({
@@ -253,6 +321,11 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
           register_count: '',
           serial_no_register: '',
           date_register: '',
+        },
+        vision_configure: {
+          detector: 'sift',
+          matcher: 'bf',
+          alignment: 'full',
         }
       });
     }
@@ -379,7 +452,8 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                     parity: params.row.com_configure.parity,
                     stop_bits: params.row.com_configure.stop_bits,
                     byte_size: params.row.com_configure.byte_size,
-                  }
+                  },
+                  vision_configure: params.row.vision_configure || {}
                 });
               }
               else if (prot == "ethernet") {
@@ -396,7 +470,8 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                     ip: params.row.com_configure.ip,
                     port: params.row.com_configure.port
 
-                  }
+                  },
+                  vision_configure: params.row.vision_configure || {}
                 });
               }
               else {
@@ -414,7 +489,8 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                     parity: params.row.com_configure.parity,
                     stop_bits: params.row.com_configure.stop_bits,
                     byte_size: params.row.com_configure.byte_size,
-                  }
+                  },
+                  vision_configure: params.row.vision_configure || {}
                 });
               }
               setActiveTab('update');
@@ -475,7 +551,7 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                 <div className='flex flex-col gap-4 w-1/2 p-2 overflow-y-scroll custom-scrollbar h-64'>
                   {Object.entries(createMeter).map(([key, value]) => {
                     if (key === 'photo' || key ===
-                      "com_configure"
+                      "com_configure" || key === "vision_configure"
                     ) return null;
                     if (key === 'com_protocol') {
                       return (
@@ -593,6 +669,24 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                       </>
                     )
                   }
+                  {Object.entries(visionOptions).map(([key, options]) => (
+                    <div key={key}>
+                      <label className="block text-md font-semibold text-white mb-2 float-left" htmlFor={key}>
+                        {nameTolabelMap[key]}
+                      </label>
+                      <select
+                        style={{ backgroundColor: '#1F2937', color: 'white' }}
+                        className="border rounded p-2 w-full text-white"
+                        name={key}
+                        value={createMeter.vision_configure[key]}
+                        onChange={(e) => handleVisionConfigure(e, 'create')}
+                      >
+                        {options.map((option) => (
+                          <option key={option} value={option}>{option.toUpperCase()}</option>
+                        ))}
+                      </select>
+                    </div>
+                  ))}
                   <div>
                     <label className="block text-md font-semibold text-white mb-2 float-left" htmlFor="photo">
                       Upload Meter Image
@@ -603,11 +697,11 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
 
                 <div className="flex flex-col items-center w-1/2">
                   {
-                    masterImage ? (
-                      <img
-                        src={masterImage}
-                        alt="Meter Preview"
-                        className="w-full h-auto mb-4 rounded-lg"
+                    createMeter.photo ? (
+                      <RoiEditor
+                        src={createMeter.photo as unknown as string}
+                        roi={createMeter.vision_configure.roi}
+                        onChange={(roi) => handleRoiChange(roi, 'create')}
                       />
                     ) : (
                       <img
@@ -630,7 +724,7 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                     <button
                       className="bg-green-600 text-white py-2 px-4 rounded hover:bg-green-500 w-1/2"
                       onClick={() => {
-                        dispatch(captureMaster());
+                        dispatch(captureMaster(createMeter.vision_configure));
                       }}
                     >
                       Capture
@@ -670,7 +764,7 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                   <div className='flex flex-col gap-4 w-1/2 p-2 overflow-y-scroll custom-scrollbar h-64'>
                     {Object.entries(updateMeter).map(([key, value]) => {
                       if (key === 'photo' || key ===
-                        "com_configure"
+                        "com_configure" || key === "vision_configure"
                       ) return null;
                       if (key === 'com_protocol') {
                         return (
@@ -786,6 +880,24 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                         ))}
                       </>
                     )}
+                    {Object.entries(visionOptions).map(([key, options]) => (
+                      <div key={key}>
+                        <label className="block text-md font-semibold text-white mb-2 float-left" htmlFor={key}>
+                          {nameTolabelMap[key]}
+                        </label>
+                        <select
+                          style={{ backgroundColor: '#1F2937', color: 'white' }}
+                          className="border rounded p-2 w-full text-white"
+                          name={key}
+                          value={updateMeter.vision_configure?.[key] || options[0]}
+                          onChange={(e) => handleVisionConfigure(e, 'update')}
+                        >
+                          {options.map((option) => (
+                            <option key={option} value={option}>{option.toUpperCase()}</option>
+                          ))}
+                        </select>
+                      </div>
+                    ))}
                     <div>
                       <label className="block text-md font-semibold text-white mb-2 float-left" htmlFor="photo">
                         Upload Meter Image
@@ -794,11 +906,21 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                     </div>
                   </div>
                   <div className="flex flex-col items-center w-1/2">
-                    <img
-                      src={'http://localhost:3000/video_feed'}
-                      alt="Meter Preview"
-                      className="w-full h-auto mb-4 rounded-lg"
-                    />
+                    {
+                      updateMeter.photo ? (
+                        <RoiEditor
+                          src={updateMeter.photo as unknown as string}
+                          roi={updateMeter.vision_configure?.roi}
+                          onChange={(roi) => handleRoiChange(roi, 'update')}
+                        />
+                      ) : (
+                        <img
+                          src={'http://localhost:3000/video_feed'}
+                          alt="Meter Preview"
+                          className="w-full h-auto mb-4 rounded-lg"
+                        />
+                      )
+                    }
                     <div className="flex space-x-4 w-full justify-between">
                       <button
                         className="bg-yellow-600 text-white py-2 px-4 rounded hover:bg-yellow-500 w-1/2"
@@ -812,7 +934,7 @@ const MeterCrud: React.FC<MeterCrudProps> = ({ tab }) => {
                       <button
                         className="bg-green-600 text-white py-2 px-4 rounded hover:bg-green-500 w-1/2"
                         onClick={() => {
-                          dispatch(captureMaster());
+                          dispatch(captureMaster(updateMeter.vision_configure));
                         }}
                       >
                         Capture
@@ -0,0 +1,99 @@
+import React, { useRef, useState } from 'react';
+
+type Roi = number[];
+
+interface RoiEditorProps {
+  src: string;
+  roi?: Roi[] | null;
+  onChange: (roi: Roi[]) => void;
+}
+
+const round = (value: number) => Math.round(Math.min(Math.max(value, 0), 1) * 10000) / 10000;
+
+const RoiEditor: React.FC<RoiEditorProps> = ({ src, roi, onChange }) => {
+  const containerRef = useRef<HTMLDivElement>(null);
+  const [start, setStart] = useState<{ x: number; y: number } | null>(null);
+  const [draft, setDraft] = useState<Roi | null>(null);
+  const regions = roi || [];
+
+  const toRelative = (event: React.MouseEvent) => {
+    const rect = containerRef.current!.getBoundingClientRect();
+    return {
+      x: round((event.clientX - rect.left) / rect.width),
+      y: round((event.clientY - rect.top) / rect.height),
+    };
+  };
+
+  const handleMouseDown = (event: React.MouseEvent) => {
+    event.preventDefault();
+    setStart(toRelative(event));
+  };
+
+  const handleMouseMove = (event: React.MouseEvent) => {
+    if (!start) return;
+    const point = toRelative(event);
+    setDraft([
+      Math.min(start.x, point.x),
+      Math.min(start.y, point.y),
+      round(Math.abs(point.x - start.x)),
+      round(Math.abs(point.y - start.y)),
+    ]);
+  };
+
+  const handleMouseUp = () => {
+    if (draft && draft[2] > 0.01 && draft[3] > 0.01) {
+      onChange([...regions, draft]);
+    }
+    setStart(null);
+    setDraft(null);
+  };
+
+  const boxStyle = (box: Roi): React.CSSProperties => ({
+    left: `${box[0] * 100}%`,
+    top: `${box[1] * 100}%`,
+    width: `${box[2] * 100}%`,
+    height: `${box[3] * 100}%`,
+  });
+
+  return (
+    <div className="w-full mb-4">
+      <div
+        ref={containerRef}
+        className="relative w-full select-none cursor-crosshair"
+        onMouseDown={handleMouseDown}
+        onMouseMove={handleMouseMove}
+        onMouseUp={handleMouseUp}
+        onMouseLeave={handleMouseUp}
+      >
+        <img src={src} alt="Meter Preview" className="w-full h-auto rounded-lg" draggable={false} />
+        {regions.map((box, index) => (
+          <div
+            key={index}
+            className="absolute border-2 border-teal-400 bg-teal-400 bg-opacity-20"
+            style={boxStyle(box)}
+          />
+        ))}
+        {draft && (
+          <div className="absolute border-2 border-dashed border-yellow-400" style={boxStyle(draft)} />
+        )}
+      </div>
+      <div className="flex justify-between items-center mt-2 text-white text-sm">
+        <span>
+          {regions.length
+            ? `${regions.length} inspection region(s)`
+            : 'Drag on the image to limit inspection to regions'}
+        </span>
+        {regions.length > 0 && (
+          <button
+            className="bg-gray-600 text-white py-1 px-3 rounded hover:bg-gray-500"
+            onClick={() => onChange([])}
+          >
+            Clear Regions
+          </button>
+        )}
+      </div>
+    </div>
+  );
+};
+
+export default RoiEditor;
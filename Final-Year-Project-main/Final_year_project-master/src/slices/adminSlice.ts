@@ -243,9 +243,9 @@ export const sendEmail = createAsyncThunk(
 
 export const captureMaster = createAsyncThunk(
     'admin/captureMaster',
-    async (_, { rejectWithValue }) => {
+    async (vision_configure: any, { rejectWithValue }) => {
         try {
-            const response = await axios.post('http://localhost:3000/capture_master_image');
+            const response = await axios.post('http://localhost:3000/capture_master_image', { vision_configure });
             return response.data;
         } catch (error: any) {
             if (error.response && error.response.data) {
@@ -109,15 +109,84 @@ export const getMeters = createAsyncThunk(
     }
 );
 
+// Inspections run as jobs on the vision service; the job is polled until it
+// finishes so a long alignment never holds a request open. Polling stops
+// after JOB_DEADLINE, or when the dispatching component aborts the thunk
+const JOB_POLL_INTERVAL = 300;
+const JOB_DEADLINE = 60000;
+
 export const checkMeter = createAsyncThunk(
     'inspections/checkMeter',
-    async (form, { rejectWithValue }) => {
+    async (form, { rejectWithValue, signal }) => {
         try {
-            const response = await axios.post('http://localhost:3000/capture', form, {
+            const submitted = await axios.post('http://localhost:3000/jobs', form, {
                 headers: {
                     'Content-Type': 'application/json'
-                }
+                },
+                signal
             })
+            const deadline = Date.now() + JOB_DEADLINE;
+            while (!signal.aborted) {
+                if (Date.now() > deadline) {
+                    return rejectWithValue('Inspection did not finish in time');
+                }
+                const response = await axios.get(`http://localhost:3000${submitted.data.status_url}`, { signal });
+                if (response.data.status === 'done') {
+                    return response.data.result;
+                }
+                if (response.data.status === 'failed') {
+                    return rejectWithValue(response.data.error.error);
+                }
+                await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL));
+            }
+            return rejectWithValue('Inspection cancelled');
+        } catch (error: any) {
+            if (error.response && error.response.data) {
+                return rejectWithValue(error.response.data.error);
+            } else {
+                return rejectWithValue(error.message);
+            }
+        }
+    }
+);
+
+export const selectCameraFormat = createAsyncThunk(
+    'inspections/selectCameraFormat',
+    async (vision_configure: any, { rejectWithValue }) => {
+        try {
+            const response = await axios.post('http://localhost:3000/camera_format', { vision_configure });
+            return response.data;
+        } catch (error: any) {
+            if (error.response && error.response.data) {
+                return rejectWithValue(error.response.data.error);
+            } else {
+                return rejectWithValue(error.message);
+            }
+        }
+    }
+);
+
+export const startAutoCapture = createAsyncThunk(
+    'inspections/startAutoCapture',
+    async (form: any, { rejectWithValue }) => {
+        try {
+            const response = await axios.post('http://localhost:3000/auto_capture/start', form);
+            return response.data;
+        } catch (error: any) {
+            if (error.response && error.response.data) {
+                return rejectWithValue(error.response.data.error);
+            } else {
+                return rejectWithValue(error.message);
+            }
+        }
+    }
+);
+
+export const stopAutoCapture = createAsyncThunk(
+    'inspections/stopAutoCapture',
+    async (_, { rejectWithValue }) => {
+        try {
+            const response = await axios.post('http://localhost:3000/auto_capture/stop');
             return response.data;
         } catch (error: any) {
             if (error.response && error.response.data) {
@@ -217,6 +286,12 @@ const inspectionSlice = createSlice({
         },
         changeSerialNumber(state) {
             state.serial_no = '';
+        },
+        autoCaptureResult(state, action) {
+            state.inspectionStatus = action.payload.res;
+            state.capturedImage = action.payload.image;
+            state.diffImage = action.payload.diff;
+            state.od = action.payload.od;
         }
     },
     extraReducers: (builder) => {
@@ -273,6 +348,9 @@ const inspectionSlice = createSlice({
                 state.checkLoading = false;
                 state.error = action.payload;
             })
+            .addCase(startAutoCapture.rejected, (state, action: PayloadAction<any>) => {
+                state.error = action.payload;
+            })
             .addCase(createInspection.pending, (state) => {
                 state.loading = true;
                 state.error = null;
@@ -312,5 +390,5 @@ const inspectionSlice = createSlice({
     },
 });
 
-export const { resetInspectionStatus, clearErrors, changeCapture, changeMasterImage, changeDiff, resetod, changeSerialNumber } = inspectionSlice.actions;
+export const { resetInspectionStatus, clearErrors, changeCapture, changeMasterImage, changeDiff, resetod, changeSerialNumber, autoCaptureResult } = inspectionSlice.actions;
 export default inspectionSlice.reducer;
\ No newline at end of file
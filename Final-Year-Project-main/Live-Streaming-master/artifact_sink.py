@@ -0,0 +1,79 @@
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+
+import cv2
+
+# Debug images are only written when DEBUG_ARTIFACTS=1
+DEBUG_ARTIFACTS = os.getenv("DEBUG_ARTIFACTS", "0") == "1"
+DEBUG_ARTIFACTS_DIR = os.getenv("DEBUG_ARTIFACTS_DIR", "./debug_artifacts")
+ARTIFACT_QUEUE_SIZE = 64
+
+
+class ArtifactSink:
+    """Background PNG writer for inspection debug images.
+
+    Images are queued without blocking and written by a single daemon thread
+    under <root>/<inspection_id>/<name>.png. When the queue is full the image
+    is dropped and counted rather than delaying the inspection.
+    """
+
+    def __init__(
+        self,
+        root=DEBUG_ARTIFACTS_DIR,
+        enabled=DEBUG_ARTIFACTS,
+        max_queue=ARTIFACT_QUEUE_SIZE,
+    ):
+        self.root = root
+        self.enabled = enabled
+        self.dropped = 0
+        self.written = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def new_inspection(self, model_name=""):
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(model_name or "inspection"))
+        return f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:6]}"
+
+    def put(self, inspection_id, name, image):
+        """Queue image for writing; the caller must not modify it afterwards."""
+        if not self.enabled:
+            return False
+        self._start()
+        try:
+            self._queue.put_nowait((inspection_id, name, image))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            inspection_id, name, image = self._queue.get()
+            try:
+                directory = os.path.join(self.root, inspection_id)
+                os.makedirs(directory, exist_ok=True)
+                if cv2.imwrite(os.path.join(directory, f"{name}.png"), image):
+                    self.written += 1
+            except Exception as e:
+                print(f"Could not write debug artifact {name}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        self._queue.join()
+
+
+artifact_sink = ArtifactSink()
@@ -0,0 +1,174 @@
+import json
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+# Seconds between frames the acquisition loop looks at
+AUTO_CAPTURE_INTERVAL = 0.05
+# Motion is measured on frames downscaled to this width
+MOTION_WIDTH = 160
+# Grey-level difference above which a downscaled pixel counts as changed
+PIXEL_DELTA = 25
+EVENT_QUEUE_SIZE = 16
+KEEPALIVE = 15.0
+
+
+def motion_frame(frame):
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height = max(1, round(gray.shape[0] * MOTION_WIDTH / gray.shape[1]))
+    small = cv2.resize(gray, (MOTION_WIDTH, height), interpolation=cv2.INTER_AREA)
+    return cv2.GaussianBlur(small, (5, 5), 0)
+
+
+def changed_fraction(a, b):
+    return float(np.count_nonzero(cv2.absdiff(a, b) > PIXEL_DELTA)) / a.size
+
+
+class StabilityDetector:
+    """Decide when a meter has been placed in the fixture and is at rest.
+
+    The scene is still once fewer than motion_threshold of its pixels changed
+    between consecutive frames for still_frames frames. A still scene that
+    differs from the empty fixture (the background, taken from the first
+    frame) in more than change_threshold of its pixels triggers once; the
+    next trigger waits until the scene is back to the background, i.e. the
+    meter was taken out.
+    """
+
+    def __init__(self, still_frames=5, motion_threshold=0.005, change_threshold=0.02):
+        self.still_frames = still_frames
+        self.motion_threshold = motion_threshold
+        self.change_threshold = change_threshold
+        self.background = None
+        self.previous = None
+        self.still = 0
+        self.motion = 0.0
+        self.change = 0.0
+        self.state = "waiting"
+
+    def feed(self, frame):
+        small = motion_frame(frame)
+        if self.background is None:
+            self.background = self.previous = small
+            return False
+        self.motion = changed_fraction(small, self.previous)
+        self.previous = small
+        self.still = self.still + 1 if self.motion <= self.motion_threshold else 0
+        if self.still < self.still_frames:
+            return False
+        self.change = changed_fraction(small, self.background)
+        placed = self.change > self.change_threshold
+        if self.state == "waiting" and placed:
+            self.state = "triggered"
+            return True
+        if not placed:
+            # Follow slow lighting drift of the empty fixture
+            self.background = small
+            self.state = "waiting"
+        return False
+
+    def status(self):
+        return {
+            "state": self.state,
+            "still": self.still,
+            "motion": round(self.motion, 4),
+            "change": round(self.change, 4),
+        }
+
+
+class AutoCapture:
+    """Watch the camera on a background thread and inspect placed meters.
+
+    Each frame from grab is fed to a StabilityDetector; when it triggers,
+    inspect() runs on the same thread and its result, or its error, is
+    published to every subscriber as a server-sent event.
+    """
+
+    def __init__(self, grab, interval=AUTO_CAPTURE_INTERVAL):
+        self.grab = grab
+        self.interval = interval
+        self.detector = None
+        self.inspections = 0
+        self._thread = None
+        self._stop = threading.Event()
+        self._subscribers = []
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, inspect, detector):
+        self.stop()
+        self.detector = detector
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(inspect, detector, self._stop), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+        self.publish("state", self.status())
+
+    def status(self):
+        status = {"running": self.running, "inspections": self.inspections}
+        if self.detector is not None:
+            status.update(self.detector.status())
+        return status
+
+    def _run(self, inspect, detector, stop):
+        # Published from the loop so subscribers see it before any trigger
+        self.publish("state", self.status())
+        while not stop.is_set():
+            try:
+                if detector.feed(self.grab()):
+                    self.publish("triggered", detector.status())
+                    self.inspections += 1
+                    self.publish("result", inspect())
+            except Exception as e:
+                self.publish("error", {"error": str(e)})
+            stop.wait(self.interval)
+
+    def subscribe(self):
+        events = queue.Queue(maxsize=EVENT_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.append(events)
+        return events
+
+    def unsubscribe(self, events):
+        with self._lock:
+            if events in self._subscribers:
+                self._subscribers.remove(events)
+
+    def publish(self, event, data):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for events in subscribers:
+            try:
+                events.put_nowait((event, data))
+            except queue.Full:
+                # A client that stopped reading loses events, not the loop
+                pass
+
+    def stream(self):
+        """Server-sent events for one client, until it disconnects."""
+        events = self.subscribe()
+        try:
+            yield f"event: state\ndata: {json.dumps(self.status())}\n\n"
+            while True:
+                try:
+                    event, data = events.get(timeout=KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            self.unsubscribe(events)
@@ -0,0 +1,295 @@
+"""Re-run the current inspection over the archive of saved inspection images.
+
+/saveImages keeps every inspected frame as <root>/<model_type>/<serial_no>.*
+next to its <serial_no>_diff.*. Each model's master comes from a master.*
+image in its folder, from --masters/<model_type>.*, or with --mongo from the
+Multimeter collection, which also supplies the model's vision_configure and
+the verdicts recorded in Result:
+
+    python batch_reinspect.py D:/Rishabh_Images --out reinspect.csv --workers 8
+    python batch_reinspect.py D:/Rishabh_Images --models ABC-modbus --mongo
+
+Images are analysed in a process pool and every result is appended to --out
+as soon as it is known, so an interrupted run resumes where it stopped when
+started again with the same --out. The archive holds the one frame
+find_defect reported per inspection, so each image gets that frame's vote:
+pass when no unexplained contour is left.
+
+Every image is aligned from scratch: reusing a homography and screening
+frames with it would make an image's verdict depend on the images its
+worker processed before, so a resumed run would not match a fresh one.
+--reuse-homography turns both back on to time the station's fast path.
+"""
+
+import argparse
+import base64
+import csv
+import glob
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from inspection import analyse_frame, get_master_features, vision_settings
+from master_features import MASTER_STORE_DIR, photo_hash
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+COLUMNS = [
+    "model",
+    "image",
+    "verdict",
+    "recorded",
+    "operator_dependent",
+    "contours",
+    "matched",
+    "homography",
+    "screen",
+    "read_ms",
+    "analyse_ms",
+    "detect_ms",
+    "match_ms",
+    "homography_ms",
+    "refine_ms",
+    "screen_ms",
+    "error",
+]
+# analyse_frame stats reported per image and averaged per model
+STAGES = ["detect_ms", "match_ms", "homography_ms", "refine_ms", "screen_ms"]
+# Settings that make each image's analysis independent of the others
+ORDER_INDEPENDENT = {"reuse_homography": False, "screen": False}
+PROGRESS_EVERY = 100
+
+# Per worker process: model -> (master, features, settings)
+_models = {}
+_sources = {}
+_options = {}
+
+
+def is_image(path):
+    return path.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def archive_images(folder):
+    """Inspected frames of one model folder, without masters and diffs."""
+    return sorted(
+        path
+        for path in glob.glob(os.path.join(folder, "*"))
+        if is_image(path)
+        and not os.path.basename(path).lower().startswith("master.")
+        and not os.path.splitext(path)[0].endswith("_diff")
+    )
+
+
+def find_master_file(folder, model, masters_dir):
+    candidates = glob.glob(os.path.join(folder, "master.*"))
+    if masters_dir:
+        candidates += glob.glob(os.path.join(masters_dir, f"{model}.*"))
+    candidates = [path for path in candidates if is_image(path)]
+    return candidates[0] if candidates else None
+
+
+def load_mongo(models):
+    """Masters, settings and recorded verdicts of models from MongoDB."""
+    from pymongo import MongoClient
+
+    db = MongoClient(os.getenv("MONGO_URI"))["Project"]
+    sources, recorded = {}, {}
+    for meter in db["Multimeter"].find({"model": {"$in": models}}):
+        sources[meter["model"]] = {
+            "master": base64.b64decode(meter["photo"].split(",", 1)[1]),
+            "vision_configure": meter.get("vision_configure"),
+            "model_id": str(meter["_id"]),
+        }
+        for result in db["Result"].find(
+            {"meter_id": str(meter["_id"])}, {"serial_no": 1, "status": 1}
+        ):
+            recorded[(meter["model"], result["serial_no"])] = result["status"]
+    return sources, recorded
+
+
+def init_worker(sources, reuse_homography=False):
+    _sources.update(sources)
+    _options["reuse_homography"] = reuse_homography
+
+
+def model_state(model):
+    if model not in _models:
+        source = _sources[model]
+        data = source["master"]
+        master = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        vision_configure = dict(source.get("vision_configure") or {})
+        if not _options.get("reuse_homography"):
+            vision_configure.update(ORDER_INDEPENDENT)
+        settings = vision_settings(vision_configure)
+        features = get_master_features(
+            master, settings, photo_hash(data), source.get("model_id")
+        )
+        _models[model] = master, features, settings
+    return _models[model]
+
+
+def inspect_image(model, path):
+    row = {"model": model, "image": os.path.basename(path)}
+    try:
+        master, features, settings = model_state(model)
+        start = time.perf_counter()
+        frame = cv2.imread(path)
+        if frame is None:
+            raise ValueError("unreadable image")
+        row["read_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        stats = {}
+        start = time.perf_counter()
+        contours, matched, _ = analyse_frame(master, frame, features, settings, stats)
+        row["analyse_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        # find_defect's vote for a single frame
+        row["verdict"] = "pass" if contours == 0 and matched == 0 else "fail"
+        row["operator_dependent"] = contours > 0 and matched == 0
+        row["contours"], row["matched"] = contours, matched
+        row["homography"] = stats.get("homography", "")
+        row["screen"] = stats.get("screen", "")
+        for stage in STAGES:
+            row[stage] = stats.get(stage, "")
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+def mean_ms(rows, column):
+    """Mean of a timing column over the rows that have it, 0 if none do."""
+    times = [float(row[column]) for row in rows if row.get(column) not in (None, "")]
+    return float(np.mean(times)) if times else 0.0
+
+
+def completed_rows(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline="") as f:
+        reader = csv.DictReader(f)
+        if reader.fieldnames and reader.fieldnames != COLUMNS:
+            raise SystemExit(f"{path} has other columns, use another --out")
+        return {(row["model"], row["image"]): row for row in reader}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("root", help="archive root, e.g. D:/Rishabh_Images")
+    parser.add_argument("--models", nargs="*", help="model folders to include")
+    parser.add_argument("--masters", help="directory of <model_type>.* masters")
+    parser.add_argument("--mongo", action="store_true", help="masters from MONGO_URI")
+    parser.add_argument(
+        "--vision-configure", help="JSON settings used instead of each model's"
+    )
+    parser.add_argument("--out", default="reinspect.csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--retry-errors", action="store_true")
+    parser.add_argument(
+        "--reuse-homography",
+        action="store_true",
+        help="reuse and screen as the station does; results depend on order",
+    )
+    args = parser.parse_args()
+
+    folders = {
+        os.path.basename(path): path
+        for path in sorted(glob.glob(os.path.join(args.root, "*")))
+        if os.path.isdir(path)
+        and os.path.abspath(path) != os.path.abspath(MASTER_STORE_DIR)
+        and (not args.models or os.path.basename(path) in args.models)
+    }
+    sources, recorded = load_mongo(list(folders)) if args.mongo else ({}, {})
+    for model, folder in folders.items():
+        path = find_master_file(folder, model, args.masters)
+        if path is not None:
+            with open(path, "rb") as f:
+                sources.setdefault(model, {})["master"] = f.read()
+    if args.vision_configure:
+        for source in sources.values():
+            source["vision_configure"] = json.loads(args.vision_configure)
+
+    done = completed_rows(args.out)
+    if args.retry_errors:
+        done = {key: row for key, row in done.items() if not row.get("error")}
+    tasks = []
+    for model, folder in folders.items():
+        if "master" not in sources.get(model, {}):
+            print(f"{model}: no master found, skipped")
+            continue
+        tasks += [
+            (model, path)
+            for path in archive_images(folder)
+            if (model, os.path.basename(path)) not in done
+        ]
+    print(f"{len(done)} images already done, {len(tasks)} to inspect")
+
+    rows = list(done.values())
+    if args.retry_errors:
+        # Rewrite the table without the rows about to be retried
+        with open(args.out, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    new_file = not os.path.exists(args.out)
+    start = time.perf_counter()
+    with open(args.out, "a", newline="") as f, ProcessPoolExecutor(
+        args.workers, initializer=init_worker, initargs=(sources, args.reuse_homography)
+    ) as executor:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        if new_file:
+            writer.writeheader()
+        pending, queued, finished = set(), iter(tasks), 0
+        while True:
+            # Keep a few tasks per worker in flight, not the whole archive
+            for model, path in queued:
+                pending.add(executor.submit(inspect_image, model, path))
+                if len(pending) >= 4 * args.workers:
+                    break
+            if not pending:
+                break
+            complete, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in complete:
+                row = future.result()
+                serial_no = os.path.splitext(row["image"])[0]
+                row["recorded"] = recorded.get((row["model"], serial_no), "")
+                writer.writerow(row)
+                f.flush()
+                rows.append(row)
+                finished += 1
+                if finished % PROGRESS_EVERY == 0:
+                    elapsed = time.perf_counter() - start
+                    print(
+                        f"{finished}/{len(tasks)} images, "
+                        f"{finished / elapsed:.1f} images/s"
+                    )
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{'model':>20}  {'images':>7}  {'pass':>6}  {'fail':>6}  {'errors':>6}  "
+        f"{'agree':>6}  {'ms_mean':>8}  "
+        + "  ".join(f"{stage:>13}" for stage in STAGES)
+    )
+    for model in sorted({row["model"] for row in rows}):
+        model_rows = [row for row in rows if row["model"] == model]
+        verdicts = [row.get("verdict") for row in model_rows]
+        compared = [row for row in model_rows if row.get("recorded")]
+        agree = sum(row["recorded"] == row.get("verdict") for row in compared)
+        times = mean_ms(model_rows, "analyse_ms")
+        print(
+            f"{model:>20}  {len(model_rows):>7}  {verdicts.count('pass'):>6}  "
+            f"{verdicts.count('fail'):>6}  "
+            f"{sum(1 for row in model_rows if row.get('error')):>6}  "
+            f"{f'{agree}/{len(compared)}' if compared else '-':>6}  "
+            f"{times:>8.1f}  "
+            + "  ".join(f"{mean_ms(model_rows, stage):>13.1f}" for stage in STAGES)
+        )
+    if tasks:
+        print(
+            f"{len(tasks)} images in {elapsed:.1f}s, "
+            f"{len(tasks) / elapsed:.1f} images/s with {args.workers} workers"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import glob
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    from pyueye import ueye
+except ImportError:  # only the simulated camera is available
+    ueye = None
+
+# "ueye" for the IDS camera, "simulated" to replay images from
+# SIMULATED_CAMERA_DIR instead
+CAMERA = os.getenv("CAMERA", "ueye")
+SIMULATED_CAMERA_DIR = os.getenv("SIMULATED_CAMERA_DIR", "./section_2_clear")
+# Seconds the simulated camera takes to read out a full-sensor frame; smaller
+# AOIs and binned frames take proportionally less
+SIMULATED_READOUT = float(os.getenv("SIMULATED_READOUT", "0"))
+BINNING_FACTORS = (1, 2, 4)
+
+
+class CameraError(Exception):
+    pass
+
+
+def aoi_rect(size, aoi=None, step=(1, 1)):
+    """Pixel (x, y, w, h) of a normalised [x, y, w, h] AOI in an image of size.
+
+    Position and size are rounded down to multiples of step, the sensor's
+    AOI increments; None is the whole image.
+    """
+    width, height = size
+    if aoi is None:
+        return 0, 0, width - width % step[0], height - height % step[1]
+    x, y, w, h = (min(max(float(v), 0.0), 1.0) for v in aoi)
+    x, y = int(x * width), int(y * height)
+    x, y = x - x % step[0], y - y % step[1]
+    w = min(int(w * width), width - x)
+    h = min(int(h * height), height - y)
+    w, h = w - w % step[0], h - h % step[1]
+    if w <= 0 or h <= 0:
+        raise CameraError(f"AOI {aoi} is empty on a {width}x{height} sensor")
+    return x, y, w, h
+
+
+class Camera:
+    """Readout format shared by the IDS and simulated cameras.
+
+    configure() sets the AOI as a normalised [x, y, w, h] of the sensor and a
+    binning or subsampling factor; grab() returns a BGR frame of exactly that
+    readout. configure() with the current format does nothing, so it can be
+    called for every request of the selected model.
+    """
+
+    def __init__(self, sensor_size, step=(1, 1)):
+        self.sensor_size = sensor_size
+        self.step = step
+        self.format = None
+        self.rect = None
+        self._lock = threading.RLock()
+
+    @property
+    def shape(self):
+        return self.rect[3], self.rect[2], 3
+
+    def configure(self, aoi=None, binning=1, subsampling=1):
+        binning, subsampling = int(binning), int(subsampling)
+        for factor in (binning, subsampling):
+            if factor not in BINNING_FACTORS:
+                raise CameraError(f"Unsupported binning/subsampling {factor}")
+        if binning > 1 and subsampling > 1:
+            raise CameraError("Use either binning or subsampling, not both")
+        aoi = tuple(float(v) for v in aoi) if aoi is not None else None
+        format = (aoi, binning, subsampling)
+        with self._lock:
+            if format == self.format:
+                return False
+            factor = binning * subsampling
+            size = (self.sensor_size[0] // factor, self.sensor_size[1] // factor)
+            rect = aoi_rect(size, aoi, self.step)
+            self._apply(rect, binning, subsampling)
+            self.format, self.rect = format, rect
+        return True
+
+    def grab(self):
+        with self._lock:
+            return self._grab()
+
+    def clear(self):
+        """Drop a frame the camera may have buffered before the next grab."""
+
+    def _apply(self, rect, binning, subsampling):
+        raise NotImplementedError
+
+    def _grab(self):
+        raise NotImplementedError
+
+
+class UEyeCamera(Camera):
+    def __init__(self, device=0):
+        if ueye is None:
+            raise CameraError("pyueye is not installed")
+        self.hCam = ueye.HIDS(device)
+        sInfo = ueye.SENSORINFO()
+        ret = ueye.is_InitCamera(self.hCam, None)
+        if ret != ueye.IS_SUCCESS:
+            raise CameraError(f"Camera initialization failed with error code: {ret}")
+        ueye.is_GetSensorInfo(self.hCam, sInfo)
+        # Set color mode to RGB8
+        ueye.is_SetColorMode(self.hCam, ueye.IS_CM_BGR8_PACKED)
+        position_step, size_step = ueye.IS_POINT_2D(), ueye.IS_SIZE_2D()
+        ueye.is_AOI(
+            self.hCam,
+            ueye.IS_AOI_IMAGE_GET_POS_INC,
+            position_step,
+            ueye.sizeof(position_step),
+        )
+        ueye.is_AOI(
+            self.hCam, ueye.IS_AOI_IMAGE_GET_SIZE_INC, size_step, ueye.sizeof(size_step)
+        )
+        step = (
+            max(int(position_step.s32X), int(size_step.s32Width), 1),
+            max(int(position_step.s32Y), int(size_step.s32Height), 1),
+        )
+        super().__init__((int(sInfo.nMaxWidth), int(sInfo.nMaxHeight)), step)
+        self.bitspixel = 24  # for color mode: IS_CM_BGR8_PACKED
+        self.mem_ptr = None
+        self.mem_id = None
+        self.configure()
+
+    def _apply(self, rect, binning, subsampling):
+        if self.mem_ptr is not None:
+            ueye.is_StopLiveVideo(self.hCam, ueye.IS_WAIT)
+            ueye.is_FreeImageMem(self.hCam, self.mem_ptr, self.mem_id)
+            self.mem_ptr = None
+        modes = {
+            1: (ueye.IS_BINNING_DISABLE, ueye.IS_SUBSAMPLING_DISABLE),
+            2: (
+                ueye.IS_BINNING_2X_VERTICAL | ueye.IS_BINNING_2X_HORIZONTAL,
+                ueye.IS_SUBSAMPLING_2X_VERTICAL | ueye.IS_SUBSAMPLING_2X_HORIZONTAL,
+            ),
+            4: (
+                ueye.IS_BINNING_4X_VERTICAL | ueye.IS_BINNING_4X_HORIZONTAL,
+                ueye.IS_SUBSAMPLING_4X_VERTICAL | ueye.IS_SUBSAMPLING_4X_HORIZONTAL,
+            ),
+        }
+        ret = ueye.is_SetBinning(self.hCam, modes[binning][0])
+        if ret != ueye.IS_SUCCESS:
+            raise CameraError(f"Binning {binning} failed with error code: {ret}")
+        ret = ueye.is_SetSubSampling(self.hCam, modes[subsampling][1])
+        if ret != ueye.IS_SUCCESS:
+            raise CameraError(
+                f"Subsampling {subsampling} failed with error code: {ret}"
+            )
+        rectAOI = ueye.IS_RECT()
+        rectAOI.s32X = ueye.int(rect[0])
+        rectAOI.s32Y = ueye.int(rect[1])
+        rectAOI.s32Width = ueye.int(rect[2])
+        rectAOI.s32Height = ueye.int(rect[3])
+        ret = ueye.is_AOI(
+            self.hCam, ueye.IS_AOI_IMAGE_SET_AOI, rectAOI, ueye.sizeof(rectAOI)
+        )
+        if ret != ueye.IS_SUCCESS:
+            raise CameraError(f"Setting AOI {rect} failed with error code: {ret}")
+        # Allocate memory for the image
+        self.mem_ptr = ueye.c_mem_p()
+        self.mem_id = ueye.int()
+        ueye.is_AllocImageMem(
+            self.hCam, rect[2], rect[3], self.bitspixel, self.mem_ptr, self.mem_id
+        )
+        ueye.is_SetImageMem(self.hCam, self.mem_ptr, self.mem_id)
+        # Start video capture
+        ueye.is_CaptureVideo(self.hCam, ueye.IS_WAIT)
+
+    def _grab(self):
+        image_buffer = np.zeros(self.shape, dtype=np.uint8)
+        ret = ueye.is_FreezeVideo(self.hCam, ueye.IS_WAIT)
+        if ret != ueye.IS_SUCCESS:
+            raise CameraError(f"Frame capture failed: {ret}")
+        ueye.is_CopyImageMem(
+            self.hCam, self.mem_ptr, self.mem_id, image_buffer.ctypes.data
+        )
+        return image_buffer
+
+    def clear(self):
+        ueye.is_CaptureVideo(self.hCam, ueye.IS_DONT_WAIT)
+
+
+class SimulatedCamera(Camera):
+    """Replays images as a sensor, applying binning, subsampling and AOI.
+
+    Binning averages factor x factor pixel blocks, subsampling keeps every
+    factor-th pixel, as the sensor would. Each grab sleeps for readout seconds
+    scaled by the fraction of the sensor read out.
+    """
+
+    def __init__(self, frames=None, directory=SIMULATED_CAMERA_DIR, readout=0.0):
+        if frames is None:
+            paths = sorted(glob.glob(os.path.join(directory, "*.png")))
+            frames = [cv2.imread(path) for path in paths]
+        if not frames:
+            raise CameraError(f"No images to simulate a camera from in {directory}")
+        self.frames = frames
+        self.readout = readout
+        self._next = 0
+        height, width = frames[0].shape[:2]
+        super().__init__((width, height))
+        self.configure()
+
+    def _apply(self, rect, binning, subsampling):
+        self.binning, self.subsampling = binning, subsampling
+
+    def _grab(self):
+        frame = self.frames[self._next % len(self.frames)]
+        self._next += 1
+        if self.binning > 1:
+            factor = self.binning
+            frame = cv2.resize(
+                frame,
+                (frame.shape[1] // factor, frame.shape[0] // factor),
+                interpolation=cv2.INTER_AREA,
+            )
+        elif self.subsampling > 1:
+            frame = frame[:: self.subsampling, :: self.subsampling]
+        x, y, w, h = self.rect
+        if self.readout:
+            time.sleep(
+                self.readout * w * h / (self.sensor_size[0] * self.sensor_size[1])
+            )
+        return np.ascontiguousarray(frame[y : y + h, x : x + w])
+
+
+def open_camera():
+    if CAMERA == "simulated":
+        return SimulatedCamera(readout=SIMULATED_READOUT)
+    if ueye is None:
+        # Never stand in replayed images for a missing driver
+        raise CameraError("pyueye is not installed, set CAMERA=simulated to replay")
+    return UEyeCamera()
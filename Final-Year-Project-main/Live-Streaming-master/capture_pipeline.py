@@ -0,0 +1,139 @@
+import itertools
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+_DONE = object()
+# Quality scores are computed on frames downscaled by this factor
+QUALITY_SCALE = 0.5
+
+
+class PrefetchedFrames:
+    """Iterate frames from a source that is advanced on a background thread.
+
+    While the consumer analyses one frame the thread is already capturing the
+    next, up to depth frames ahead. close() stops the thread after the frame
+    it is capturing; frames it captured but nobody consumed are discarded.
+    """
+
+    def __init__(self, frames, depth=1):
+        self._frames = frames
+        self._queue = queue.Queue(maxsize=depth)
+        self._stop = threading.Event()
+        self._finished = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        try:
+            for frame in self._frames:
+                if self._stop.is_set() or not self._put((frame, None)):
+                    break
+        except Exception as e:
+            self._put((None, e))
+        finally:
+            close = getattr(self._frames, "close", None)
+            if close is not None:
+                close()
+            self._put((_DONE, None))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._finished:
+            raise StopIteration
+        frame, error = self._queue.get()
+        if error is not None:
+            self._finished = True
+            raise error
+        if frame is _DONE:
+            self._finished = True
+            raise StopIteration
+        return frame
+
+    def close(self):
+        self._finished = True
+        self._stop.set()
+        self._thread.join()
+
+
+def frame_sharpness(gray):
+    """Variance of the Laplacian; drops as motion or focus blur increases."""
+    return float(cv2.Laplacian(gray, cv2.CV_64F).var())
+
+
+def quality_gate(
+    frames, burst_frames, keep, min_sharpness_ratio=0.5, max_motion=8.0, stats=None
+):
+    """Yield the sharpest steady keep frames from each burst of burst_frames.
+
+    A frame is rejected when its sharpness is below min_sharpness_ratio of
+    the burst's sharpest frame, or when its median mean absolute difference
+    to the other frames of the burst exceeds max_motion grey levels. If too
+    few frames survive the sharpest rejected ones make up the count, so the
+    vote is never starved. Per-burst counts are appended to stats["bursts"].
+    """
+    frames = iter(frames)
+    try:
+        while True:
+            burst = list(itertools.islice(frames, burst_frames))
+            if not burst:
+                return
+            grays = [
+                cv2.resize(
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY),
+                    None,
+                    fx=QUALITY_SCALE,
+                    fy=QUALITY_SCALE,
+                    interpolation=cv2.INTER_AREA,
+                )
+                for frame in burst
+            ]
+            sharpness = [frame_sharpness(gray) for gray in grays]
+            differences = np.zeros((len(burst), len(burst)))
+            for i, j in itertools.combinations(range(len(burst)), 2):
+                differences[i, j] = differences[j, i] = np.mean(
+                    cv2.absdiff(grays[i], grays[j])
+                )
+            motion = [
+                float(np.median(np.delete(row, i))) if len(burst) > 1 else 0.0
+                for i, row in enumerate(differences)
+            ]
+            best = max(sharpness)
+            accepted = [
+                i
+                for i in range(len(burst))
+                if sharpness[i] >= min_sharpness_ratio * best
+                and motion[i] <= max_motion
+            ]
+            rejected = [i for i in range(len(burst)) if i not in accepted]
+            ranked = sorted(accepted, key=lambda i: -sharpness[i]) + sorted(
+                rejected, key=lambda i: -sharpness[i]
+            )
+            if stats is not None:
+                stats.setdefault("bursts", []).append(
+                    {
+                        "captured": len(burst),
+                        "rejected": len(rejected),
+                        "sharpness": [round(v, 1) for v in sharpness],
+                        "motion": [round(v, 2) for v in motion],
+                    }
+                )
+            for i in ranked[:keep]:
+                yield burst[i]
+    finally:
+        close = getattr(frames, "close", None)
+        if close is not None:
+            close()
@@ -0,0 +1,145 @@
+"""Compare detector/matcher combinations on stored master/frame pairs.
+
+Each case is a directory holding one master.* image and the frames captured
+for it, e.g. an archived model folder with its master copied in:
+
+    python compare_detectors.py D:/Rishabh_Images/MODEL-modbus --csv report.csv
+    python compare_detectors.py --master master.png --frames section_2_clear/*.png
+
+For every combination it reports how many frames aligned with at least
+--min-inliers RANSAC inliers, the mean milliseconds per frame spent in
+align_images, and the mean absolute grey-level error of the aligned frame
+against the master as an accuracy proxy.
+"""
+
+import argparse
+import csv
+import glob
+import os
+import time
+
+import cv2
+import numpy as np
+
+from feature_detectors import DETECTORS
+from feature_matching import MATCHERS
+from inspection import AlignmentError, align_images, vision_settings
+from master_features import compute_master_features
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+
+def load_case(directory):
+    images = sorted(
+        path
+        for path in glob.glob(os.path.join(directory, "*"))
+        if path.lower().endswith(IMAGE_EXTENSIONS)
+    )
+    masters = [p for p in images if os.path.basename(p).lower().startswith("master.")]
+    if not masters:
+        raise SystemExit(f"No master.* image in {directory}")
+    return masters[0], [p for p in images if p not in masters]
+
+
+def compare(master_path, frame_paths, detector, matcher, max_matches, min_inliers):
+    master = cv2.imread(master_path)
+    master_gray = cv2.cvtColor(master, cv2.COLOR_BGR2GRAY)
+    features = compute_master_features(master, detector=detector)
+    # Every frame gets a full alignment, not a reused homography or a screen
+    settings = vision_settings(
+        {
+            "detector": detector,
+            "matcher": matcher,
+            "max_matches": max_matches,
+            "reuse_homography": False,
+            "screen": False,
+        }
+    )
+    rows = []
+    for path in frame_paths:
+        frame = cv2.resize(cv2.imread(path), (master.shape[1], master.shape[0]))
+        stats = {}
+        start = time.perf_counter()
+        try:
+            aligned = align_images(master, frame, features, settings, stats)[1]
+        except AlignmentError:
+            aligned = None
+        elapsed = (time.perf_counter() - start) * 1000
+        inliers = stats.get("inliers", 0)
+        error = None
+        if aligned is not None:
+            aligned_gray = cv2.cvtColor(aligned, cv2.COLOR_BGR2GRAY)
+            error = float(np.mean(cv2.absdiff(master_gray, aligned_gray)))
+        rows.append(
+            {
+                "ok": aligned is not None and inliers >= min_inliers,
+                "ms": elapsed,
+                "inliers": inliers,
+                "error": error,
+            }
+        )
+    return rows
+
+
+def summarise(detector, matcher, rows):
+    aligned = [r for r in rows if r["ok"]]
+    return {
+        "detector": detector,
+        "matcher": matcher,
+        "frames": len(rows),
+        "aligned": len(aligned),
+        "success_rate": round(len(aligned) / len(rows), 3) if rows else 0.0,
+        "ms_per_frame": round(float(np.mean([r["ms"] for r in rows])), 1),
+        "mean_inliers": round(float(np.mean([r["inliers"] for r in rows])), 1),
+        "mean_error": (
+            round(float(np.mean([r["error"] for r in aligned])), 2) if aligned else None
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cases", nargs="*", help="directories with master.* + frames")
+    parser.add_argument("--master", help="master image for --frames")
+    parser.add_argument("--frames", nargs="*", default=[])
+    parser.add_argument("--detectors", nargs="+", default=list(DETECTORS))
+    parser.add_argument("--matchers", nargs="+", default=list(MATCHERS))
+    parser.add_argument("--max-matches", type=int, default=None)
+    parser.add_argument("--min-inliers", type=int, default=10)
+    parser.add_argument("--csv", help="also write the summary to this CSV file")
+    args = parser.parse_args()
+
+    cases = [load_case(d) for d in args.cases]
+    if args.master:
+        cases.append((args.master, args.frames))
+    if not cases:
+        parser.error("give at least one case directory or --master/--frames")
+
+    summary = []
+    for detector in args.detectors:
+        for matcher in args.matchers:
+            rows = []
+            for master_path, frame_paths in cases:
+                rows += compare(
+                    master_path,
+                    frame_paths,
+                    detector,
+                    matcher,
+                    args.max_matches,
+                    args.min_inliers,
+                )
+            summary.append(summarise(detector, matcher, rows))
+
+    columns = list(summary[0])
+    print("  ".join(f"{c:>12}" for c in columns))
+    for entry in summary:
+        print("  ".join(f"{str(entry[c]):>12}" for c in columns))
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Time the contour and SSIM inspection pipelines on the same frames.
+
+Cases are given as in compare_detectors.py:
+
+    python compare_pipelines.py D:/Rishabh_Images/MODEL-modbus --repeat 3
+    python compare_pipelines.py --master master.png --frames section_2_clear/*.png \
+        --reference diff_ref.png --ssim-scale 0.5
+
+Each pipeline sees the first --frames-per-run frames of a case, four by
+default since the SSIM pipeline compares at most four.
+"""
+
+import argparse
+import json
+
+import cv2
+import numpy as np
+
+from compare_detectors import load_case
+from pipelines import PIPELINES, run_pipeline
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("cases", nargs="*", help="directories with master.* + frames")
+    parser.add_argument("--master", help="master image for --frames")
+    parser.add_argument("--frames", nargs="*", default=[])
+    parser.add_argument("--pipelines", nargs="+", default=list(PIPELINES))
+    parser.add_argument("--frames-per-run", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--reference", default="diff_ref.png")
+    parser.add_argument("--ssim-scale", type=float, default=1.0)
+    parser.add_argument(
+        "--vision-configure", default="{}", help="JSON settings for the contour run"
+    )
+    args = parser.parse_args()
+
+    cases = [load_case(d) for d in args.cases]
+    if args.master:
+        cases.append((args.master, args.frames))
+    if not cases:
+        parser.error("give at least one case directory or --master/--frames")
+
+    options = json.loads(args.vision_configure)
+    options.update({"reference": args.reference, "ssim_scale": args.ssim_scale})
+    print(f"{'pipeline':>10}  {'runs':>6}  {'ms_mean':>10}  {'ms_min':>10}  results")
+    for name in args.pipelines:
+        times, results = [], []
+        for master_path, frame_paths in cases:
+            master = cv2.imread(master_path)
+            frames = [cv2.imread(p) for p in frame_paths[: args.frames_per_run]]
+            for _ in range(args.repeat):
+                result = run_pipeline(name, master, frames, options)
+                times.append(result["ms"])
+                results.append(str(result["res"]))
+        print(
+            f"{name:>10}  {len(times):>6}  {np.mean(times):>10.1f}  "
+            f"{np.min(times):>10.1f}  {','.join(results)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
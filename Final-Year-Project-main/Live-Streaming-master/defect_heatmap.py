@@ -0,0 +1,126 @@
+import glob
+import json
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from master_features import MASTER_STORE_DIR
+
+HOTSPOT_CELL = 16
+
+
+class DefectHeatmapStore:
+    """Per-model counts of how often each master pixel was part of a defect.
+
+    Counts live next to the model's stored master features, in
+    <model_id>/<photo_hash>/heatmap/counts.npy, as a uint32 array in master
+    coordinates that is memory-mapped and updated in place by every
+    inspection. meta.json holds the number of inspections added.
+    """
+
+    def __init__(self, root=MASTER_STORE_DIR):
+        self.root = root
+        self._lock = threading.Lock()
+
+    def path(self, model_id, key):
+        return os.path.join(self.root, str(model_id), key, "heatmap")
+
+    def find(self, model_id, key=None):
+        """Heatmap directory for key, or the most recently updated one."""
+        if key:
+            path = self.path(model_id, key)
+            return path if os.path.isdir(path) else None
+        paths = glob.glob(os.path.join(self.root, str(model_id), "*", "heatmap"))
+        if not paths:
+            return None
+        return max(paths, key=lambda p: os.path.getmtime(os.path.join(p, "meta.json")))
+
+    def add(self, model_id, key, mask):
+        """Count the non-zero pixels of one inspection's defect mask."""
+        path = self.path(model_id, key)
+        counts_path = os.path.join(path, "counts.npy")
+        meta_path = os.path.join(path, "meta.json")
+        with self._lock:
+            os.makedirs(path, exist_ok=True)
+            if os.path.exists(counts_path):
+                counts = np.load(counts_path, mmap_mode="r+")
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            else:
+                counts = np.lib.format.open_memmap(
+                    counts_path, mode="w+", dtype=np.uint32, shape=mask.shape[:2]
+                )
+                meta = {"inspections": 0, "shape": list(mask.shape[:2])}
+            if counts.shape != mask.shape[:2]:
+                raise ValueError(
+                    f"Heatmap is {counts.shape}, defect mask is {mask.shape[:2]}"
+                )
+            counts[mask > 0] += 1
+            counts.flush()
+            del counts
+            meta["inspections"] += 1
+            with open(meta_path, "w") as f:
+                json.dump(meta, f)
+        return meta["inspections"]
+
+    def load(self, model_id, key=None):
+        path = self.find(model_id, key)
+        if path is None:
+            return None, None
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        return np.load(os.path.join(path, "counts.npy"), mmap_mode="r"), meta
+
+    def image(self, model_id, key=None):
+        """Colour-mapped heatmap, brightest where defects are most frequent."""
+        counts, meta = self.load(model_id, key)
+        if counts is None:
+            return None
+        peak = max(int(counts.max()), 1)
+        scaled = (np.asarray(counts, dtype=np.float32) * (255.0 / peak)).astype(
+            np.uint8
+        )
+        return cv2.applyColorMap(scaled, cv2.COLORMAP_JET)
+
+    def hotspots(self, model_id, key=None, top=10, cell=HOTSPOT_CELL):
+        """The top cells of cell x cell pixels by defect count.
+
+        Regions are normalised [x, y, w, h] like vision_configure.roi; rate is
+        the mean fraction of inspections in which a pixel of the cell was
+        defective.
+        """
+        counts, meta = self.load(model_id, key)
+        if counts is None:
+            return None
+        height, width = counts.shape
+        rows, cols = -(-height // cell), -(-width // cell)
+        padded = np.zeros((rows * cell, cols * cell), dtype=np.uint64)
+        padded[:height, :width] = counts
+        sums = padded.reshape(rows, cell, cols, cell).sum(axis=(1, 3))
+        order = np.argsort(sums, axis=None)[::-1][:top]
+        inspections = max(meta["inspections"], 1)
+        spots = []
+        for index in order:
+            row, col = divmod(int(index), cols)
+            if sums[row, col] == 0:
+                break
+            x, y = col * cell, row * cell
+            w, h = min(cell, width - x), min(cell, height - y)
+            spots.append(
+                {
+                    "roi": [
+                        round(x / width, 4),
+                        round(y / height, 4),
+                        round(w / width, 4),
+                        round(h / height, 4),
+                    ],
+                    "count": int(sums[row, col]),
+                    "rate": round(float(sums[row, col]) / (w * h * inspections), 4),
+                }
+            )
+        return {"inspections": meta["inspections"], "hotspots": spots}
+
+
+defect_heatmaps = DefectHeatmapStore()
@@ -0,0 +1,30 @@
+import cv2
+
+DETECTOR = "sift"
+
+
+class DetectorSpec:
+    """A detector+descriptor pair and how its descriptors must be matched."""
+
+    def __init__(self, name, create, binary):
+        self.name = name
+        self.create = create
+        # Binary descriptors are compared with Hamming distance / LSH
+        self.binary = binary
+
+
+DETECTORS = {
+    "sift": DetectorSpec("sift", lambda: cv2.SIFT_create(nfeatures=10000), False),
+    "orb": DetectorSpec("orb", lambda: cv2.ORB_create(nfeatures=10000), True),
+    "akaze": DetectorSpec("akaze", lambda: cv2.AKAZE_create(), True),
+}
+
+
+def get_detector(name=DETECTOR):
+    if name not in DETECTORS:
+        raise ValueError(f"Unknown detector: {name}")
+    return DETECTORS[name]
+
+
+def detect_features(gray, detector=DETECTOR, mask=None):
+    return get_detector(detector).create().detectAndCompute(gray, mask)
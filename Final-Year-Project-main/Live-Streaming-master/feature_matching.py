@@ -0,0 +1,129 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from feature_detectors import get_detector
+
+MATCHER = "bf"
+# Cap on the best ratio-test matches handed to findHomography, None for all
+MAX_MATCHES = None
+RATIO = 0.75
+FLANN_INDEX_KDTREE = 1
+FLANN_TREES = 5
+FLANN_CHECKS = 50
+FLANN_INDEX_LSH = 6
+LSH_TABLES = 6
+LSH_KEY_SIZE = 12
+
+
+class BruteForceMatcher:
+    name = "bf"
+
+    def __init__(self, features):
+        self.master_descriptors = features.descriptors
+        self.norm = (
+            cv2.NORM_HAMMING if get_detector(features.detector).binary else cv2.NORM_L2
+        )
+
+    def match(self, descriptors):
+        raw_matches = cv2.BFMatcher(self.norm).knnMatch(
+            self.master_descriptors, descriptors, k=2
+        )
+        return ratio_test(raw_matches, master_is_query=True)
+
+
+class FlannMatcher:
+    """Index over the master descriptors, built once and queried per frame.
+
+    Float descriptors use a KD-tree, binary ones an LSH index.
+    """
+
+    name = "flann"
+
+    def __init__(self, features):
+        self.binary = get_detector(features.detector).binary
+        if self.binary:
+            index_params = dict(
+                algorithm=FLANN_INDEX_LSH,
+                table_number=LSH_TABLES,
+                key_size=LSH_KEY_SIZE,
+                multi_probe_level=1,
+            )
+        else:
+            index_params = dict(algorithm=FLANN_INDEX_KDTREE, trees=FLANN_TREES)
+        self._matcher = cv2.FlannBasedMatcher(index_params, dict(checks=FLANN_CHECKS))
+        self._matcher.add([self._prepare(features.descriptors)])
+        self._matcher.train()
+        self._lock = threading.Lock()
+
+    def _prepare(self, descriptors):
+        return np.asarray(descriptors, dtype=np.uint8 if self.binary else np.float32)
+
+    def match(self, descriptors):
+        with self._lock:
+            raw_matches = self._matcher.knnMatch(self._prepare(descriptors), k=2)
+        return ratio_test(raw_matches, master_is_query=False)
+
+
+MATCHERS = {
+    BruteForceMatcher.name: BruteForceMatcher,
+    FlannMatcher.name: FlannMatcher,
+}
+
+_matcher_lock = threading.Lock()
+
+
+def ratio_test(raw_matches, master_is_query):
+    """Lowe's ratio test; returns master indices, frame indices and distances."""
+    master_idx, frame_idx, distances = [], [], []
+    for pair in raw_matches:
+        if len(pair) < 2:
+            continue
+        m, n = pair
+        if m.distance < RATIO * n.distance:
+            if master_is_query:
+                master_idx.append(m.queryIdx)
+                frame_idx.append(m.trainIdx)
+            else:
+                master_idx.append(m.trainIdx)
+                frame_idx.append(m.queryIdx)
+            distances.append(m.distance)
+    return (
+        np.array(master_idx, dtype=np.int64),
+        np.array(frame_idx, dtype=np.int64),
+        np.array(distances, dtype=np.float32),
+    )
+
+
+def get_matcher(features, name=MATCHER):
+    if name not in MATCHERS:
+        raise ValueError(f"Unknown matcher: {name}")
+    matcher = features.matchers.get(name)
+    if matcher is None:
+        with _matcher_lock:
+            matcher = features.matchers.get(name)
+            if matcher is None:
+                matcher = MATCHERS[name](features)
+                features.matchers[name] = matcher
+    return matcher
+
+
+def match_features(
+    features, descriptors, matcher=MATCHER, max_matches=MAX_MATCHES, stats=None
+):
+    """Match frame descriptors against the master, best matches first."""
+    start = time.perf_counter()
+    master_idx, frame_idx, distances = get_matcher(features, matcher).match(descriptors)
+    if max_matches and len(distances) > max_matches:
+        keep = np.argpartition(distances, max_matches)[:max_matches]
+        order = keep[np.argsort(distances[keep], kind="stable")]
+    else:
+        order = np.argsort(distances, kind="stable")
+    if stats is not None:
+        stats["matcher"] = matcher
+        stats["good_matches"] = int(len(distances))
+        stats["used_matches"] = int(len(order))
+        stats["match_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return master_idx[order], frame_idx[order]
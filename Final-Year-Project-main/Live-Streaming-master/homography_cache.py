@@ -0,0 +1,59 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+HOMOGRAPHY_CACHE_SIZE = 32
+
+
+class HomographyCache:
+    """Last good frame-to-master homography per model and master variant.
+
+    Meters sit in a fixed jig under a fixed camera, so the previous
+    inspection's homography is usually a close starting point for the next
+    frame and only needs verifying, not re-estimating.
+    """
+
+    def __init__(self, max_size=HOMOGRAPHY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(features):
+        return (
+            features.model_id or features.key,
+            features.key,
+            features.detector,
+            features.roi and str(features.roi),
+        )
+
+    def get(self, features):
+        entry = self.key(features)
+        with self._lock:
+            H = self._entries.get(entry)
+            if H is not None:
+                self._entries.move_to_end(entry)
+            return H
+
+    def put(self, features, H):
+        entry = self.key(features)
+        with self._lock:
+            self._entries[entry] = np.array(H, dtype=np.float64)
+            self._entries.move_to_end(entry)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, features):
+        with self._lock:
+            self._entries.pop(self.key(features), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+homography_cache = HomographyCache()
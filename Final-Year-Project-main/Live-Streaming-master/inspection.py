@@ -0,0 +1,650 @@
+import logging
+import os
+import threading
+import cv2
+import numpy as np
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from artifact_sink import artifact_sink
+from master_features import (
+    hu_signatures,
+    master_cache,
+    normalize_roi,
+    roi_geometry,
+    roi_threshold,
+    scaled_size,
+)
+from feature_detectors import DETECTOR, detect_features
+from feature_matching import MATCHER, MAX_MATCHES, match_features
+from homography_cache import homography_cache
+
+logger = logging.getLogger(__name__)
+
+NO_FRAMES = 3
+# Worker processes analysing the frames of a vote in parallel, 0 for serial
+# analysis in the calling thread
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "0"))
+SHAPE_MATCH_THRESHOLD = 0.1
+# Captured contours compared against all master contours at a time
+SHAPE_MATCH_CHUNK = 256
+ECC_ITERATIONS = 20
+ECC_EPS = 1e-4
+# Per-model overrides come from the multimeter's vision_configure
+VISION_DEFAULTS = {
+    "detector": DETECTOR,
+    "matcher": MATCHER,
+    "max_matches": MAX_MATCHES,
+    # "full" runs detection at master resolution, "pyramid" estimates the
+    # homography pyramid_levels halvings down and upscales it
+    "alignment": "full",
+    "pyramid_levels": 2,
+    # ECC refinement of a pyramid homography: "auto" only when the upscaled
+    # RANSAC reprojection error exceeds refine_threshold pixels
+    "refine": "auto",
+    "refine_threshold": 1.5,
+    # Normalised [x, y, w, h] regions drawn on the master; frames are searched
+    # for features roi_margin beyond them to allow for fixture play
+    "roi": None,
+    "roi_margin": 0.05,
+    # Start from the model's last good homography and keep it when a coarse
+    # ECC check at reuse_scale reaches reuse_min_cc; feature matching only
+    # runs when the check fails
+    "reuse_homography": True,
+    "reuse_scale": 0.25,
+    "reuse_min_cc": 0.7,
+    # "early" stops analysing frames once the vote can no longer change,
+    # "all" analyses every frame of the window
+    "voting": "early",
+    # Frames the vote may grow to, two at a time, when the frames of the
+    # decided window disagree or are operator dependent
+    "max_frames": NO_FRAMES,
+    # Pass a frame without contour analysis when, under the model's last
+    # verified homography, no master mark missing from it is larger than
+    # screen_max_area pixels (clean_image's own minimum blob size)
+    "screen": True,
+    "screen_max_area": 30,
+    # Capture bursts of burst_frames and analyse only the NO_FRAMES sharpest
+    # steady ones of each, see capture_pipeline.quality_gate; 0 disables
+    "burst_frames": 0,
+    "min_sharpness_ratio": 0.5,
+    "max_motion": 8.0,
+    # Sensor readout for the model, see camera.Camera.configure: a normalised
+    # [x, y, w, h] AOI of the full sensor (None for all of it) and a binning
+    # or subsampling factor of 1, 2 or 4. The master must be captured with
+    # the same readout
+    "aoi": None,
+    "binning": 1,
+    "subsampling": 1,
+}
+
+
+class ImageProcessingError(Exception):
+    pass
+
+
+class AlignmentError(Exception):
+    pass
+
+
+def vision_settings(vision_configure=None):
+    settings = dict(VISION_DEFAULTS)
+    for key, value in (vision_configure or {}).items():
+        if value not in (None, ""):
+            settings[key] = value
+    if settings["max_matches"] is not None:
+        settings["max_matches"] = int(settings["max_matches"])
+    settings["pyramid_levels"] = int(settings["pyramid_levels"])
+    settings["refine_threshold"] = float(settings["refine_threshold"])
+    settings["roi"] = normalize_roi(settings["roi"])
+    settings["roi_margin"] = float(settings["roi_margin"])
+    settings["reuse_homography"] = str(settings["reuse_homography"]).lower() not in (
+        "false",
+        "0",
+        "no",
+    )
+    settings["reuse_scale"] = float(settings["reuse_scale"])
+    settings["reuse_min_cc"] = float(settings["reuse_min_cc"])
+    settings["max_frames"] = max(int(settings["max_frames"]), NO_FRAMES)
+    settings["screen"] = str(settings["screen"]).lower() not in ("false", "0", "no")
+    settings["screen_max_area"] = int(settings["screen_max_area"])
+    settings["burst_frames"] = int(settings["burst_frames"])
+    settings["min_sharpness_ratio"] = float(settings["min_sharpness_ratio"])
+    settings["max_motion"] = float(settings["max_motion"])
+    if settings["aoi"] is not None:
+        settings["aoi"] = tuple(float(v) for v in settings["aoi"])
+    settings["binning"] = int(settings["binning"])
+    settings["subsampling"] = int(settings["subsampling"])
+    return settings
+
+
+def get_master_features(master, settings, key=None, model_id=None):
+    return master_cache.get(
+        master, key, model_id, settings["detector"], roi=settings["roi"]
+    )
+
+
+def preprocess_image(image):
+    # Convert to grayscale
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return gray
+
+
+def estimate_homography(features, gray, settings, stats):
+    """Homography mapping gray onto the master, plus its RMS reprojection error."""
+    start = time.perf_counter()
+    offset = (0, 0)
+    if features.roi:
+        (x, y, w, h), _ = roi_geometry(gray.shape, features.roi, settings["roi_margin"])
+        gray = gray[y : y + h, x : x + w]
+        offset = (x, y)
+    keypoints, descriptors = detect_features(gray, features.detector)
+    stats["detector"] = features.detector
+    stats["keypoints"] = len(keypoints)
+    stats["detect_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    master_idx, frame_idx = match_features(
+        features,
+        descriptors,
+        settings["matcher"],
+        settings["max_matches"],
+        stats,
+    )
+    if len(master_idx) < 4:
+        raise AlignmentError("Not enough good matches")
+    start = time.perf_counter()
+    pts1 = np.float32(features.points[master_idx]).reshape(-1, 1, 2)
+    pts2 = (np.float32([keypoints[i].pt for i in frame_idx]) + offset).reshape(-1, 1, 2)
+    H, mask = cv2.findHomography(pts2, pts1, cv2.RANSAC, 2.0)
+    if H is None:
+        raise AlignmentError("Homography estimation failed")
+    inliers = mask.ravel().astype(bool)
+    projected = cv2.perspectiveTransform(pts2[inliers], H)
+    error = float(np.sqrt(np.mean(np.sum((projected - pts1[inliers]) ** 2, axis=2))))
+    stats["inliers"] = int(inliers.sum())
+    stats["homography_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return H, error
+
+
+def refine_homography(master_gray, gray, H, stats):
+    """A few ECC iterations at full resolution starting from H."""
+    start = time.perf_counter()
+    warp = np.linalg.inv(H).astype(np.float32)
+    warp /= warp[2, 2]
+    criteria = (
+        cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT,
+        ECC_ITERATIONS,
+        ECC_EPS,
+    )
+    try:
+        _, warp = cv2.findTransformECC(
+            np.asarray(master_gray),
+            gray,
+            warp,
+            cv2.MOTION_HOMOGRAPHY,
+            criteria,
+            None,
+            5,
+        )
+        H = np.linalg.inv(warp)
+        stats["refined"] = True
+    except cv2.error:
+        # ECC did not converge, keep the upscaled estimate
+        stats["refined"] = False
+    stats["refine_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return H
+
+
+def pyramid_homography(master, features, gray, settings, stats):
+    scale = 0.5 ** settings["pyramid_levels"]
+    coarse = master_cache.get(
+        master, features.key, features.model_id, features.detector, scale, features.roi
+    )
+    small = cv2.resize(
+        gray, scaled_size(gray.shape, scale), interpolation=cv2.INTER_AREA
+    )
+    H, error = estimate_homography(coarse, small, settings, stats)
+    S = np.diag([scale, scale, 1.0])
+    H = np.linalg.inv(S) @ H @ S
+    error /= scale
+    stats["scale"] = scale
+    stats["reprojection_px"] = round(error, 2)
+    if settings["refine"] == "ecc" or (
+        settings["refine"] == "auto" and error > settings["refine_threshold"]
+    ):
+        H = refine_homography(features.gray, gray, H, stats)
+    return H
+
+
+def verify_homography(features, gray, H, settings, stats):
+    """H when it still aligns gray with the master, judged by a coarse ECC score."""
+    start = time.perf_counter()
+    scale = settings["reuse_scale"]
+    size = scaled_size(gray.shape, scale)
+    master_small = cv2.resize(
+        np.asarray(features.gray), size, interpolation=cv2.INTER_AREA
+    )
+    small = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    S = np.diag([scale, scale, 1.0])
+    aligned_small = cv2.warpPerspective(small, S @ H @ np.linalg.inv(S), size)
+    mask = None
+    if features.roi_box is not None:
+        x, y, w, h = features.roi_box
+        mask = np.zeros(gray.shape, dtype=np.uint8)
+        mask[y : y + h, x : x + w] = features.roi_mask
+        mask = cv2.resize(mask, size, interpolation=cv2.INTER_NEAREST)
+    cc = cv2.computeECC(master_small, aligned_small, mask)
+    stats["reuse_cc"] = round(float(cc), 3)
+    stats["reuse_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return H if cc >= settings["reuse_min_cc"] else None
+
+
+def align_images(master, input, features=None, settings=None, stats=None):
+    try:
+        if settings is None:
+            settings = vision_settings()
+        if features is None:
+            features = get_master_features(master, settings)
+        if stats is None:
+            stats = {}
+        input_preprocessed = preprocess_image(input)
+        stats["alignment"] = settings["alignment"]
+        H = None
+        if settings["reuse_homography"]:
+            cached = homography_cache.get(features)
+            if cached is not None:
+                H = verify_homography(
+                    features, input_preprocessed, cached, settings, stats
+                )
+        if H is not None:
+            stats["homography"] = "reused"
+        elif settings["alignment"] == "pyramid":
+            H = pyramid_homography(
+                master, features, input_preprocessed, settings, stats
+            )
+            stats["homography"] = "estimated"
+        else:
+            H, error = estimate_homography(
+                features, input_preprocessed, settings, stats
+            )
+            stats["reprojection_px"] = round(error, 2)
+            stats["homography"] = "estimated"
+        if settings["reuse_homography"]:
+            homography_cache.put(features, H)
+        aligned_image = cv2.warpPerspective(
+            input, H, (master.shape[1], master.shape[0])
+        )
+
+        aligned_image_gray = cv2.cvtColor(aligned_image, cv2.COLOR_BGR2GRAY)
+        absolute = cv2.absdiff(features.gray, aligned_image_gray)
+        aligned_thresh = roi_threshold(
+            aligned_image_gray,
+            cv2.THRESH_BINARY_INV,
+            features.roi_box,
+            features.roi_mask,
+        )
+        result = cv2.bitwise_or(features.mask_master, aligned_thresh)
+        result = roi_threshold(
+            result, cv2.THRESH_BINARY, features.roi_box, features.roi_mask
+        )
+
+        return (
+            result,
+            aligned_image,
+            features.master_cont,
+            features.master_thresh,
+            absolute,
+        )
+    except Exception as e:
+        raise AlignmentError(f"Image alignment failed: {str(e)}")
+
+
+def clean_image(image):
+    num_labels, labels, stats, _ = cv2.connectedComponentsWithStats(image)
+    min_size_threshold = 30
+    height_threshold = 1000
+    width_threshold = 2
+
+    # Extents as max - min of the component's pixel coordinates
+    sizes = stats[:, cv2.CC_STAT_AREA]
+    width = stats[:, cv2.CC_STAT_WIDTH] - 1
+    height = stats[:, cv2.CC_STAT_HEIGHT] - 1
+    excluded = ((width < width_threshold) & (height < height_threshold)) | (
+        (height < width_threshold) & (width < height_threshold)
+    )
+    valid = (sizes > min_size_threshold) & ~excluded
+    valid[0] = False  # Background
+
+    # Single lookup-table remap of labels to the single channel output image
+    lut = np.where(valid, 255, 0).astype(np.uint8)
+    return lut[labels]
+
+
+def match_contours(contours, features):
+    """Which contours have a master contour within SHAPE_MATCH_THRESHOLD.
+
+    Same distance as cv2.matchShapes(contour, master_contour, 1, 0.0), computed
+    for all pairs at once from the master's precomputed Hu moments.
+    """
+    matched = np.zeros(len(contours), dtype=bool)
+    master_values, master_valid = features.master_hu
+    if not len(contours) or not len(master_values):
+        return matched
+    values, valid = hu_signatures(contours)
+    master_any = master_valid.any(axis=1)
+    for start in range(0, len(contours), SHAPE_MATCH_CHUNK):
+        end = start + SHAPE_MATCH_CHUNK
+        both = valid[start:end, None] & master_valid[None]
+        distances = np.where(
+            both, np.abs(values[start:end, None] - master_values[None]), 0.0
+        ).sum(axis=2)
+        # matchShapes returns DBL_MAX when only one side has usable moments
+        distances[valid[start:end].any(axis=1)[:, None] != master_any[None]] = np.inf
+        matched[start:end] = (distances < SHAPE_MATCH_THRESHOLD).any(axis=1)
+    return matched
+
+
+def vote_decided(classes, window, early):
+    """Whether the pass vote over a window of frames can no longer change."""
+    passes, analysed = classes.count(1), len(classes)
+    needed = window // 2 + 1
+    if early:
+        return passes >= needed or passes + (window - analysed) < needed
+    return analysed >= window
+
+
+def frames_to_decide(classes, window, early):
+    """Fewest further frames whose results could decide the vote."""
+    passes, analysed = classes.count(1), len(classes)
+    remaining = window - analysed
+    if not early:
+        return remaining
+    needed = window // 2 + 1
+    return max(1, min(needed - passes, remaining - (needed - passes) + 1))
+
+
+def screen_frame(features, input, settings, stats):
+    """Whether input clearly passes under the model's last homography.
+
+    Mirrors the pass test of the full analysis on the grey frame alone: the
+    master marks missing from the aligned frame are exactly the pixels
+    find_defect's thresholded difference keeps, so when none of their blobs
+    is larger than clean_image would drop, the frame has no contours.
+    """
+    H = homography_cache.get(features) if settings["reuse_homography"] else None
+    if H is None:
+        return False
+    gray = preprocess_image(input)
+    if verify_homography(features, gray, H, settings, stats) is None:
+        return False
+    start = time.perf_counter()
+    height, width = features.shape
+    aligned = cv2.warpPerspective(gray, H, (width, height))
+    bright = roi_threshold(
+        aligned, cv2.THRESH_BINARY, features.roi_box, features.roi_mask
+    )
+    missing = cv2.bitwise_and(np.asarray(features.master_thresh), bright)
+    component_stats = cv2.connectedComponentsWithStats(missing)[2]
+    largest = int(component_stats[1:, cv2.CC_STAT_AREA].max(initial=0))
+    passed = largest <= settings["screen_max_area"]
+    stats["screen"] = "pass" if passed else "ambiguous"
+    stats["screen_largest_px"] = largest
+    stats["screen_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    if passed:
+        stats["homography"] = "reused"
+    return passed
+
+
+def analyse_frame(master, frame, features, settings, stats, inspection_id=None, i=0):
+    """Align one frame and count its unexplained and master-like contours."""
+    debug = inspection_id is not None
+    input = cv2.resize(frame, (master.shape[1], master.shape[0]))
+    if settings["screen"] and screen_frame(features, input, settings, stats):
+        return 0, 0, np.zeros(master.shape[:2], dtype=np.uint8)
+    difference, aligned_image, mask_contours, mask_master, absolute = align_images(
+        master, input, features, settings, stats
+    )
+    if debug:
+        master_copy = master.copy()
+        cv2.drawContours(master_copy, mask_contours, -1, (0, 255, 0), 3)
+        artifact_sink.put(inspection_id, f"master{i}", master_copy)
+    logger.debug("Frame %d: %d master contours", i, len(mask_contours))
+    thresholded_diff = roi_threshold(
+        difference,
+        cv2.THRESH_BINARY_INV,
+        features.roi_box,
+        features.roi_mask,
+    )
+    if debug:
+        artifact_sink.put(inspection_id, f"diff{i}", thresholded_diff)
+    if features.roi_box is None:
+        cleaned_diff = clean_image(thresholded_diff)
+        cnt, _ = cv2.findContours(
+            cleaned_diff, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+    else:
+        # Everything outside the ROI box is already zero
+        x, y, w, h = features.roi_box
+        cleaned_roi = clean_image(thresholded_diff[y : y + h, x : x + w])
+        cleaned_diff = np.zeros_like(thresholded_diff)
+        cleaned_diff[y : y + h, x : x + w] = cleaned_roi
+        cnt, _ = cv2.findContours(
+            cleaned_roi,
+            cv2.RETR_EXTERNAL,
+            cv2.CHAIN_APPROX_SIMPLE,
+            offset=(x, y),
+        )
+    matched = match_contours(cnt, features)
+    counter = int(matched.sum())
+    if debug:
+        copy = aligned_image.copy()
+        cv2.drawContours(
+            copy, [c for c, m in zip(cnt, matched) if m], -1, (0, 255, 0), 3
+        )
+        artifact_sink.put(inspection_id, f"red{i}", copy)
+    return len(cnt), counter, cleaned_diff
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_analysis_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=ANALYSIS_WORKERS)
+    return _pool
+
+
+def share_array(array):
+    """Copy array into a new shared memory block; the caller unlinks it."""
+    array = np.ascontiguousarray(array)
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+    return block, (block.name, array.shape, array.dtype.str)
+
+
+def attach_array(ref):
+    block = shared_memory.SharedMemory(name=ref[0])
+    return block, np.ndarray(ref[1], np.dtype(ref[2]), buffer=block.buf)
+
+
+def _analyse_shared(master_ref, frame_ref, key, model_id, settings, inspection_id, i):
+    """Pool worker: analyse a frame held in shared memory.
+
+    Master features come from this process's master_cache, which is filled
+    from the memory-mapped master store after the first frame.
+    """
+    master_block, shared_master = attach_array(master_ref)
+    frame_block, shared_frame = attach_array(frame_ref)
+    # Take private copies at master resolution so the blocks can be closed
+    # before any analysis error holds references to them
+    master = shared_master.copy()
+    frame = cv2.resize(shared_frame, (master.shape[1], master.shape[0]))
+    del shared_master, shared_frame
+    master_block.close()
+    frame_block.close()
+    features = get_master_features(master, settings, key, model_id)
+    stats = {}
+    result = analyse_frame(master, frame, features, settings, stats, inspection_id, i)
+    return result, stats
+
+
+def submit_frame(master, frame, features, settings, inspection_id, i, blocks):
+    """Start analysing one frame; returns a callable giving (result, stats).
+
+    Without ANALYSIS_WORKERS the frame is analysed right away. Otherwise it
+    is queued on the process pool and the shared memory blocks it uses are
+    appended to blocks for the caller to release.
+    """
+    if ANALYSIS_WORKERS <= 0:
+        stats = {}
+        result = analyse_frame(
+            master, frame, features, settings, stats, inspection_id, i
+        )
+        return lambda: (result, stats)
+    if not blocks:
+        blocks.append(share_array(master))
+    master_ref = blocks[0][1]
+    blocks.append(share_array(frame))
+    future = get_analysis_pool().submit(
+        _analyse_shared,
+        master_ref,
+        blocks[-1][1],
+        features.key,
+        features.model_id,
+        settings,
+        inspection_id,
+        i,
+    )
+    return future.result
+
+
+def release_blocks(blocks):
+    for block, _ in blocks:
+        block.close()
+        try:
+            block.unlink()
+        except FileNotFoundError:
+            pass
+    blocks.clear()
+
+
+def find_defect(
+    master,
+    images,
+    model_name,
+    features=None,
+    settings=None,
+    inspection_id=None,
+    on_frame=None,
+):
+    """Vote over frames taken from images, an iterable of BGR frames or paths.
+
+    Each frame is analysed as soon as it is taken and its result folded into
+    the vote, and frames are only taken while the vote could still need
+    them, so images may be a generator capturing them on demand. With
+    ANALYSIS_WORKERS set, frames that could decide the vote together are
+    analysed in parallel. Debug images go to artifact_sink under
+    inspection_id when it is enabled. on_frame, if given, is called with each
+    frame's verdict and stats as it is folded into the vote.
+    """
+    blocks = []
+    try:
+        if settings is None:
+            settings = vision_settings()
+        if features is None:
+            features = get_master_features(master, settings)
+        report = {"frames": []}
+        if artifact_sink.enabled:
+            inspection_id = inspection_id or artifact_sink.new_inspection(model_name)
+            report["artifacts"] = inspection_id
+        else:
+            inspection_id = None
+        early = settings["voting"] == "early"
+        window = NO_FRAMES
+        images = iter(images)
+        frames = []
+        pending = []
+        classes = []
+        differences = []
+        contours_no = []
+        mapping = []
+        operator_dependent = False
+        while True:
+            while len(pending) < frames_to_decide(classes, window, early):
+                frame = next(images, None)
+                if frame is None:
+                    break
+                if isinstance(frame, str):
+                    frame = cv2.imread(frame)
+                pending.append(
+                    submit_frame(
+                        master,
+                        frame,
+                        features,
+                        settings,
+                        inspection_id,
+                        len(frames),
+                        blocks,
+                    )
+                )
+                frames.append(frame)
+            if not pending:
+                break
+            (contours, counter, cleaned_diff), stats = pending.pop(0)()
+            report["frames"].append(stats)
+            contours_no.append(contours)
+            mapping.append(counter)
+            differences.append(cleaned_diff)
+            classes.append(1 if contours == 0 and counter == 0 else 0)
+            if contours > 0 and counter == 0:
+                operator_dependent = True
+            if on_frame is not None:
+                on_frame(
+                    {
+                        "frame": len(classes) - 1,
+                        "verdict": "pass" if classes[-1] else "fail",
+                        "contours": contours,
+                        "matched": counter,
+                        **stats,
+                    }
+                )
+            if vote_decided(classes, window, early):
+                disagree = 0 < classes.count(1) < len(classes)
+                if (disagree or operator_dependent) and window < settings["max_frames"]:
+                    window = min(window + 2, settings["max_frames"])
+                else:
+                    break
+        report["frames_analysed"] = len(classes)
+        report["frames_window"] = window
+        logger.debug(
+            "Votes %s, contours %s, matched %s, report %s",
+            classes,
+            contours_no,
+            mapping,
+            report,
+        )
+        max_idx = contours_no.index(max(contours_no))
+        if classes.count(1) >= window // 2 + 1:
+            if inspection_id:
+                artifact_sink.put(
+                    inspection_id, "difference_correct", differences[max_idx]
+                )
+            diff_cirr = cv2.cvtColor(differences[max_idx], cv2.COLOR_GRAY2BGR)
+            return frames[max_idx], diff_cirr, "pass", operator_dependent, report
+        if inspection_id:
+            artifact_sink.put(
+                inspection_id, "different_incorrect", differences[max_idx]
+            )
+        diff = cv2.cvtColor(differences[max_idx], cv2.COLOR_GRAY2BGR)
+        return frames[max_idx], diff, "fail", operator_dependent, report
+    except Exception as e:
+        raise ImageProcessingError(f"Defect detection failed: {str(e)}")
+    finally:
+        # Stop a capturing generator or prefetcher the vote no longer needs
+        close = getattr(images, "close", None)
+        if close is not None:
+            close()
+        release_blocks(blocks)
@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Seconds a finished job's result stays available
+JOB_TTL = float(os.getenv("JOB_TTL", "600"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+KEEPALIVE = 15.0
+TERMINAL = ("done", "failed")
+
+
+class InspectionJob:
+    """One inspection run in the background, with the events it produced.
+
+    Events are kept, so a client that subscribes late still sees every
+    frame verdict before the result.
+    """
+
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self._cond = threading.Condition()
+
+    def publish(self, event, data):
+        with self._cond:
+            self.events.append((event, data))
+            self._cond.notify_all()
+
+    def set_status(self, status):
+        self.status = status
+        if status in TERMINAL:
+            self.finished = time.time()
+        self.publish("status", {"status": status})
+
+    def summary(self):
+        summary = {"job_id": self.id, "status": self.status, "created": self.created}
+        frames = [data for event, data in self.events if event == "frame"]
+        summary["frames"] = frames
+        if self.result is not None:
+            summary["result"] = self.result
+        if self.error is not None:
+            summary["error"] = self.error
+        return summary
+
+    def stream(self):
+        """Server-sent events from the first one until the job finishes."""
+        sent = 0
+        while True:
+            with self._cond:
+                if sent == len(self.events) and self.status not in TERMINAL:
+                    self._cond.wait(KEEPALIVE)
+                events = self.events[sent:]
+                finished = self.status in TERMINAL
+            if not events and not finished:
+                yield ": keepalive\n\n"
+                continue
+            for event, data in events:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+            sent += len(events)
+            if finished and sent == len(self.events):
+                return
+
+
+class InspectionJobs:
+    """Run inspections as jobs and keep them for polling until JOB_TTL.
+
+    submit(run) returns at once; run(on_frame) is called on a worker thread
+    and its return value becomes the job's result. error_status maps an
+    exception to the (message, HTTP status) the synchronous endpoint would
+    have answered with.
+    """
+
+    def __init__(self, error_status, workers=JOB_WORKERS, ttl=JOB_TTL):
+        self.error_status = error_status
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(self, run):
+        job = InspectionJob()
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+        job.publish("status", {"status": job.status})
+        self._executor.submit(self._run, job, run)
+        return job
+
+    def active(self):
+        with self._lock:
+            return sum(job.status not in TERMINAL for job in self._jobs.values())
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, run):
+        job.set_status("running")
+        try:
+            job.result = run(lambda frame: job.publish("frame", frame))
+            job.publish("result", job.result)
+            job.set_status("done")
+        except Exception as e:
+            message, status = self.error_status(e)
+            job.error = {"error": message, "status": status}
+            job.publish("error", job.error)
+            job.set_status("failed")
+
+    def _prune(self):
+        now = time.time()
+        expired = [
+            job_id
+            for job_id, job in self._jobs.items()
+            if job.finished is not None and now - job.finished > self.ttl
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,125 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Inspections that may capture and analyse at the same time, and how many
+# more may wait for a turn before new ones are turned away
+MAX_CONCURRENT_INSPECTIONS = int(os.getenv("MAX_CONCURRENT_INSPECTIONS", "1"))
+INSPECTION_QUEUE_SIZE = int(os.getenv("INSPECTION_QUEUE_SIZE", "4"))
+# Seconds a queued inspection waits for its turn before giving up
+INSPECTION_QUEUE_TIMEOUT = float(os.getenv("INSPECTION_QUEUE_TIMEOUT", "60"))
+
+
+class SchedulerFull(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+
+class InspectionScheduler:
+    """Admission control for inspections.
+
+    At most concurrency inspections run at once; up to max_queue more wait
+    for a turn in arrival order, and any beyond that are rejected at once
+    instead of piling up frames in memory. Queue position and wait time are
+    reported for admitted inspections, and rejections carry a retry estimate
+    from the recent inspection durations.
+    """
+
+    def __init__(
+        self,
+        concurrency=MAX_CONCURRENT_INSPECTIONS,
+        max_queue=INSPECTION_QUEUE_SIZE,
+        timeout=INSPECTION_QUEUE_TIMEOUT,
+    ):
+        self.concurrency = max(1, concurrency)
+        self.max_queue = max(0, max_queue)
+        self.timeout = timeout
+        self.completed = 0
+        self.rejected = 0
+        self._running = 0
+        self._waiting = deque()
+        self._durations = deque(maxlen=20)
+        self._cond = threading.Condition()
+
+    def _mean_duration(self):
+        return sum(self._durations) / len(self._durations) if self._durations else 1.0
+
+    @property
+    def capacity(self):
+        """Inspections that can be running or waiting at once."""
+        return self.concurrency + self.max_queue
+
+    def retry_after(self):
+        """Seconds until a slot is likely to be free."""
+        turns = (len(self._waiting) + 1) / self.concurrency
+        return max(1, math.ceil(turns * self._mean_duration()))
+
+    def status(self):
+        with self._cond:
+            return {
+                "running": self._running,
+                "waiting": len(self._waiting),
+                "concurrency": self.concurrency,
+                "max_queue": self.max_queue,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "mean_ms": round(self._mean_duration() * 1000, 1),
+                "retry_after": self.retry_after(),
+            }
+
+    def reject(self, message):
+        # _cond's lock is re-entrant, so admit() can reject while holding it
+        with self._cond:
+            self.rejected += 1
+            status = {
+                "running": self._running,
+                "waiting": len(self._waiting),
+                "retry_after": self.retry_after(),
+            }
+        return SchedulerFull(message, status)
+
+    @contextmanager
+    def admit(self, inspection=True):
+        """Hold a slot for one inspection; raises SchedulerFull when saturated.
+
+        Other uses of the camera, such as changing its readout format, pass
+        inspection=False to wait for a slot without counting as inspections.
+        """
+        arrived = time.monotonic()
+        with self._cond:
+            position = len(self._waiting)
+            if self._running >= self.concurrency or self._waiting:
+                if position >= self.max_queue:
+                    raise self.reject("Inspection queue is full")
+                ticket = object()
+                self._waiting.append(ticket)
+                deadline = arrived + self.timeout
+                while self._waiting[0] is not ticket or (
+                    self._running >= self.concurrency
+                ):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        self._cond.notify_all()
+                        raise self.reject("Timed out waiting for an inspection slot")
+                    self._cond.wait(remaining)
+                self._waiting.popleft()
+                self._cond.notify_all()
+            self._running += 1
+        started = time.monotonic()
+        try:
+            yield {
+                "queue_position": position,
+                "queue_wait_ms": round((started - arrived) * 1000, 1),
+            }
+        finally:
+            with self._cond:
+                self._running -= 1
+                if inspection:
+                    self.completed += 1
+                    self._durations.append(time.monotonic() - started)
+                self._cond.notify_all()
@@ -0,0 +1,325 @@
+"""Inspection jobs queued in MongoDB and analysed by stateless workers.
+
+The station that owns the camera captures the frames and enqueues them with
+the model's master; workers on this or any other PC claim jobs atomically,
+run find_defect and write the result back:
+
+    python job_queue.py --workers 4
+
+Set MONGO_URI as for the backend. A claimed job's worker heartbeats every
+JOB_HEARTBEAT seconds; a job whose heartbeat is older than JOB_LEASE is
+claimed again by another worker, up to JOB_MAX_ATTEMPTS times. Frames are
+stored in the job as PNG, or when JOB_FRAME_DIR names a directory every
+worker can read, as paths to PNGs written there.
+
+A job is deleted, with its frame files, once the station has read its
+result. When the station stops waiting first, the job is marked cancelled
+and deleted by whoever ends it; JOB_EXPIRE removes jobs of stations that
+went away altogether.
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import cv2
+import numpy as np
+
+try:
+    from pymongo import MongoClient, ReturnDocument
+except ImportError:  # only needed with JOB_QUEUE=mongo or for the workers
+    MongoClient = ReturnDocument = None
+
+from inspection import (
+    ImageProcessingError,
+    find_defect,
+    get_master_features,
+    vision_settings,
+)
+from master_features import photo_hash
+
+JOB_COLLECTION = "InspectionJob"
+JOB_HEARTBEAT = float(os.getenv("JOB_HEARTBEAT", "2"))
+JOB_LEASE = float(os.getenv("JOB_LEASE", "10"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_FRAME_DIR = os.getenv("JOB_FRAME_DIR")
+# Seconds the station waits for a worker to finish a job
+JOB_WAIT_TIMEOUT = float(os.getenv("JOB_WAIT_TIMEOUT", "120"))
+# Seconds after which MongoDB deletes any job left behind
+JOB_EXPIRE = int(os.getenv("JOB_EXPIRE", "3600"))
+JOB_POLL_INTERVAL = 0.05
+# Seconds an idle worker sleeps between claim attempts
+JOB_IDLE_WAIT = 0.2
+# MongoDB documents are limited to 16 MB
+MAX_JOB_BYTES = 15 * 1024 * 1024
+
+
+def encode_png(image):
+    ok, buffer = cv2.imencode(".png", image)
+    if not ok:
+        raise ImageProcessingError("Could not encode image as PNG")
+    return buffer.tobytes()
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
+def remove_frames(job):
+    """Delete the frame files of a job stored under JOB_FRAME_DIR."""
+    for frame in job.get("frames", []):
+        if "path" in frame and os.path.exists(frame["path"]):
+            os.remove(frame["path"])
+
+
+def job_collection(uri=None):
+    if MongoClient is None:
+        raise ImportError("pymongo is required for the MongoDB job queue")
+    return MongoClient(uri or os.getenv("MONGO_URI"))["Project"][JOB_COLLECTION]
+
+
+class MongoJobQueue:
+    def __init__(self, collection, frame_dir=JOB_FRAME_DIR):
+        self.collection = collection
+        self.frame_dir = frame_dir
+        self.collection.create_index([("status", 1), ("created_at", 1)])
+        self.collection.create_index("created_at", expireAfterSeconds=JOB_EXPIRE)
+
+    def enqueue(self, master_data, frames, model_name, model_id=None, vision=None):
+        """Queue the analysis of captured frames; returns the job id."""
+        job_id = uuid.uuid4().hex
+        stored = []
+        for i, frame in enumerate(frames):
+            if self.frame_dir:
+                path = os.path.join(self.frame_dir, f"{job_id}-{i}.png")
+                if not cv2.imwrite(path, frame):
+                    raise ImageProcessingError(f"Could not write frame to {path}")
+                stored.append({"path": path})
+            else:
+                stored.append({"png": encode_png(frame)})
+        size = len(master_data) + sum(len(f.get("png", b"")) for f in stored)
+        if size > MAX_JOB_BYTES:
+            raise ImageProcessingError(
+                f"Job of {size} bytes is too large, set JOB_FRAME_DIR"
+            )
+        self.collection.insert_one(
+            {
+                "_id": job_id,
+                "status": "queued",
+                "model_name": model_name,
+                "model_id": model_id,
+                "vision_configure": vision,
+                "master": master_data,
+                "frames": stored,
+                "attempts": 0,
+                "created_at": utcnow(),
+            }
+        )
+        return job_id
+
+    def claim(self, worker_id):
+        """Take the oldest queued job, or one whose worker stopped heartbeating."""
+        now = utcnow()
+        stale = now - timedelta(seconds=JOB_LEASE)
+        # Out of attempts, or nobody waits for the result any more
+        abandoned = {
+            "status": "running",
+            "heartbeat_at": {"$lt": stale},
+            "$or": [{"attempts": {"$gte": JOB_MAX_ATTEMPTS}}, {"cancelled": True}],
+        }
+        for job in self.collection.find(abandoned, {"_id": 1}):
+            self._settle(
+                {"_id": job["_id"], **abandoned},
+                {"status": "failed", "error": "Worker stopped responding"},
+            )
+        return self.collection.find_one_and_update(
+            {
+                "$or": [
+                    {"status": "queued"},
+                    {"status": "running", "heartbeat_at": {"$lt": stale}},
+                ],
+                "attempts": {"$lt": JOB_MAX_ATTEMPTS},
+                "cancelled": {"$ne": True},
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": worker_id,
+                    "claimed_at": now,
+                    "heartbeat_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("created_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def heartbeat(self, job_id, worker_id):
+        """False once another worker has taken the job over."""
+        return (
+            self.collection.update_one(
+                {"_id": job_id, "worker": worker_id, "status": "running"},
+                {"$set": {"heartbeat_at": utcnow()}},
+            ).matched_count
+            == 1
+        )
+
+    def _settle(self, query, update):
+        """Apply update to the job matching query, or delete it if cancelled.
+
+        Returns the job's new status, "deleted", or None when no job matches.
+        """
+        job = self.collection.find_one_and_update(
+            {**query, "cancelled": {"$ne": True}},
+            {"$set": update},
+            projection={"_id": 1},
+        )
+        if job is not None:
+            return update["status"]
+        job = self.collection.find_one_and_delete(
+            {**query, "cancelled": True}, projection={"frames": 1}
+        )
+        if job is None:
+            return None
+        remove_frames(job)
+        return "deleted"
+
+    def finish(self, job_id, worker_id, result=None, error=None, retry=False):
+        """Record a result or error; only the job's current worker may.
+
+        Returns the job's new status, "deleted" when its station had stopped
+        waiting, or None when another worker has taken the job over.
+        """
+        if retry:
+            update = {"status": "queued", "error": error}
+        elif error is not None:
+            update = {"status": "failed", "error": error}
+        else:
+            update = {"status": "done", "result": result}
+        update["finished_at"] = utcnow()
+        return self._settle(
+            {"_id": job_id, "worker": worker_id, "status": "running"}, update
+        )
+
+    def wait(self, job_id, timeout=JOB_WAIT_TIMEOUT):
+        """The finished job's result; raises ImageProcessingError on failure."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            # The result goes back to the client, the job is not kept
+            job = self.collection.find_one_and_delete(
+                {"_id": job_id, "status": {"$in": ["done", "failed"]}},
+                projection={
+                    "status": 1,
+                    "result": 1,
+                    "error": 1,
+                    "worker": 1,
+                    "frames": 1,
+                },
+            )
+            if job is not None:
+                remove_frames(job)
+                if job["status"] == "failed":
+                    raise ImageProcessingError(job["error"])
+                job["result"]["report"]["worker"] = job["worker"]
+                return job["result"]
+            time.sleep(JOB_POLL_INTERVAL)
+        # Nobody is waiting for it any more: a running job is deleted by its
+        # worker, see _settle, any other one here
+        self.collection.update_one({"_id": job_id}, {"$set": {"cancelled": True}})
+        job = self.collection.find_one_and_delete(
+            {"_id": job_id, "status": {"$ne": "running"}}, projection={"frames": 1}
+        )
+        if job is not None:
+            remove_frames(job)
+        raise ImageProcessingError(f"No worker finished job {job_id} in time")
+
+
+def analyse_job(job):
+    """Run find_defect on a claimed job; returns the stored result."""
+    master_data = bytes(job["master"])
+    master = cv2.imdecode(np.frombuffer(master_data, np.uint8), cv2.IMREAD_COLOR)
+    settings = vision_settings(job.get("vision_configure"))
+    features = get_master_features(
+        master, settings, photo_hash(master_data), job.get("model_id")
+    )
+    frames = (
+        (
+            frame["path"]
+            if "path" in frame
+            else cv2.imdecode(np.frombuffer(frame["png"], np.uint8), cv2.IMREAD_COLOR)
+        )
+        for frame in job["frames"]
+    )
+    image, diff, res, od, report = find_defect(
+        master, frames, job["model_name"], features, settings
+    )
+    return {
+        "image": encode_png(image),
+        "diff": encode_png(diff) if diff is not None else None,
+        "res": res,
+        "od": od,
+        "report": report,
+    }
+
+
+def run_worker(queue, worker_id, stop=None):
+    """Claim and analyse jobs until stop is set."""
+    stop = stop or threading.Event()
+    while not stop.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            stop.wait(JOB_IDLE_WAIT)
+            continue
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(JOB_HEARTBEAT):
+                if not queue.heartbeat(job["_id"], worker_id):
+                    return
+
+        heart = threading.Thread(target=beat, daemon=True)
+        heart.start()
+        try:
+            status = queue.finish(job["_id"], worker_id, result=analyse_job(job))
+        except ImageProcessingError as e:
+            # The frames themselves cannot be inspected; another worker
+            # would fail the same way
+            status = queue.finish(job["_id"], worker_id, error=str(e))
+        except Exception as e:
+            retry = job["attempts"] < JOB_MAX_ATTEMPTS
+            status = queue.finish(job["_id"], worker_id, error=str(e), retry=retry)
+        finally:
+            done.set()
+            heart.join()
+        # Frames stay for a retry or the worker that took the job over
+        if status in ("done", "failed"):
+            remove_frames(job)
+
+
+def worker_process(index):
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{index}"
+    print(f"Inspection worker {worker_id} started")
+    run_worker(MongoJobQueue(job_collection()), worker_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    processes = [
+        multiprocessing.Process(target=worker_process, args=(i,))
+        for i in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,426 @@
+import glob
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from functools import cached_property
+
+import cv2
+import numpy as np
+
+from feature_detectors import DETECTOR, detect_features
+
+logger = logging.getLogger(__name__)
+
+MASTER_CACHE_SIZE = 8
+MASTER_STORE_DIR = os.getenv("MASTER_STORE_DIR", "D:/Rishabh_Images/master_store")
+# Bump when the on-disk layout changes. The backend stores features through
+# new_app's /master_features, so this module is the only writer.
+STORE_VERSION = 2
+STORE_ARRAYS = (
+    "keypoints",
+    "descriptors",
+    "gray",
+    "mask_master",
+    "master_thresh",
+    "contour_points",
+    "contour_offsets",
+)
+# Hu moments at or below this magnitude are skipped, as in cv2.matchShapes
+HU_EPS = 1e-5
+
+
+class MasterFeatures:
+    """Everything align_images and find_defect derive from the master image.
+
+    keypoints is an (N, 7) float32 array of x, y, size, angle, response,
+    octave and class_id so it can be stored and memory-mapped.
+    """
+
+    def __init__(
+        self,
+        key,
+        detector,
+        gray,
+        keypoints,
+        descriptors,
+        mask_master,
+        master_thresh,
+        master_cont,
+        scale=1.0,
+        roi=None,
+    ):
+        self.key = key
+        self.detector = detector
+        # Fraction of the master resolution these features were computed at
+        self.scale = scale
+        self.model_id = None
+        # Regions of interest as normalised (x, y, w, h); pixel bounding box
+        # of their union and the region mask inside that box
+        self.roi = roi
+        self.roi_box, self.roi_mask = (
+            roi_geometry(gray.shape, roi) if roi else (None, None)
+        )
+        self.gray = gray
+        self.keypoints = keypoints
+        self.descriptors = descriptors
+        self.mask_master = mask_master
+        self.master_thresh = master_thresh
+        self.master_cont = master_cont
+        # Matcher indexes built over these descriptors, see feature_matching
+        self.matchers = {}
+
+    @property
+    def shape(self):
+        return self.gray.shape
+
+    @property
+    def points(self):
+        return self.keypoints[:, :2]
+
+    @cached_property
+    def master_hu(self):
+        return hu_signatures(self.master_cont)
+
+    @cached_property
+    def mask_contours(self):
+        # External contours of mask_master, for ssim_inspection
+        return cv2.findContours(
+            np.asarray(self.mask_master), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )[0]
+
+
+def photo_hash(data):
+    # Hash of the encoded master bytes, as stored in the multimeter "photo"
+    return hashlib.sha1(data).hexdigest()
+
+
+def image_hash(image):
+    digest = hashlib.sha1(str(image.shape).encode("utf-8"))
+    digest.update(np.ascontiguousarray(image).data)
+    return digest.hexdigest()
+
+
+def keypoints_to_array(keypoints):
+    return np.array(
+        [
+            (kp.pt[0], kp.pt[1], kp.size, kp.angle, kp.response, kp.octave, kp.class_id)
+            for kp in keypoints
+        ],
+        dtype=np.float32,
+    ).reshape(-1, 7)
+
+
+def hu_signatures(contours):
+    """Per-contour terms of cv2.matchShapes method 1 and which of them count.
+
+    Returns (values, valid), both (N, 7): values are 1 / (sign(h) * log10|h|)
+    of the Hu moments h, valid marks the moments with |h| > HU_EPS.
+    """
+    hu = np.array([cv2.HuMoments(cv2.moments(c)).ravel() for c in contours])
+    hu = hu.reshape(-1, 7)
+    valid = np.abs(hu) > HU_EPS
+    with np.errstate(divide="ignore"):
+        values = np.where(
+            valid, 1.0 / (np.sign(hu) * np.log10(np.where(valid, np.abs(hu), 2.0))), 0.0
+        )
+    return values, valid
+
+
+def scaled_size(shape, scale):
+    """(width, height) of an image of this shape resized by scale."""
+    height, width = shape[:2]
+    return max(1, int(width * scale + 0.5)), max(1, int(height * scale + 0.5))
+
+
+def variant_name(detector, scale, roi=None):
+    name = detector if scale == 1.0 else f"{detector}@{scale:g}"
+    if roi:
+        name += "-roi" + hashlib.sha1(json.dumps(roi).encode("utf-8")).hexdigest()[:8]
+    return name
+
+
+def normalize_roi(roi):
+    """Clip regions given as normalised [x, y, w, h] lists; None when empty."""
+    boxes = []
+    for box in roi or []:
+        x, y, w, h = (min(max(float(v), 0.0), 1.0) for v in box)
+        w, h = min(w, 1.0 - x), min(h, 1.0 - y)
+        if w > 0 and h > 0:
+            boxes.append([round(x, 4), round(y, 4), round(w, 4), round(h, 4)])
+    return boxes or None
+
+
+def roi_geometry(shape, roi, margin=0.0):
+    """Pixel box (x, y, w, h) around the regions and their mask inside it."""
+    height, width = shape[:2]
+    rects = [
+        (
+            int(max(x - margin, 0.0) * width),
+            int(max(y - margin, 0.0) * height),
+            int(np.ceil(min(x + w + margin, 1.0) * width)),
+            int(np.ceil(min(y + h + margin, 1.0) * height)),
+        )
+        for x, y, w, h in roi
+    ]
+    x0, y0 = min(r[0] for r in rects), min(r[1] for r in rects)
+    x1, y1 = max(r[2] for r in rects), max(r[3] for r in rects)
+    mask = np.zeros((y1 - y0, x1 - x0), dtype=np.uint8)
+    for rx0, ry0, rx1, ry1 in rects:
+        mask[ry0 - y0 : ry1 - y0, rx0 - x0 : rx1 - x0] = 255
+    return (x0, y0, x1 - x0, y1 - y0), mask
+
+
+def roi_threshold(image, threshold_type, box=None, mask=None):
+    """Otsu threshold computed from, and applied to, the ROI pixels only."""
+    if box is None:
+        return cv2.threshold(image, 0, 255, threshold_type + cv2.THRESH_OTSU)[1]
+    x, y, w, h = box
+    crop = image[y : y + h, x : x + w]
+    value = cv2.threshold(
+        np.ascontiguousarray(crop[mask > 0]).reshape(-1, 1),
+        0,
+        255,
+        threshold_type + cv2.THRESH_OTSU,
+    )[0]
+    output = np.zeros(image.shape, dtype=np.uint8)
+    output[y : y + h, x : x + w] = cv2.bitwise_and(
+        cv2.threshold(crop, value, 255, threshold_type)[1], mask
+    )
+    return output
+
+
+def compute_master_features(master, key=None, detector=DETECTOR, scale=1.0, roi=None):
+    if key is None:
+        key = image_hash(master)
+    if scale != 1.0:
+        master = cv2.resize(
+            master, scaled_size(master.shape, scale), interpolation=cv2.INTER_AREA
+        )
+    gray = cv2.cvtColor(master, cv2.COLOR_BGR2GRAY)
+    box, mask = roi_geometry(gray.shape, roi) if roi else (None, None)
+    if box is None:
+        keypoints, descriptors = detect_features(gray, detector)
+        keypoints = keypoints_to_array(keypoints)
+    else:
+        x, y, w, h = box
+        keypoints, descriptors = detect_features(
+            gray[y : y + h, x : x + w], detector, mask
+        )
+        keypoints = keypoints_to_array(keypoints)
+        keypoints[:, 0] += x
+        keypoints[:, 1] += y
+    mask_master = roi_threshold(gray, cv2.THRESH_BINARY, box, mask)
+    master_thresh = roi_threshold(gray, cv2.THRESH_BINARY_INV, box, mask)
+    master_cont = cv2.findContours(
+        master_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )[0]
+    return MasterFeatures(
+        key,
+        detector,
+        gray,
+        keypoints,
+        descriptors,
+        mask_master,
+        master_thresh,
+        master_cont,
+        scale,
+        roi,
+    )
+
+
+class MasterFeatureStore:
+    """On-disk MasterFeatures, one directory per <model_id>/<photo_hash>/<variant>.
+
+    The variant is the detector name, suffixed with @<scale> for features
+    computed on a downscaled master and -roi<hash> for per-model regions.
+
+    Arrays are saved as .npy files and loaded memory-mapped, so every process
+    reading the same master shares the page cache instead of re-running SIFT.
+    """
+
+    def __init__(self, root=MASTER_STORE_DIR):
+        self.root = root
+
+    def path(self, model_id, key, detector=DETECTOR, scale=1.0, roi=None):
+        return os.path.join(
+            self.root, str(model_id), key, variant_name(detector, scale, roi)
+        )
+
+    def find(self, key, model_id=None, detector=DETECTOR, scale=1.0, roi=None):
+        if model_id:
+            path = self.path(model_id, key, detector, scale, roi)
+            return path if os.path.isdir(path) else None
+        matches = glob.glob(
+            os.path.join(self.root, "*", key, variant_name(detector, scale, roi))
+        )
+        return matches[0] if matches else None
+
+    def load(self, key, model_id=None, detector=DETECTOR, scale=1.0, roi=None):
+        path = self.find(key, model_id, detector, scale, roi)
+        if path is None:
+            return None
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+            if (
+                meta.get("version") != STORE_VERSION
+                or meta["detector"] != detector
+                or meta.get("roi") != roi
+            ):
+                return None
+            arrays = {
+                name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+                for name in STORE_ARRAYS
+            }
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable master store entry %s: %s", path, e)
+            return None
+        return MasterFeatures(
+            key,
+            detector,
+            arrays["gray"],
+            arrays["keypoints"],
+            arrays["descriptors"],
+            arrays["mask_master"],
+            arrays["master_thresh"],
+            split_contours(arrays["contour_points"], arrays["contour_offsets"]),
+            scale,
+            roi,
+        )
+
+    def save(self, features, model_id):
+        path = self.path(
+            model_id, features.key, features.detector, features.scale, features.roi
+        )
+        if os.path.isdir(path):
+            return path
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        os.makedirs(tmp_path, exist_ok=True)
+        try:
+            contour_points, contour_offsets = join_contours(features.master_cont)
+            arrays = {
+                "keypoints": features.keypoints,
+                "descriptors": features.descriptors,
+                "gray": features.gray,
+                "mask_master": features.mask_master,
+                "master_thresh": features.master_thresh,
+                "contour_points": contour_points,
+                "contour_offsets": contour_offsets,
+            }
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array))
+            with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+                json.dump(
+                    {
+                        "version": STORE_VERSION,
+                        "detector": features.detector,
+                        "scale": features.scale,
+                        "roi": features.roi,
+                        "shape": list(features.shape),
+                    },
+                    f,
+                )
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process stored the same master first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+        if str(model_id) != "unassigned":
+            self.prune(model_id, features.key)
+        return path
+
+    def prune(self, model_id, key):
+        """Remove the model's features of photos other than key."""
+        model_dir = os.path.join(self.root, str(model_id))
+        for name in os.listdir(model_dir):
+            if name != key:
+                # Memory-mapped files still in use may not be removable yet
+                shutil.rmtree(os.path.join(model_dir, name), ignore_errors=True)
+
+    def remove(self, model_id):
+        shutil.rmtree(os.path.join(self.root, str(model_id)), ignore_errors=True)
+
+
+def join_contours(contours):
+    offsets = np.zeros(len(contours) + 1, dtype=np.int64)
+    for i, contour in enumerate(contours):
+        offsets[i + 1] = offsets[i] + len(contour)
+    if contours:
+        points = np.concatenate([c.reshape(-1, 2) for c in contours]).astype(np.int32)
+    else:
+        points = np.zeros((0, 2), dtype=np.int32)
+    return points, offsets
+
+
+def split_contours(points, offsets):
+    return [
+        points[offsets[i] : offsets[i + 1]].reshape(-1, 1, 2)
+        for i in range(len(offsets) - 1)
+    ]
+
+
+class MasterFeatureCache:
+    """Size-bounded LRU of MasterFeatures keyed by master hash, model and variant.
+
+    Misses are served from the persistent store when possible, and freshly
+    computed features are written back to it. Cached arrays are shared
+    between inspections and must not be modified.
+    """
+
+    def __init__(self, max_size=MASTER_CACHE_SIZE, store=None):
+        self.max_size = max_size
+        self.store = store
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self, master, key=None, model_id=None, detector=DETECTOR, scale=1.0, roi=None
+    ):
+        if key is None:
+            key = image_hash(master)
+        # model_id is part of the entry: the features carry it into the
+        # homography cache's key, so models sharing a photo get their own
+        entry = (key, model_id, variant_name(detector, scale, roi))
+        with self._lock:
+            features = self._entries.get(entry)
+            if features is not None:
+                self._entries.move_to_end(entry)
+                return features
+        features = self._load_or_compute(master, key, model_id, detector, scale, roi)
+        features.model_id = model_id
+        with self._lock:
+            self._entries[entry] = features
+            self._entries.move_to_end(entry)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return features
+
+    def _load_or_compute(self, master, key, model_id, detector, scale, roi):
+        if self.store is None:
+            return compute_master_features(master, key, detector, scale, roi)
+        features = self.store.load(key, model_id, detector, scale, roi)
+        expected_shape = scaled_size(master.shape, scale)[::-1]
+        if features is not None and features.shape == expected_shape:
+            return features
+        features = compute_master_features(master, key, detector, scale, roi)
+        try:
+            self.store.save(features, model_id or "unassigned")
+        except OSError as e:
+            logger.warning("Could not persist master features: %s", e)
+        return features
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+master_store = MasterFeatureStore()
+master_cache = MasterFeatureCache(store=master_store)
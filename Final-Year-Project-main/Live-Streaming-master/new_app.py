@@ -1,6 +1,5 @@
 from flask import Flask, Response, render_template, jsonify, request
 import cv2
-from pyueye import ueye
 import numpy as np
 from flask_cors import CORS
 import os
@@ -12,18 +11,26 @@ from pymodbus.exceptions import ModbusException
 import struct
 import serial.tools.list_ports
 import time
-
-
-class CameraError(Exception):
-    pass
-
-
-class ImageProcessingError(Exception):
-    pass
-
-
-class AlignmentError(Exception):
-    pass
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from auto_capture import AutoCapture, StabilityDetector
+from camera import CameraError, open_camera
+from capture_pipeline import PrefetchedFrames, quality_gate
+from defect_heatmap import HOTSPOT_CELL, defect_heatmaps
+from job_queue import MongoJobQueue, job_collection
+from master_features import master_store, photo_hash
+from inspection_jobs import InspectionJobs
+from inspection_scheduler import InspectionScheduler, SchedulerFull
+from speculative import SpeculativeSlot, inspection_key
+from inspection import (
+    NO_FRAMES,
+    AlignmentError,
+    ImageProcessingError,
+    find_defect,
+    get_master_features,
+    vision_settings,
+)
 
 
 class SerialError(Exception):
@@ -56,66 +63,53 @@ def handle_generic_error(error):
     return jsonify({"error": "Internal server error"}), 500
 
 
+@app.errorhandler(SchedulerFull)
+def handle_scheduler_full(error):
+    return (
+        jsonify({"error": str(error), **error.status}),
+        429,
+        {"Retry-After": str(error.status["retry_after"])},
+    )
+
+
 @app.errorhandler(SerialError)
 def handle_serial_error(error):
     return jsonify({"error": "Serial Error"}), 500
 
 
-hCam = ueye.HIDS(0)
-sInfo = ueye.SENSORINFO()
-cInfo = ueye.CAMINFO()
-rectAOI = ueye.IS_RECT()
-
-ret = ueye.is_InitCamera(hCam, None)
-if ret != ueye.IS_SUCCESS:
-    raise Exception(f"Camera initialization failed with error code: {ret}")
-
-# Get camera information
-ueye.is_GetCameraInfo(hCam, cInfo)
-ueye.is_GetSensorInfo(hCam, sInfo)
-
-# Set color mode to RGB8
-ueye.is_SetColorMode(hCam, ueye.IS_CM_BGR8_PACKED)
-
-max_width = int(sInfo.nMaxWidth)
-max_height = int(sInfo.nMaxHeight)
-rectAOI.s32X = ueye.int(0)
-rectAOI.s32Y = ueye.int(0)
-rectAOI.s32Width = ueye.int(max_width)
-rectAOI.s32Height = ueye.int(max_height)
-ueye.is_AOI(hCam, ueye.IS_AOI_IMAGE_SET_AOI, rectAOI, ueye.sizeof(rectAOI))
-
-camera_width = int(rectAOI.s32Width)
-camera_height = int(rectAOI.s32Height)
-bitspixel = 24  # for color mode: IS_CM_BGR8_PACKED
-mem_ptr = ueye.c_mem_p()
-mem_id = ueye.int()
-
-# Allocate memory for the image
-ueye.is_AllocImageMem(hCam, camera_width, camera_height, bitspixel, mem_ptr, mem_id)
-ueye.is_SetImageMem(hCam, mem_ptr, mem_id)
-
-# Start video capture
-ueye.is_CaptureVideo(hCam, ueye.IS_WAIT)
+# ANALYSIS_WORKERS processes started with spawn re-import this module;
+# only the main process opens the camera
+if multiprocessing.parent_process() is None:
+    # Full sensor until a model's vision_configure selects its AOI and
+    # binning, see camera.Camera.configure
+    camera = open_camera()
+    auto_capture = AutoCapture(camera.grab)
+    # JOB_QUEUE=mongo hands captured frames to job_queue workers instead of
+    # analysing them in this process
+    remote_jobs = (
+        MongoJobQueue(job_collection()) if os.getenv("JOB_QUEUE") == "mongo" else None
+    )
 
 save_directory = "./section_2_clear"
 if not os.path.exists(save_directory):
     os.makedirs(save_directory)
 
 DELAY_FRAMES = 0.04
-NO_FRAMES = 3
+# Frames go to find_defect in memory; SAVE_FRAMES=1 also writes them to
+# save_directory in the background
+SAVE_FRAMES = os.getenv("SAVE_FRAMES", "0") == "1"
+frame_writer = ThreadPoolExecutor(max_workers=1)
+# Bounds the inspections capturing and analysing at once, see
+# MAX_CONCURRENT_INSPECTIONS and INSPECTION_QUEUE_SIZE
+inspection_scheduler = InspectionScheduler()
+# Inspection started by /getSerialNo for the /capture expected after it
+speculative_inspection = SpeculativeSlot()
 
 
 def generate_frames():
     while True:
-        # Create the image buffer for capturing frames
-        image_buffer = np.zeros((camera_height, camera_width, 3), dtype=np.uint8)
-
         # Capture an image frame
-        ueye.is_FreezeVideo(hCam, ueye.IS_WAIT)
-
-        # Copy image data to the buffer
-        ueye.is_CopyImageMem(hCam, mem_ptr, mem_id, image_buffer.ctypes.data)
+        image_buffer = camera.grab()
         # Encode image to JPEG format
         ret, buffer = cv2.imencode(".jpg", image_buffer)
         if not ret:
@@ -126,178 +120,37 @@ def generate_frames():
         yield (b"--frame\r\n" b"Content-Type: image/jpeg\r\n\r\n" + frame + b"\r\n")
 
 
-def preprocess_image(image):
-    # Convert to grayscale
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    return gray
-
-
-def align_images(master, input):
-    try:
-        master_preprocessed = preprocess_image(master)
-        input_preprocessed = preprocess_image(input)
-        sift = cv2.SIFT_create(nfeatures=10000)
-        keypoints1, descriptors1 = sift.detectAndCompute(master_preprocessed, None)
-        keypoints2, descriptors2 = sift.detectAndCompute(input_preprocessed, None)
-        bf = cv2.BFMatcher()
-        raw_matches = bf.knnMatch(descriptors1, descriptors2, k=2)
-        good_matches = []
-        for m, n in raw_matches:
-            if m.distance < 0.75 * n.distance:
-                good_matches.append(m)
-        good_matches = sorted(good_matches, key=lambda x: x.distance)
-        if len(good_matches) < 4:
-            raise AlignmentError("Not enough good matches")
-        pts1 = np.float32([keypoints1[m.queryIdx].pt for m in good_matches]).reshape(
-            -1, 1, 2
-        )
-        pts2 = np.float32([keypoints2[m.trainIdx].pt for m in good_matches]).reshape(
-            -1, 1, 2
-        )
-        H, mask = cv2.findHomography(pts2, pts1, cv2.RANSAC, 2.0)
-        aligned_image = cv2.warpPerspective(
-            input, H, (master.shape[1], master.shape[0])
-        )
-
-        _, mask_master = cv2.threshold(
-            master_preprocessed, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU
-        )
-        mask_contours, _ = cv2.findContours(
-            mask_master, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
-        aligned_image_gray = cv2.cvtColor(aligned_image, cv2.COLOR_BGR2GRAY)
-        absolute = cv2.absdiff(master_preprocessed, aligned_image_gray)
-        aligned_thresh = cv2.threshold(
-            aligned_image_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
-        )[1]
-        result = cv2.bitwise_or(mask_master, aligned_thresh)
-        result = cv2.threshold(result, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
-
-        master_thresh = cv2.threshold(
-            master_preprocessed, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
-        )[1]
-        master_cont = cv2.findContours(
-            master_thresh, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )[0]
-        return result, aligned_image, master_cont, master_thresh, absolute
-    except Exception as e:
-        raise AlignmentError(f"Image alignment failed: {str(e)}")
-
-
-def clean_image(image):
-    num_labels, labels = cv2.connectedComponents(image)
-    min_size_threshold = 30
-    height_threshold = 1000
-    width_threshold = 2
-    valid_object_count = 0
-
-    # Create single channel output image
-    output_image = np.zeros_like(image, dtype=np.uint8)
-    component_sizes = np.bincount(labels.ravel())
-
-    for label in range(1, num_labels):
-        if component_sizes[label] > min_size_threshold:
-            coords = np.argwhere(labels == label)
-            min_y, min_x = coords.min(axis=0)
-            max_y, max_x = coords.max(axis=0)
-            width, height = max_x - min_x, max_y - min_y
-
-            if (width < width_threshold and height < height_threshold) or (
-                height < width_threshold and width < height_threshold
-            ):
-                output_image[labels == label] = 0  # Exclude objects
-            else:
-                output_image[labels == label] = 255  # Valid objects in white
-                valid_object_count += 1
-
-    return output_image
-
-
-def find_defect(master, images, model_name):
-    try:
-        classes = [0] * NO_FRAMES
-        differences = [None] * NO_FRAMES
-        contours_no = [0] * NO_FRAMES
-        mapping = [0] * NO_FRAMES
-        operator_dependent = False
-        for i, img_path in enumerate(images):
-            input_path = img_path
-            input = cv2.imread(input_path)
-            input = cv2.resize(input, (master.shape[1], master.shape[0]))
-            difference, aligned_image, mask_contours, mask_master, absolute = (
-                align_images(master, input)
-            )
-            master_copy = master.copy()
-            cv2.drawContours(master_copy, mask_contours, -1, (0, 255, 0), 3)
-            cv2.imwrite(f"master{i}.png", master_copy)
-            print(len(mask_contours))
-            _, thresholded_diff = cv2.threshold(
-                difference, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
-            )
-            cv2.imwrite(f"diff{i}.png", thresholded_diff)
-            cleaned_diff = clean_image(thresholded_diff)
-            cnt, _ = cv2.findContours(
-                cleaned_diff, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-            )
-            copy = aligned_image.copy()
-            counter = 0
-            for captured_cnt in cnt:
-                for master_cnt in mask_contours:
-                    if cv2.matchShapes(captured_cnt, master_cnt, 1, 0.0) < 0.1:
-                        cv2.drawContours(copy, [captured_cnt], -1, (0, 255, 0), 3)
-                        counter += 1
-                        break
-            cv2.imwrite(f"red{i}.png", copy)
-            contours_no[i] = len(cnt)
-            mapping[i] = counter
-            differences[i] = cleaned_diff
-            if len(cnt) == 0 and counter == 0:
-                classes[i] = 1
-            elif len(cnt) > 0 and counter == 0:
-                operator_dependent = True
-        print(classes)
-        print(contours_no)
-        print(mapping)
-        max_idx = contours_no.index(max(contours_no))
-        if classes.count(1) >= 2:
-            captured_correct = cv2.imread(images[max_idx])
-            cv2.imwrite("difference_correct.png", differences[max_idx])
-            diff_cirr = cv2.imread("difference_correct.png")
-            return captured_correct, diff_cirr, "pass", operator_dependent
-        captured_incorrect = cv2.imread(images[max_idx])
-        cv2.imwrite("different_incorrect.png", differences[max_idx])
-        diff = cv2.imread("different_incorrect.png")
-        return captured_incorrect, diff, "fail", operator_dependent
-    except Exception as e:
-        raise ImageProcessingError(f"Defect detection failed: {str(e)}")
-
-
-def capture_distinct_frames(num_frames=3, min_delay=0.5):
-    try:
-        frames = []
-        for i in range(num_frames):
+def iter_distinct_frames(num_frames=3, min_delay=0.5):
+    """Capture frames one at a time as they are consumed, yielding the arrays."""
+    for i in range(num_frames):
+        try:
             # Clear buffer
-            ueye.is_CaptureVideo(hCam, ueye.IS_DONT_WAIT)
+            camera.clear()
             time.sleep(min_delay)  # Delay between captures
 
             # Capture new frame
-            image_buffer = np.zeros((camera_height, camera_width, 3), dtype=np.uint8)
-            ret = ueye.is_FreezeVideo(hCam, ueye.IS_WAIT)
-            if ret != ueye.IS_SUCCESS:
-                raise RuntimeError(f"Frame capture failed: {ret}")
+            image_buffer = camera.grab()
 
-            # Copy to buffer
-            ueye.is_CopyImageMem(hCam, mem_ptr, mem_id, image_buffer.ctypes.data)
+            if SAVE_FRAMES:
+                frame_writer.submit(
+                    cv2.imwrite,
+                    os.path.join(save_directory, f"frame_{i}.png"),
+                    image_buffer,
+                )
+        except Exception as e:
+            raise Exception("Not enought images captured")
+        yield image_buffer
 
-            frames.append(image_buffer.copy())
-            filename = f"frame_{i}.png"
-            cv2.imwrite(os.path.join(save_directory, filename), image_buffer)
 
-        return [
-            os.path.join(save_directory, f"frame_{i}.png") for i in range(num_frames)
-        ]
-    except Exception as e:
-        raise Exception("Not enought images captured")
+def configure_camera(settings):
+    """Read out only the model's AOI, binned or subsampled as configured.
+
+    Callers outside an inspection hold an inspection_scheduler slot, so the
+    format never changes in the middle of an inspection's frames.
+    """
+    return camera.configure(
+        settings["aoi"], settings["binning"], settings["subsampling"]
+    )
 
 
 def save_in_directory(root_dir, subdir, images, names):
@@ -557,61 +410,335 @@ def video_feed():
     )
 
 
+def run_inspection(data, on_frame=None, slot=nullcontext):
+    """Capture frames of the meter and run find_defect against data's master.
+
+    data is a /capture request body; returns the /capture response and the
+    defect mask for record_heatmap, which is only called once the response
+    is delivered. on_frame receives each frame's verdict, see find_defect.
+    The camera is only used inside slot(), which a remote job leaves before
+    waiting for its worker.
+    """
+    model_name = data["model_type"]
+    header, encoded = data["master"].split(",", 1)
+    master_data = base64.b64decode(encoded)
+    master = cv2.imdecode(np.frombuffer(master_data, np.uint8), cv2.IMREAD_COLOR)
+    settings = vision_settings(data.get("vision_configure"))
+    key = photo_hash(master_data)
+    model_id = data.get("model_id")
+    capture_stats = {}
+    with slot() as admission:
+        configure_camera(settings)
+        if remote_jobs is not None:
+            # The worker votes over every frame it gets, so all max_frames are
+            # captured up front without early exit; max_frames bounds it
+            job_id = remote_jobs.enqueue(
+                master_data,
+                list(capture_frames(settings, capture_stats)),
+                model_name,
+                model_id,
+                data.get("vision_configure"),
+            )
+        else:
+            features = get_master_features(master, settings, key, model_id)
+            captured_images = PrefetchedFrames(capture_frames(settings, capture_stats))
+            image, diff, res, od, report = find_defect(
+                master,
+                captured_images,
+                model_name,
+                features,
+                settings,
+                on_frame=on_frame,
+            )
+    if remote_jobs is not None:
+        result = remote_jobs.wait(job_id)
+        image_png, diff_png = result["image"], result["diff"]
+        res, od, report = result["res"], result["od"], result["report"]
+        report["job_id"] = job_id
+        diff = (
+            cv2.imdecode(np.frombuffer(diff_png, np.uint8), cv2.IMREAD_GRAYSCALE)
+            if diff_png is not None
+            else None
+        )
+    else:
+        image_png = cv2.imencode(".png", image)[1].tobytes()
+        diff_png = cv2.imencode(".png", diff)[1].tobytes() if diff is not None else None
+        diff = diff[:, :, 0] if diff is not None else None
+    report["capture"] = capture_stats
+    if admission is not None:
+        report["queue"] = admission
+    image_base64 = base64.b64encode(image_png).decode("utf-8")
+    diff_base64 = (
+        base64.b64encode(diff_png).decode("utf-8") if diff_png is not None else None
+    )
+    result = {
+        "image": f"data:image/png;base64,{image_base64}",
+        "diff": (f"data:image/png;base64,{diff_base64}" if diff is not None else None),
+        "res": res,
+        "od": od,
+        "report": report,
+    }
+    return result, (model_id, key, diff)
+
+
+def capture_frames(settings, capture_stats):
+    """The frames of one inspection, through the quality gate if configured.
+
+    Frames are captured as they are asked for, so find_defect's vote gets
+    the next one while the previous is being analysed.
+    """
+    if settings["burst_frames"] > NO_FRAMES:
+        bursts = -(-settings["max_frames"] // NO_FRAMES)
+        frames = quality_gate(
+            iter_distinct_frames(
+                num_frames=settings["burst_frames"] * bursts,
+                min_delay=DELAY_FRAMES,
+            ),
+            settings["burst_frames"],
+            NO_FRAMES,
+            settings["min_sharpness_ratio"],
+            settings["max_motion"],
+            capture_stats,
+        )
+    else:
+        frames = iter_distinct_frames(
+            num_frames=settings["max_frames"], min_delay=DELAY_FRAMES
+        )
+    return frames
+
+
+def inspect_meter(data, on_frame=None):
+    """run_inspection once inspection_scheduler admits it."""
+    return run_inspection(data, on_frame, inspection_scheduler.admit)
+
+
+def record_heatmap(result, defects):
+    """Add a delivered inspection's defect mask to its model's heatmap.
+
+    Speculative inspections that nobody takes are never recorded.
+    """
+    model_id, key, diff = defects
+    if model_id and diff is not None:
+        try:
+            result["report"]["heatmap_inspections"] = defect_heatmaps.add(
+                model_id, key, diff
+            )
+        except Exception as e:
+            app.logger.error(f"Could not update defect heatmap: {str(e)}")
+    return result
+
+
+def capture_result(data, on_frame=None):
+    """The /capture response for data.
+
+    Uses the inspection /getSerialNo started for this model if there is one;
+    its frames were taken while the serial number was being read.
+    """
+    future = speculative_inspection.take(inspection_key(data))
+    if future is None:
+        return record_heatmap(*inspect_meter(data, on_frame))
+    result, defects = future.result()
+    result["report"]["speculative"] = True
+    return record_heatmap(result, defects)
+
+
+def job_error_status(error):
+    """The error message and status /capture would have answered with."""
+    if isinstance(error, SchedulerFull):
+        return str(error), 429
+    if isinstance(error, CameraError):
+        return "Camera Error", 500
+    if isinstance(error, ImageProcessingError):
+        return "Error occured in Image Processing!", 422
+    if isinstance(error, AlignmentError):
+        return "Image Alignment Failed", 422
+    app.logger.error(f"Unexpected error: {str(error)}")
+    return "Internal server error", 500
+
+
+inspection_jobs = InspectionJobs(job_error_status)
+
+
 @app.route("/capture", methods=["POST"])
 def capture():
     try:
         model_name = request.json["model_type"]
         if not model_name:
             return ImageProcessingError("Serial number or model name not provided"), 400
-        captured_images = capture_distinct_frames(
-            num_frames=NO_FRAMES, min_delay=DELAY_FRAMES
-        )
-        if len(captured_images) < NO_FRAMES:
-            return jsonify({"error": "Could not capture enough distinct frames"}), 500
         if "master" not in request.json:
             return jsonify({"error": "Master image not provided"}), 400
-        master_data_url = request.json["master"]
-        header, encoded = master_data_url.split(",", 1)
-        master_data = base64.b64decode(encoded)
-        master_path = "fetched_master.png"
-        with open(master_path, "wb") as f:
-            f.write(master_data)
-        master = cv2.imread(master_path)
-        image, diff, res, od = find_defect(master, captured_images, model_name)
-        _, buffer = cv2.imencode(".png", image)
-        _, diff = cv2.imencode(".png", diff) if diff is not None else (None, None)
-        image_base64 = base64.b64encode(buffer).decode("utf-8")
-        diff_base64 = (
-            base64.b64encode(diff).decode("utf-8") if diff is not None else None
-        )
-        return jsonify(
-            {
-                "image": f"data:image/png;base64,{image_base64}",
-                "diff": (
-                    f"data:image/png;base64,{diff_base64}" if diff is not None else None
-                ),
-                "res": res,
-                "od": od,
-            }
-        )
-    except (CameraError, ImageProcessingError, AlignmentError) as e:
+        return jsonify(capture_result(request.json))
+    except (CameraError, ImageProcessingError, AlignmentError, SchedulerFull) as e:
         raise
     except Exception as e:
         app.logger.error(f"Unexpected error: {str(e)}")
         raise
 
 
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    """Start a /capture inspection in the background and return its job id.
+
+    Poll GET /jobs/<job_id> or follow GET /jobs/<job_id>/events for the
+    per-frame verdicts and the result.
+    """
+    data = request.json
+    if not data.get("model_type"):
+        return jsonify({"error": "Model name not provided"}), 400
+    if "master" not in data:
+        return jsonify({"error": "Master image not provided"}), 400
+    if inspection_jobs.active() >= inspection_scheduler.capacity:
+        raise inspection_scheduler.reject("Inspection queue is full")
+    job = inspection_jobs.submit(lambda on_frame: capture_result(data, on_frame))
+    return (
+        jsonify(
+            {
+                "job_id": job.id,
+                "status": job.status,
+                "status_url": f"/jobs/{job.id}",
+                "events_url": f"/jobs/{job.id}/events",
+            }
+        ),
+        202,
+    )
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = inspection_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.summary())
+
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def job_events(job_id):
+    """Server-sent status, frame, result and error events of one job."""
+    job = inspection_jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return Response(job.stream(), mimetype="text/event-stream")
+
+
+@app.route("/inspection_queue", methods=["GET"])
+def inspection_queue():
+    return jsonify(inspection_scheduler.status())
+
+
+@app.route("/auto_capture/start", methods=["POST"])
+def auto_capture_start():
+    """Inspect automatically each time a meter is placed and at rest.
+
+    Takes a /capture body plus optional still_frames, motion_threshold and
+    change_threshold for the StabilityDetector. The fixture should be empty
+    when this is called; its first frame is the empty background.
+    """
+    data = dict(request.json)
+    if not data.get("model_type"):
+        return jsonify({"error": "Model name not provided"}), 400
+    if "master" not in data:
+        return jsonify({"error": "Master image not provided"}), 400
+    detector = StabilityDetector(
+        int(data.pop("still_frames", 5)),
+        float(data.pop("motion_threshold", 0.005)),
+        float(data.pop("change_threshold", 0.02)),
+    )
+    with inspection_scheduler.admit(inspection=False):
+        configure_camera(vision_settings(data.get("vision_configure")))
+    auto_capture.start(lambda: record_heatmap(*inspect_meter(data)), detector)
+    return jsonify(auto_capture.status())
+
+
+@app.route("/auto_capture/stop", methods=["POST"])
+def auto_capture_stop():
+    auto_capture.stop()
+    return jsonify(auto_capture.status())
+
+
+@app.route("/auto_capture/events", methods=["GET"])
+def auto_capture_events():
+    """Server-sent state, triggered, result and error events."""
+    return Response(auto_capture.stream(), mimetype="text/event-stream")
+
+
+@app.route("/heatmap/<model_id>", methods=["GET"])
+def heatmap(model_id):
+    image = defect_heatmaps.image(model_id, request.args.get("key"))
+    if image is None:
+        return jsonify({"error": "No inspections recorded for this model"}), 404
+    _, buffer = cv2.imencode(".png", image)
+    return Response(buffer.tobytes(), mimetype="image/png")
+
+
+@app.route("/heatmap/<model_id>/hotspots", methods=["GET"])
+def heatmap_hotspots(model_id):
+    hotspots = defect_heatmaps.hotspots(
+        model_id,
+        request.args.get("key"),
+        top=request.args.get("top", 10, type=int),
+        cell=request.args.get("cell", HOTSPOT_CELL, type=int),
+    )
+    if hotspots is None:
+        return jsonify({"error": "No inspections recorded for this model"}), 404
+    return jsonify(hotspots)
+
+
+@app.route("/camera_format", methods=["POST"])
+def camera_format():
+    """Switch the camera to a model's readout format when it is selected."""
+    settings = vision_settings(
+        (request.get_json(silent=True) or {}).get("vision_configure")
+    )
+    with inspection_scheduler.admit(inspection=False):
+        changed = configure_camera(settings)
+        height, width = camera.shape[:2]
+    if changed:
+        # Another model was selected
+        speculative_inspection.discard()
+    return jsonify({"width": width, "height": height, "changed": changed})
+
+
+@app.route("/master_features", methods=["POST"])
+def store_master_features():
+    """Compute and store a model's master features ahead of its first inspection.
+
+    Takes model_id, the master as a data URL and its vision_configure. The
+    backend calls this whenever a multimeter's photo or settings change, so
+    the store's layout is only defined by master_features.
+    """
+    data = request.get_json(silent=True) or {}
+    if not data.get("model_id") or not data.get("master"):
+        return jsonify({"error": "Model id and master image are required"}), 400
+    master_data = base64.b64decode(data["master"].split(",", 1)[1])
+    master = cv2.imdecode(np.frombuffer(master_data, np.uint8), cv2.IMREAD_COLOR)
+    if master is None:
+        raise ImageProcessingError("Invalid master image")
+    settings = vision_settings(data.get("vision_configure"))
+    features = get_master_features(
+        master, settings, photo_hash(master_data), data["model_id"]
+    )
+    # Cached features of the same master may have been stored for another model
+    path = master_store.save(features, data["model_id"])
+    return jsonify({"path": path, "key": features.key, "detector": features.detector})
+
+
+@app.route("/master_features/<model_id>", methods=["DELETE"])
+def remove_master_features(model_id):
+    """Remove everything stored for a deleted model."""
+    master_store.remove(model_id)
+    return jsonify({"model_id": model_id})
+
+
 @app.route("/capture_master_image", methods=["POST"])
 def capture_master_image():
     try:
-        # Capture a single frame
-        image_buffer = np.zeros((camera_height, camera_width, 3), dtype=np.uint8)
-        ret = ueye.is_FreezeVideo(hCam, ueye.IS_WAIT)
-        if ret != ueye.IS_SUCCESS:
-            raise CameraError(f"Frame capture failed: {ret}")
-
-        # Copy to buffer
-        ueye.is_CopyImageMem(hCam, mem_ptr, mem_id, image_buffer.ctypes.data)
+        # The master is captured in the model's readout format so inspection
+        # frames match it
+        data = request.get_json(silent=True) or {}
+        with inspection_scheduler.admit(inspection=False):
+            configure_camera(vision_settings(data.get("vision_configure")))
+            # Capture a single frame
+            image_buffer = camera.grab()
 
         # Encode image to JPEG format
         ret, buffer = cv2.imencode(".jpg", image_buffer)
@@ -622,7 +749,7 @@ def capture_master_image():
         image_base64 = base64.b64encode(frame).decode("utf-8")
 
         return jsonify({"image": f"data:image/jpeg;base64,{image_base64}"})
-    except (CameraError, ImageProcessingError) as e:
+    except (CameraError, ImageProcessingError, SchedulerFull) as e:
         print(e)
         raise
     except Exception as e:
@@ -632,6 +759,18 @@ def capture_master_image():
 
 @app.route("/getSerialNo", methods=["POST"])
 def get_serial_no():
+    # A /capture body under "speculate" starts that inspection now, so it
+    # runs while the meter is being read; see inspection_key for its token
+    speculate = request.json.get("speculate")
+    if (
+        speculate
+        and speculate.get("speculation_id")
+        and speculate.get("model_type")
+        and speculate.get("master")
+    ):
+        speculative_inspection.start(
+            inspection_key(speculate), lambda: inspect_meter(speculate)
+        )
     try:
         COMM_PROTOCOL = request.json["com_protocol"]
         SLAVE_ID = request.json["com_configure"]["slave_id"]
@@ -0,0 +1,50 @@
+"""One entry point for both inspection pipelines, for side-by-side runs.
+
+"contour" is the SIFT alignment + contour voting of inspection.find_defect
+used by new_app.py; "ssim" is the reference-difference SSIM check of
+ssim_inspection.find_defect used by signaling_server.py. Their res values
+keep each pipeline's own meaning.
+"""
+
+import time
+
+import inspection
+import ssim_inspection
+
+
+def run_contour(master, frames, options):
+    settings = inspection.vision_settings(options)
+    features = inspection.get_master_features(master, settings)
+    image, diff, res, od, report = inspection.find_defect(
+        master, frames, options.get("model_name", "benchmark"), features, settings
+    )
+    return {"res": res, "od": od, "image": image, "diff": diff, "report": report}
+
+
+def run_ssim(master, frames, options):
+    diff, res = ssim_inspection.find_defect(
+        master,
+        frames,
+        options.get("detector", ssim_inspection.DETECTOR),
+        options.get("reference", ssim_inspection.REFERENCE_PATH),
+        float(options.get("ssim_scale", ssim_inspection.SSIM_SCALE)),
+        options.get("ssim_roi"),
+    )
+    return {"res": res, "diff": diff}
+
+
+PIPELINES = {
+    "contour": run_contour,
+    "ssim": run_ssim,
+}
+
+
+def run_pipeline(name, master, frames, options=None):
+    """Run pipeline name on BGR frames or paths; adds the pipeline and its ms."""
+    if name not in PIPELINES:
+        raise ValueError(f"Unknown pipeline: {name}")
+    start = time.perf_counter()
+    result = PIPELINES[name](master, list(frames), dict(options or {}))
+    result["pipeline"] = name
+    result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
@@ -0,0 +1,68 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Seconds a speculative inspection stays claimable after it was started
+SPECULATIVE_TTL = float(os.getenv("SPECULATIVE_TTL", "30"))
+
+
+def inspection_key(data):
+    """What a /capture body inspects: the model, its master and settings.
+
+    speculation_id is a token the client makes per placed meter and sends
+    with both /getSerialNo and /capture, so a speculation is only taken by
+    the capture of the meter it was started for.
+    """
+    master = hashlib.sha1(data.get("master", "").encode()).hexdigest()
+    settings = json.dumps(data.get("vision_configure") or {}, sort_keys=True)
+    return data.get("speculation_id"), str(data.get("model_id")), master, settings
+
+
+class SpeculativeSlot:
+    """Holds at most one inspection started before anyone asked for it.
+
+    start() runs the inspection on a single worker thread, replacing any
+    earlier one. take() hands its future to the first request with the same
+    key within ttl seconds; a request for anything else, an expired entry or
+    discard() drops it. A dropped inspection that is already running
+    finishes and is ignored.
+    """
+
+    def __init__(self, ttl=SPECULATIVE_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entry = None
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def start(self, key, inspect):
+        with self._lock:
+            if self._entry is not None:
+                # Even with the same key its frames may be of another meter
+                self._entry[1].cancel()
+            future = self._executor.submit(inspect)
+            self._entry = (key, future, time.monotonic())
+            return future
+
+    def take(self, key):
+        with self._lock:
+            entry, self._entry = self._entry, None
+        if entry is None:
+            return None
+        entry_key, future, started = entry
+        if entry_key != key or time.monotonic() - started > self.ttl:
+            future.cancel()
+            self.misses += 1
+            return None
+        self.hits += 1
+        return future
+
+    def discard(self):
+        with self._lock:
+            entry, self._entry = self._entry, None
+        if entry is not None:
+            entry[1].cancel()
@@ -0,0 +1,166 @@
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from skimage.metrics import structural_similarity as ssim
+
+from feature_detectors import DETECTOR, detect_features
+from feature_matching import match_features
+from master_features import master_cache, normalize_roi, roi_geometry
+
+REFERENCE_PATH = "diff_ref.png"
+# SSIM is computed on the difference resized by this factor, 1.0 for full size
+SSIM_SCALE = 1.0
+# Reference masks kept, one per reference file version and master size
+REFERENCE_CACHE_SIZE = 8
+
+_reference_masks = OrderedDict()
+_reference_lock = threading.Lock()
+
+
+def preprocess_image(image):
+    # Convert to grayscale
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return gray
+
+
+def reference_mask(shape, path=REFERENCE_PATH):
+    """The thresholded reference difference at this master size, loaded once.
+
+    Cached per file and size, least recently used first out; a changed file
+    (new mtime) is reloaded.
+    """
+    height, width = shape[:2]
+    entry = (os.path.abspath(path), os.path.getmtime(path), width, height)
+    with _reference_lock:
+        mask = _reference_masks.get(entry)
+        if mask is not None:
+            _reference_masks.move_to_end(entry)
+            return mask
+    mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if mask is None:
+        raise ValueError(f"Could not read reference difference {path}")
+    mask = cv2.resize(mask, (width, height))
+    mask = cv2.threshold(mask, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+    with _reference_lock:
+        _reference_masks[entry] = mask
+        while len(_reference_masks) > REFERENCE_CACHE_SIZE:
+            _reference_masks.popitem(last=False)
+    return mask
+
+
+def ssim_region(image, scale=SSIM_SCALE, roi=None):
+    """Crop image to the ROI bounding box and resize it for SSIM."""
+    if roi:
+        (x, y, w, h), _ = roi_geometry(image.shape, roi)
+        image = image[y : y + h, x : x + w]
+    if scale != 1.0:
+        image = cv2.resize(
+            image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+        )
+    return image
+
+
+def master_contours(features):
+    """External contours of the master's threshold, found once per master.
+
+    Kept on the features, so they leave with them from master_cache.
+    """
+    return features.mask_contours
+
+
+def align_images(master, input, detector=DETECTOR, features=None):
+    # Master keypoints, descriptors and threshold come from the master
+    # feature cache instead of being recomputed for every frame
+    if features is None:
+        features = master_cache.get(master, detector=detector)
+    input_preprocessed = preprocess_image(input)
+    keypoints2, descriptors2 = detect_features(input_preprocessed, detector)
+    master_idx, frame_idx = match_features(features, descriptors2, "bf")
+    if len(master_idx) >= 4:
+        pts1 = np.float32(features.points[master_idx]).reshape(-1, 1, 2)
+        pts2 = np.float32([keypoints2[i].pt for i in frame_idx]).reshape(-1, 1, 2)
+
+        # Use RANSAC with refined parameters
+        H, mask = cv2.findHomography(pts2, pts1, cv2.RANSAC, 2.0)
+
+        # ...rest of your existing alignment code...
+        aligned_image = cv2.warpPerspective(
+            input, H, (master.shape[1], master.shape[0])
+        )
+        mask_master = np.asarray(features.mask_master)
+        mask_contours = master_contours(features)
+        aligned_image_gray = cv2.cvtColor(aligned_image, cv2.COLOR_BGR2GRAY)
+        aligned_thresh = cv2.threshold(
+            aligned_image_gray, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
+        )[1]
+        result = cv2.bitwise_or(mask_master, aligned_thresh)
+        result = cv2.threshold(result, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)[1]
+
+        return result, aligned_image, mask_contours, mask_master
+    else:
+        raise ValueError("Not enough good matches found for alignment")
+
+
+def find_defect(
+    master,
+    images,
+    detector=DETECTOR,
+    reference=REFERENCE_PATH,
+    ssim_scale=SSIM_SCALE,
+    ssim_roi=None,
+):
+    """Compare each frame's difference with the reference difference by SSIM.
+
+    images are BGR frames or paths. ssim_scale and ssim_roi (normalised
+    [x, y, w, h] regions) restrict SSIM to a smaller image; the threshold
+    and contour checks are unchanged.
+    """
+    ssim_roi = normalize_roi(ssim_roi)
+    mask = reference_mask(master.shape, reference)
+    mask_region = ssim_region(mask, ssim_scale, ssim_roi)
+    features = master_cache.get(master, detector=detector)
+    ssim_values = [0, 0, 0, 0]
+    classes = [0, 0, 0, 0]
+    differences = [None, None, None, None]
+    for i, input in enumerate(images):
+        if isinstance(input, str):
+            input = cv2.imread(input)
+        input = cv2.resize(input, (master.shape[1], master.shape[0]))
+        difference, aligned_image, mask_contours, mask_master = align_images(
+            master, input, detector, features
+        )
+        _, thresholded_diff = cv2.threshold(
+            difference, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU
+        )
+        diff2 = cv2.absdiff(mask, thresholded_diff)
+        similarity_score = ssim(ssim_region(diff2, ssim_scale, ssim_roi), mask_region)
+        ssim_values[i] = similarity_score
+        differences[i] = diff2
+        print(similarity_score)
+        if similarity_score > 0.85:
+            contours, _ = cv2.findContours(
+                thresholded_diff, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+            )
+            highlighted_image = aligned_image.copy()
+            cnt = 0
+            for contour in contours:
+                found = False
+                for c in mask_contours:
+                    if cv2.matchShapes(contour, c, 1, 0.0) < 15:
+                        found = True
+                        break
+                if found:
+                    cv2.drawContours(highlighted_image, [contour], -1, (0, 0, 255), 2)
+                    cnt += 1
+                    classes[i] = 1
+    if classes.count(1) > 2:
+        return None, True
+    idx_arr = [ssim_values[i] for i in range(4) if classes[i] == 0]
+    print(ssim_values)
+    print(idx_arr)
+    print(classes)
+    max_idx = ssim_values.index(max(idx_arr))
+    return differences[max_idx], False
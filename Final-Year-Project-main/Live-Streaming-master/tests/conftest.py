@@ -0,0 +1,33 @@
+import os
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+import pytest
+
+# Modules read their settings from the environment when imported; keep the
+# tests off the station's store and camera
+os.environ.setdefault("MASTER_STORE_DIR", tempfile.mkdtemp(prefix="master_store_"))
+os.environ.setdefault("CAMERA", "simulated")
+if "SIMULATED_CAMERA_DIR" not in os.environ:
+    frames_dir = tempfile.mkdtemp(prefix="simulated_camera_")
+    for i in range(3):
+        frame = np.zeros((480, 640, 3), np.uint8)
+        cv2.rectangle(frame, (100 + 20 * i, 100), (300 + 20 * i, 300), (255,) * 3, -1)
+        cv2.imwrite(os.path.join(frames_dir, f"frame_{i}.png"), frame)
+    os.environ["SIMULATED_CAMERA_DIR"] = frames_dir
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def new_app(tmp_path_factory):
+    """The vision service on the simulated camera, run from a scratch dir."""
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("new_app"))
+    try:
+        import new_app
+    finally:
+        os.chdir(cwd)
+    return new_app
@@ -0,0 +1,83 @@
+import threading
+
+import numpy as np
+
+from auto_capture import AutoCapture, StabilityDetector
+
+
+def empty():
+    return np.full((120, 160, 3), 40, np.uint8)
+
+
+def placed(x=40):
+    frame = empty()
+    frame[30:90, x : x + 60] = 220
+    return frame
+
+
+def feed(detector, frames):
+    return [detector.feed(frame) for frame in frames]
+
+
+def test_triggers_once_when_a_meter_comes_to_rest():
+    detector = StabilityDetector(still_frames=3)
+    triggers = feed(detector, [empty()] * 3 + [placed()] * 6)
+    assert triggers == [False] * 6 + [True, False, False]
+    assert detector.state == "triggered"
+    assert detector.status()["change"] > detector.change_threshold
+
+
+def test_moving_meter_does_not_trigger():
+    detector = StabilityDetector(still_frames=3)
+    moving = [placed(x) for x in range(10, 100, 10)]
+    assert not any(feed(detector, [empty()] + moving))
+    assert detector.state == "waiting"
+    assert detector.still < 3
+
+
+def test_next_meter_triggers_after_the_fixture_is_cleared():
+    detector = StabilityDetector(still_frames=2)
+    frames = [empty()] + [placed()] * 3 + [empty()] * 3 + [placed(60)] * 3
+    assert sum(feed(detector, frames)) == 2
+    # A meter left in place does not trigger again
+    assert not any(feed(detector, [placed(60)] * 5))
+
+
+def test_background_follows_lighting_drift():
+    detector = StabilityDetector(still_frames=2)
+    frames = [empty()] + [np.full((120, 160, 3), v, np.uint8) for v in range(40, 80)]
+    assert not any(feed(detector, frames))
+    assert detector.state == "waiting"
+
+
+def test_auto_capture_publishes_triggers_and_results():
+    frames = iter([empty()] + [placed()] * 50)
+    lock = threading.Lock()
+
+    def grab():
+        with lock:
+            return next(frames, placed())
+
+    auto = AutoCapture(grab, interval=0)
+    events = auto.subscribe()
+    auto.start(lambda: {"res": "pass"}, StabilityDetector(still_frames=2))
+    received = []
+    while ("result", {"res": "pass"}) not in received:
+        received.append(events.get(timeout=5))
+    auto.stop()
+    names = [event for event, _ in received]
+    assert names[0] == "state"
+    assert names[-2:] == ["triggered", "result"]
+    assert auto.status()["inspections"] == 1
+    assert not auto.running
+
+
+def test_slow_subscriber_does_not_block_publishing():
+    auto = AutoCapture(lambda: empty())
+    events = auto.subscribe()
+    for i in range(100):
+        auto.publish("state", {"i": i})
+    assert events.full()
+    auto.unsubscribe(events)
+    auto.publish("state", {})
+    assert events.qsize() == events.maxsize
@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+import camera
+from camera import CameraError, SimulatedCamera, aoi_rect
+
+
+def sensor_frames(count=2, size=(8, 16)):
+    """Frames whose pixel values encode their row, column and index."""
+    height, width = size
+    rows, cols = np.mgrid[0:height, 0:width]
+    return [
+        np.dstack([rows * 10, cols * 10, np.full_like(rows, i)]).astype(np.uint8)
+        for i in range(count)
+    ]
+
+
+def test_aoi_rect_rounds_to_sensor_steps():
+    assert aoi_rect((640, 480)) == (0, 0, 640, 480)
+    assert aoi_rect((640, 480), (0.1, 0.1, 0.5, 0.5), (8, 4)) == (64, 48, 320, 240)
+    assert aoi_rect((100, 100), (0.9, 0.9, 0.5, 0.5)) == (90, 90, 10, 10)
+    with pytest.raises(CameraError):
+        aoi_rect((100, 100), (0.5, 0.5, 0.0, 0.5))
+
+
+def test_simulated_camera_replays_full_frames_in_order():
+    frames = sensor_frames(count=2)
+    cam = SimulatedCamera(frames)
+    assert cam.shape == (8, 16, 3)
+    grabbed = [cam.grab() for _ in range(3)]
+    for frame, expected in zip(grabbed, [frames[0], frames[1], frames[0]]):
+        np.testing.assert_array_equal(frame, expected)
+
+
+def test_configure_only_changes_format_once():
+    cam = SimulatedCamera(sensor_frames())
+    assert not cam.configure()
+    assert cam.configure(aoi=[0.5, 0.5, 0.5, 0.5])
+    assert not cam.configure(aoi=(0.5, 0.5, 0.5, 0.5))
+
+
+def test_simulated_aoi_crops_the_sensor():
+    cam = SimulatedCamera(sensor_frames())
+    cam.configure(aoi=(0.5, 0.25, 0.5, 0.5))
+    frame = cam.grab()
+    assert frame.shape == cam.shape == (4, 8, 3)
+    # Top-left pixel is sensor row 2, column 8
+    assert tuple(frame[0, 0, :2]) == (20, 80)
+    assert frame.flags["C_CONTIGUOUS"]
+
+
+def test_simulated_binning_averages_blocks():
+    cam = SimulatedCamera(sensor_frames())
+    cam.configure(binning=2)
+    frame = cam.grab()
+    assert frame.shape == cam.shape == (4, 8, 3)
+    # Mean of rows 0-1 and columns 0-1
+    assert tuple(frame[0, 0, :2]) == (5, 5)
+
+
+def test_simulated_subsampling_skips_pixels():
+    cam = SimulatedCamera(sensor_frames())
+    cam.configure(aoi=(0.0, 0.0, 1.0, 0.5), subsampling=4)
+    frame = cam.grab()
+    assert frame.shape == cam.shape == (1, 4, 3)
+    assert [int(v) for v in frame[0, :, 1]] == [0, 40, 80, 120]
+
+
+@pytest.mark.parametrize(
+    "settings", [{"binning": 3}, {"subsampling": 8}, {"binning": 2, "subsampling": 2}]
+)
+def test_unsupported_formats_are_rejected(settings):
+    cam = SimulatedCamera(sensor_frames())
+    with pytest.raises(CameraError):
+        cam.configure(**settings)
+    assert cam.shape == (8, 16, 3)
+
+
+def test_open_camera_needs_pyueye_for_the_real_camera(monkeypatch):
+    monkeypatch.setattr(camera, "CAMERA", "ueye")
+    monkeypatch.setattr(camera, "ueye", None)
+    with pytest.raises(CameraError):
+        camera.open_camera()
+
+
+def test_camera_format_configures_the_simulated_camera(new_app):
+    assert isinstance(new_app.camera, SimulatedCamera)
+    client = new_app.app.test_client()
+    height, width = new_app.camera.sensor_size[1], new_app.camera.sensor_size[0]
+    try:
+        response = client.post(
+            "/camera_format", json={"vision_configure": {"binning": 2}}
+        )
+        assert response.json == {
+            "width": width // 2,
+            "height": height // 2,
+            "changed": True,
+        }
+        assert new_app.camera.grab().shape == (height // 2, width // 2, 3)
+        response = client.post(
+            "/camera_format", json={"vision_configure": {"binning": 2}}
+        )
+        assert not response.json["changed"]
+    finally:
+        client.post("/camera_format", json={})
+    assert new_app.camera.shape == (height, width, 3)
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from defect_heatmap import DefectHeatmapStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DefectHeatmapStore(str(tmp_path))
+
+
+def mask(*pixels, shape=(32, 48)):
+    mask = np.zeros(shape, np.uint8)
+    for y, x in pixels:
+        mask[y, x] = 255
+    return mask
+
+
+def test_add_counts_defective_pixels(store):
+    assert store.add("m1", "k1", mask((1, 2), (3, 4))) == 1
+    assert store.add("m1", "k1", mask((1, 2))) == 2
+    counts, meta = store.load("m1", "k1")
+    assert counts.dtype == np.uint32
+    assert meta == {"inspections": 2, "shape": [32, 48]}
+    assert counts[1, 2] == 2 and counts[3, 4] == 1
+    assert int(counts.sum()) == 3
+
+
+def test_masters_of_a_model_are_counted_apart(store):
+    store.add("m1", "old", mask((0, 0)))
+    store.add("m1", "new", mask((5, 5), shape=(16, 16)))
+    assert store.load("m1", "old")[1]["inspections"] == 1
+    # Without a key the most recently updated master is used
+    assert store.load("m1")[1]["shape"] == [16, 16]
+    assert store.load("m2") == (None, None)
+
+
+def test_add_rejects_a_mask_of_another_size(store):
+    store.add("m1", "k1", mask())
+    with pytest.raises(ValueError):
+        store.add("m1", "k1", mask(shape=(16, 16)))
+    assert store.load("m1", "k1")[1]["inspections"] == 1
+
+
+def test_hotspots_rank_cells_by_count(store):
+    for _ in range(4):
+        store.add("m1", "k1", mask((0, 0), (0, 1), (20, 40)))
+    store.add("m1", "k1", mask((20, 40)))
+    hotspots = store.hotspots("m1", "k1", cell=16)
+    assert hotspots["inspections"] == 5
+    spots = hotspots["hotspots"]
+    # Empty cells are left out
+    assert len(spots) == 2
+    assert spots[0]["roi"] == [0.0, 0.0, 0.3333, 0.5]
+    assert spots[0]["count"] == 8
+    # rate is the mean per-pixel defect frequency of the cell
+    assert spots[0]["rate"] == round(8 / (16 * 16 * 5), 4)
+    assert spots[1] == {"roi": [0.6667, 0.5, 0.3333, 0.5], "count": 5, "rate": 0.0039}
+
+
+def test_hotspots_cover_partial_edge_cells(store):
+    store.add("m1", "k1", mask((31, 47)))
+    spots = store.hotspots("m1", "k1", top=1, cell=20)["hotspots"]
+    assert spots == [
+        {"roi": [0.8333, 0.625, 0.1667, 0.375], "count": 1, "rate": 0.0104}
+    ]
+    assert store.hotspots("m2") is None
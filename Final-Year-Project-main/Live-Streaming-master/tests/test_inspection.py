@@ -0,0 +1,341 @@
+import itertools
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from homography_cache import homography_cache
+from inspection import (
+    SHAPE_MATCH_THRESHOLD,
+    align_images,
+    analyse_frame,
+    clean_image,
+    estimate_homography,
+    frames_to_decide,
+    match_contours,
+    preprocess_image,
+    pyramid_homography,
+    screen_frame,
+    verify_homography,
+    vision_settings,
+    vote_decided,
+)
+from master_features import (
+    compute_master_features,
+    master_cache,
+    normalize_roi,
+    roi_geometry,
+)
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def sample(name, flags=cv2.IMREAD_COLOR):
+    return cv2.imread(os.path.join(SAMPLES, name), flags)
+
+
+def clean_image_loop(image):
+    """clean_image as it was before it was vectorised."""
+    num_labels, labels = cv2.connectedComponents(image)
+    output_image = np.zeros_like(image, dtype=np.uint8)
+    component_sizes = np.bincount(labels.ravel())
+    for label in range(1, num_labels):
+        if component_sizes[label] > 30:
+            coords = np.argwhere(labels == label)
+            min_y, min_x = coords.min(axis=0)
+            max_y, max_x = coords.max(axis=0)
+            width, height = max_x - min_x, max_y - min_y
+            if (width < 2 and height < 1000) or (height < 2 and width < 1000):
+                output_image[labels == label] = 0
+            else:
+                output_image[labels == label] = 255
+    return output_image
+
+
+def edge_masks():
+    empty = np.zeros((64, 64), np.uint8)
+    pixel = empty.copy()
+    pixel[10, 10] = 255
+    # 30 pixels is not above the size threshold, 31 is
+    at_threshold = empty.copy()
+    at_threshold[5:11, 5:10] = 255
+    at_threshold[20, 20:50] = 255
+    above_threshold = at_threshold.copy()
+    above_threshold[11, 5] = 255
+    # Thin lines are excluded however long they are
+    lines = empty.copy()
+    lines[2:62, 40] = 255
+    lines[60, 2:62] = 255
+    lines[30:33, 2:30] = 255
+    full = np.full((64, 64), 255, np.uint8)
+    return [empty, pixel, at_threshold, above_threshold, lines, full]
+
+
+@pytest.mark.parametrize("mask", edge_masks())
+def test_clean_image_matches_loop_on_edge_cases(mask):
+    np.testing.assert_array_equal(clean_image(mask), clean_image_loop(mask))
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_clean_image_matches_loop_on_random_masks(seed):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros((240, 320), np.uint8)
+    for _ in range(60):
+        x, y = rng.integers(0, 320), rng.integers(0, 240)
+        w, h = rng.integers(1, 40), rng.integers(1, 40)
+        mask[y : y + h, x : x + w] = 255
+    mask[rng.random(mask.shape) < 0.02] = 255
+    result = clean_image(mask)
+    assert result.dtype == np.uint8
+    np.testing.assert_array_equal(result, clean_image_loop(mask))
+
+
+def match_contours_loop(contours, master_contours):
+    """match_contours as it was before the Hu moments were vectorised."""
+    return [
+        any(
+            cv2.matchShapes(contour, master_contour, 1, 0.0) < SHAPE_MATCH_THRESHOLD
+            for master_contour in master_contours
+        )
+        for contour in contours
+    ]
+
+
+@pytest.mark.parametrize(
+    "name", ["cleaned_diff0.png", "cleaned_diff1.png", "diff0.png", "master.png"]
+)
+def test_match_contours_matches_match_shapes(name):
+    features = compute_master_features(sample("master.png"))
+    _, thresholded = cv2.threshold(
+        sample(name, cv2.IMREAD_GRAYSCALE), 127, 255, cv2.THRESH_BINARY
+    )
+    contours = cv2.findContours(
+        thresholded, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )[0]
+    matched = match_contours(contours, features)
+    expected = match_contours_loop(contours, features.master_cont)
+    assert int(matched.sum()) == sum(expected)
+    assert matched.tolist() == expected
+
+
+@pytest.mark.parametrize("name", ["diff0.png", "diff1.png", "diff2.png"])
+def test_clean_image_matches_loop_on_sample_diffs(name):
+    _, mask = cv2.threshold(
+        sample(name, cv2.IMREAD_GRAYSCALE), 127, 255, cv2.THRESH_BINARY_INV
+    )
+    np.testing.assert_array_equal(clean_image(mask), clean_image_loop(mask))
+
+
+@pytest.mark.parametrize(
+    "classes, window, early, decided",
+    [
+        # Two passes of three already make the majority
+        ([1, 1], 3, True, True),
+        ([0, 0], 3, True, True),
+        ([1, 0], 3, True, False),
+        ([1, 1, 1], 5, True, True),
+        ([0, 1, 0, 0], 7, True, False),
+        ([0, 1, 0, 0, 0], 7, True, True),
+        # Every frame of the window is analysed
+        ([1, 1], 3, False, False),
+        ([1, 1, 0], 3, False, True),
+    ],
+)
+def test_vote_decided(classes, window, early, decided):
+    assert vote_decided(classes, window, early) is decided
+
+
+def vote(results, window, early):
+    """Frames find_defect analyses of results before its vote is decided."""
+    classes = []
+    for result in results:
+        classes.append(result)
+        if vote_decided(classes, window, early):
+            break
+    return classes
+
+
+@pytest.mark.parametrize("early", [True, False])
+@pytest.mark.parametrize("window", [3, 5, 7])
+def test_vote_verdict_matches_the_full_window(window, early):
+    for results in itertools.product([0, 1], repeat=window):
+        classes = vote(results, window, early)
+        if not early:
+            assert len(classes) == window
+        passed = classes.count(1) >= window // 2 + 1
+        assert passed == (list(results).count(1) >= window // 2 + 1)
+
+
+@pytest.mark.parametrize("early", [True, False])
+@pytest.mark.parametrize("window", [3, 5, 7])
+def test_frames_to_decide_is_the_fewest_frames_that_could(window, early):
+    for analysed in range(window):
+        for classes in itertools.product([0, 1], repeat=analysed):
+            classes = list(classes)
+            if vote_decided(classes, window, early):
+                continue
+            needed = frames_to_decide(classes, window, early)
+            if not early:
+                assert needed == window - analysed
+            decided_after = [
+                min(
+                    n
+                    for n in range(1, window - analysed + 1)
+                    if vote_decided(classes + list(more[:n]), window, early)
+                )
+                for more in itertools.product([0, 1], repeat=window - analysed)
+            ]
+            assert min(decided_after) == needed
+
+
+def screened_frames(master):
+    """Clean frames of the master and frames with a mark erased or added."""
+    noise = np.random.default_rng(0).integers(0, 8, master.shape, dtype=np.uint8)
+    yield "clean", master.copy()
+    yield "noise", cv2.add(master, noise)
+    yield "shifted", np.roll(master, 1, axis=1)
+    for x, y in [(50, 100), (100, 200), (20, 300), (150, 50)]:
+        for name, colour in [("erased", 255), ("added", 0)]:
+            frame = master.copy()
+            cv2.rectangle(frame, (x, y), (x + 15, y + 15), (colour,) * 3, -1)
+            yield f"{name} at {x},{y}", frame
+
+
+@pytest.fixture
+def screened_master():
+    master = sample("master.png")
+    features = compute_master_features(master)
+    # The meter sits exactly where it was when the master was taken
+    homography_cache.put(features, np.eye(3))
+    yield master, features
+    homography_cache.invalidate(features)
+
+
+def test_screen_pass_implies_analysis_pass(screened_master):
+    master, features = screened_master
+    settings = vision_settings()
+    verdicts = []
+    for name, frame in screened_frames(master):
+        screened = screen_frame(features, frame, settings, {})
+        contours, counter, _ = analyse_frame(
+            master, frame, features, dict(settings, screen=False), {}
+        )
+        passed = contours == 0 and counter == 0
+        assert passed or not screened, name
+        verdicts.append((screened, passed))
+    # Neither side of the implication is vacuous on these frames
+    assert (True, True) in verdicts
+    assert (False, False) in verdicts
+
+
+def known_warp(master, angle=1.5, shift=(6, -4)):
+    """master as seen after a small rotation and shift, and that warp."""
+    a = np.deg2rad(angle)
+    T = np.array(
+        [[np.cos(a), -np.sin(a), shift[0]], [np.sin(a), np.cos(a), shift[1]], [0, 0, 1]]
+    )
+    height, width = master.shape[:2]
+    frame = cv2.warpPerspective(master, T, (width, height), borderValue=(255,) * 3)
+    return frame, T
+
+
+def corner_error(H, expected, shape):
+    height, width = shape[:2]
+    corners = np.float32([[0, 0], [width, 0], [0, height], [width, height]])
+    corners = corners.reshape(-1, 1, 2)
+    return np.abs(
+        cv2.perspectiveTransform(corners, H)
+        - cv2.perspectiveTransform(corners, expected)
+    ).max()
+
+
+@pytest.mark.parametrize("levels", [1, 2])
+def test_pyramid_homography_with_ecc_recovers_a_known_warp(levels):
+    master = sample("master.png")
+    frame, T = known_warp(master)
+    settings = vision_settings(
+        {"alignment": "pyramid", "pyramid_levels": levels, "refine": "ecc"}
+    )
+    features = master_cache.get(master, detector=settings["detector"])
+    stats = {}
+    H = pyramid_homography(master, features, preprocess_image(frame), settings, stats)
+    assert stats["scale"] == 0.5**levels
+    assert stats["refined"]
+    # H maps the frame back onto the master
+    assert corner_error(H, np.linalg.inv(T), master.shape) < 0.5
+
+
+def test_roi_mask_restricts_keypoints():
+    master = sample("master.png")
+    roi = normalize_roi([[0.05, 0.05, 0.4, 0.3], [0.5, 0.6, 0.4, 0.3]])
+    full = compute_master_features(master)
+    features = compute_master_features(master, roi=roi)
+    (x, y, w, h), mask = roi_geometry(master.shape, roi)
+    inside = np.zeros(master.shape[:2], np.uint8)
+    inside[y : y + h, x : x + w] = mask
+    points = features.points.astype(int)
+    assert 0 < len(points) < len(full.points)
+    assert inside[points[:, 1], points[:, 0]].all()
+    # Differencing ignores everything outside the regions too
+    assert not np.asarray(features.master_thresh)[inside == 0].any()
+    assert not np.asarray(features.mask_master)[inside == 0].any()
+    # and frames are only searched around them
+    settings = vision_settings()
+    gray = preprocess_image(master)
+    stats, full_stats = {}, {}
+    estimate_homography(features, gray, settings, stats)
+    estimate_homography(full, gray, settings, full_stats)
+    assert stats["keypoints"] < full_stats["keypoints"]
+
+
+@pytest.fixture
+def model_features():
+    """Features of master.png and of a retaken master, for one model."""
+    master = sample("master.png")
+    retaken = cv2.flip(master, 0)
+    features = compute_master_features(master)
+    new_features = compute_master_features(retaken)
+    for f in (features, new_features):
+        f.model_id = "reuse-test"
+    yield master, features, retaken, new_features
+    for f in (features, new_features):
+        homography_cache.invalidate(f)
+
+
+def test_cached_homography_is_reused_only_when_verified(model_features):
+    master, features, _, _ = model_features
+    settings = vision_settings()
+    homography_cache.put(features, np.eye(3))
+    stats = {}
+    align_images(master, master, features, settings, stats)
+    assert stats["homography"] == "reused"
+    assert stats["reuse_cc"] >= settings["reuse_min_cc"]
+    # The meter moved in the jig: the coarse ECC check fails and the
+    # homography is estimated again, then cached
+    frame, T = known_warp(master, angle=3, shift=(15, 10))
+    stats = {}
+    align_images(master, frame, features, settings, stats)
+    assert stats["reuse_cc"] < settings["reuse_min_cc"]
+    assert stats["homography"] == "estimated"
+    assert (
+        corner_error(homography_cache.get(features), np.linalg.inv(T), master.shape) < 1
+    )
+
+
+def test_cached_homography_is_rejected_after_the_master_changes(model_features):
+    master, features, retaken, new_features = model_features
+    settings = vision_settings()
+    homography_cache.put(features, np.eye(3))
+    assert homography_cache.get(new_features) is None
+    stats = {}
+    align_images(retaken, retaken, new_features, settings, stats)
+    assert stats["homography"] == "estimated"
+    assert "reuse_cc" not in stats
+    # Even checked against the new master, the old homography fails
+    assert (
+        verify_homography(
+            new_features, preprocess_image(master), np.eye(3), settings, {}
+        )
+        is None
+    )
@@ -0,0 +1,106 @@
+import json
+import threading
+import time
+
+from inspection_jobs import InspectionJobs
+
+
+def error_status(error):
+    return str(error), 422
+
+
+def wait_for(job, timeout=5):
+    deadline = time.monotonic() + timeout
+    while job.status not in ("done", "failed") and time.monotonic() < deadline:
+        time.sleep(0.001)
+    return job
+
+
+def parse(stream):
+    events = []
+    for message in stream:
+        if message.startswith(":"):
+            continue
+        event, data = message.strip().split("\n")
+        events.append((event[len("event: ") :], json.loads(data[len("data: ") :])))
+    return events
+
+
+def test_job_result_and_frames_are_kept():
+    jobs = InspectionJobs(error_status)
+
+    def run(on_frame):
+        on_frame({"frame": 0, "verdict": "pass"})
+        return {"res": "pass"}
+
+    job = wait_for(jobs.submit(run))
+    summary = job.summary()
+    assert summary["status"] == "done"
+    assert summary["result"] == {"res": "pass"}
+    assert summary["frames"] == [{"frame": 0, "verdict": "pass"}]
+    assert jobs.get(job.id) is job
+    assert jobs.active() == 0
+
+
+def test_failed_job_reports_mapped_error():
+    jobs = InspectionJobs(error_status)
+
+    def run(on_frame):
+        raise ValueError("blurred")
+
+    job = wait_for(jobs.submit(run))
+    assert job.summary()["error"] == {"error": "blurred", "status": 422}
+
+
+def test_finished_jobs_expire_after_ttl():
+    jobs = InspectionJobs(error_status, ttl=0)
+    release = threading.Event()
+    finished = wait_for(jobs.submit(lambda on_frame: "done"))
+    running = jobs.submit(lambda on_frame: release.wait(5))
+    time.sleep(0.01)
+    # Expired jobs are pruned when the next one is submitted
+    latest = jobs.submit(lambda on_frame: "done")
+    assert jobs.get(finished.id) is None
+    assert jobs.get(running.id) is running
+    release.set()
+    wait_for(running)
+    wait_for(latest)
+
+
+def test_stream_replays_events_to_a_late_subscriber():
+    jobs = InspectionJobs(error_status)
+
+    def run(on_frame):
+        on_frame({"frame": 0})
+        on_frame({"frame": 1})
+        return {"res": "fail"}
+
+    job = wait_for(jobs.submit(run))
+    assert parse(job.stream()) == [
+        ("status", {"status": "queued"}),
+        ("status", {"status": "running"}),
+        ("frame", {"frame": 0}),
+        ("frame", {"frame": 1}),
+        ("result", {"res": "fail"}),
+        ("status", {"status": "done"}),
+    ]
+
+
+def test_stream_follows_a_running_job():
+    jobs = InspectionJobs(error_status)
+    release = threading.Event()
+
+    def run(on_frame):
+        on_frame({"frame": 0})
+        release.wait(5)
+        return {"res": "pass"}
+
+    job = jobs.submit(run)
+    stream = job.stream()
+    received = []
+    for message in stream:
+        received.append(message)
+        if "event: frame" in message:
+            release.set()
+    events = parse(received)
+    assert events[-2:] == [("result", {"res": "pass"}), ("status", {"status": "done"})]
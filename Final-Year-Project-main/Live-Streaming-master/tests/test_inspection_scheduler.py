@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+
+from inspection_scheduler import InspectionScheduler, SchedulerFull
+
+
+def hold(scheduler):
+    """Occupy a slot on another thread until the returned event is set."""
+    admitted, release = threading.Event(), threading.Event()
+
+    def run():
+        with scheduler.admit():
+            admitted.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert admitted.wait(5)
+    return release, thread
+
+
+def test_rejects_when_running_and_queue_are_full():
+    scheduler = InspectionScheduler(concurrency=1, max_queue=0)
+    release, thread = hold(scheduler)
+    with pytest.raises(SchedulerFull) as full:
+        with scheduler.admit():
+            pass
+    release.set()
+    thread.join()
+    assert full.value.status["running"] == 1
+    assert full.value.status["retry_after"] >= 1
+    assert scheduler.rejected == 1
+
+
+def test_slot_is_released_when_the_inspection_fails():
+    scheduler = InspectionScheduler(concurrency=1, max_queue=0)
+    with pytest.raises(RuntimeError):
+        with scheduler.admit():
+            raise RuntimeError("camera")
+    with scheduler.admit() as admission:
+        assert admission["queue_position"] == 0
+    status = scheduler.status()
+    assert (status["running"], status["completed"]) == (0, 2)
+
+
+def test_waiting_inspection_gets_the_next_slot():
+    scheduler = InspectionScheduler(concurrency=1, max_queue=1, timeout=5)
+    release, thread = hold(scheduler)
+    admissions = []
+
+    def wait():
+        with scheduler.admit() as admission:
+            admissions.append(admission)
+
+    waiter = threading.Thread(target=wait)
+    waiter.start()
+    while scheduler.status()["waiting"] == 0:
+        time.sleep(0.001)
+    # The queue is full now
+    with pytest.raises(SchedulerFull):
+        with scheduler.admit():
+            pass
+    release.set()
+    thread.join()
+    waiter.join()
+    assert admissions[0]["queue_position"] == 0
+    assert admissions[0]["queue_wait_ms"] > 0
+    assert scheduler.status()["waiting"] == 0
+
+
+def test_waiting_inspection_times_out():
+    scheduler = InspectionScheduler(concurrency=1, max_queue=1, timeout=0.05)
+    release, thread = hold(scheduler)
+    with pytest.raises(SchedulerFull, match="Timed out"):
+        with scheduler.admit():
+            pass
+    release.set()
+    thread.join()
+    assert scheduler.status()["waiting"] == 0
+
+
+def test_capture_answers_429_with_retry_after(new_app, monkeypatch):
+    scheduler = InspectionScheduler(concurrency=1, max_queue=0)
+    monkeypatch.setattr(new_app, "inspection_scheduler", scheduler)
+    new_app.speculative_inspection.discard()
+    release, thread = hold(scheduler)
+    try:
+        response = new_app.app.test_client().post(
+            "/capture",
+            json={"model_type": "ABC", "master": "data:image/png;base64,AAAA"},
+        )
+    finally:
+        release.set()
+        thread.join()
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == str(response.json["retry_after"])
+    assert response.json["running"] == 1
+
+
+def test_camera_format_waits_for_the_running_inspection(new_app, monkeypatch):
+    scheduler = InspectionScheduler(concurrency=1, max_queue=1, timeout=5)
+    monkeypatch.setattr(new_app, "inspection_scheduler", scheduler)
+    release, thread = hold(scheduler)
+    shapes = []
+
+    def change_format():
+        response = new_app.app.test_client().post(
+            "/camera_format", json={"vision_configure": {"binning": 2}}
+        )
+        shapes.append(response.json)
+
+    client = threading.Thread(target=change_format)
+    client.start()
+    while scheduler.status()["waiting"] == 0:
+        time.sleep(0.001)
+    # The inspection's frames keep the format it started with
+    assert new_app.camera.format[1] == 1
+    release.set()
+    thread.join()
+    client.join()
+    assert shapes[0]["changed"]
+    assert scheduler.status()["completed"] == 1
+    new_app.app.test_client().post("/camera_format", json={})
+
+
+def test_camera_format_is_rejected_when_the_queue_is_full(new_app, monkeypatch):
+    scheduler = InspectionScheduler(concurrency=1, max_queue=0)
+    monkeypatch.setattr(new_app, "inspection_scheduler", scheduler)
+    release, thread = hold(scheduler)
+    try:
+        response = new_app.app.test_client().post(
+            "/camera_format", json={"vision_configure": {"binning": 2}}
+        )
+    finally:
+        release.set()
+        thread.join()
+    assert response.status_code == 429
+    assert new_app.camera.format[1] == 1
+
+
+def test_concurrent_rejections_are_all_counted():
+    scheduler = InspectionScheduler(concurrency=1, max_queue=0)
+    threads = [
+        threading.Thread(target=lambda: [scheduler.reject("full") for _ in range(500)])
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert scheduler.rejected == 4000
@@ -0,0 +1,211 @@
+import copy
+import os
+import threading
+import types
+from datetime import timedelta
+
+import numpy as np
+import pytest
+
+import job_queue
+from inspection import ImageProcessingError
+from job_queue import MongoJobQueue, run_worker, utcnow
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition):
+                return False
+            continue
+        value = doc.get(key)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+            continue
+        for op, operand in condition.items():
+            if op == "$lt" and not (value is not None and value < operand):
+                return False
+            if op == "$gte" and not (value is not None and value >= operand):
+                return False
+            if op == "$in" and value not in operand:
+                return False
+            if op == "$ne" and value == operand:
+                return False
+    return True
+
+
+class FakeCollection:
+    """The part of a pymongo collection MongoJobQueue uses, in memory."""
+
+    def __init__(self):
+        self.docs = {}
+        self.lock = threading.Lock()
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def insert_one(self, doc):
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+
+    def _first(self, query, sort=None):
+        docs = list(self.docs.values())
+        if sort:
+            docs.sort(key=lambda d: d[sort[0][0]])
+        return next((d for d in docs if matches(d, query)), None)
+
+    @staticmethod
+    def _update(doc, update):
+        doc.update(copy.deepcopy(update.get("$set", {})))
+        for key, step in update.get("$inc", {}).items():
+            doc[key] = doc.get(key, 0) + step
+
+    def find(self, query, projection=None):
+        with self.lock:
+            return [copy.deepcopy(d) for d in self.docs.values() if matches(d, query)]
+
+    def find_one_and_update(
+        self, query, update, projection=None, sort=None, return_document=False
+    ):
+        with self.lock:
+            doc = self._first(query, sort)
+            if doc is None:
+                return None
+            before = copy.deepcopy(doc)
+            self._update(doc, update)
+            return copy.deepcopy(doc) if return_document else before
+
+    def find_one_and_delete(self, query, projection=None):
+        with self.lock:
+            doc = self._first(query)
+            if doc is not None:
+                del self.docs[doc["_id"]]
+            return doc
+
+    def update_one(self, query, update):
+        with self.lock:
+            doc = self._first(query)
+            if doc is not None:
+                self._update(doc, update)
+            return types.SimpleNamespace(matched_count=int(doc is not None))
+
+
+@pytest.fixture(autouse=True)
+def return_document(monkeypatch):
+    if job_queue.ReturnDocument is None:
+        monkeypatch.setattr(
+            job_queue, "ReturnDocument", types.SimpleNamespace(AFTER=True)
+        )
+
+
+@pytest.fixture
+def frame_dir(tmp_path):
+    return str(tmp_path)
+
+
+@pytest.fixture
+def queue(frame_dir):
+    return MongoJobQueue(FakeCollection(), frame_dir=frame_dir)
+
+
+def enqueue(queue, frames=2):
+    frame = np.zeros((8, 8, 3), np.uint8)
+    return queue.enqueue(b"master", [frame] * frames, "ABC", "m1")
+
+
+def result(res="pass"):
+    return {"image": b"", "diff": None, "res": res, "od": False, "report": {}}
+
+
+def test_claim_finish_wait(queue, frame_dir):
+    job_id = enqueue(queue)
+    assert len(os.listdir(frame_dir)) == 2
+    job = queue.claim("w1")
+    assert (job["_id"], job["status"], job["attempts"]) == (job_id, "running", 1)
+    assert queue.claim("w2") is None
+    assert queue.finish(job_id, "w1", result=result()) == "done"
+    answer = queue.wait(job_id, timeout=1)
+    assert answer["res"] == "pass"
+    assert answer["report"]["worker"] == "w1"
+    assert queue.collection.docs == {}
+    assert os.listdir(frame_dir) == []
+
+
+def test_stale_job_is_taken_over(queue):
+    job_id = enqueue(queue)
+    queue.claim("w1")
+    queue.collection.docs[job_id]["heartbeat_at"] = utcnow() - timedelta(hours=1)
+    job = queue.claim("w2")
+    assert (job["worker"], job["attempts"]) == ("w2", 2)
+    assert not queue.heartbeat(job_id, "w1")
+    # The first worker's late result is ignored
+    assert queue.finish(job_id, "w1", result=result("fail")) is None
+    assert queue.finish(job_id, "w2", result=result()) == "done"
+    assert queue.wait(job_id, timeout=1)["res"] == "pass"
+
+
+def test_job_out_of_attempts_fails(queue, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_MAX_ATTEMPTS", 1)
+    job_id = enqueue(queue)
+    queue.claim("w1")
+    queue.collection.docs[job_id]["heartbeat_at"] = utcnow() - timedelta(hours=1)
+    assert queue.claim("w2") is None
+    with pytest.raises(ImageProcessingError, match="stopped responding"):
+        queue.wait(job_id, timeout=1)
+    assert queue.collection.docs == {}
+
+
+def test_running_job_is_deleted_when_station_stopped_waiting(queue, frame_dir):
+    job_id = enqueue(queue)
+    queue.claim("w1")
+    with pytest.raises(ImageProcessingError, match="in time"):
+        queue.wait(job_id, timeout=0)
+    assert queue.collection.docs[job_id]["cancelled"]
+    assert queue.finish(job_id, "w1", result=result()) == "deleted"
+    assert queue.collection.docs == {}
+    assert os.listdir(frame_dir) == []
+
+
+def test_abandoned_cancelled_job_is_deleted(queue, frame_dir):
+    job_id = enqueue(queue)
+    queue.claim("w1")
+    with pytest.raises(ImageProcessingError):
+        queue.wait(job_id, timeout=0)
+    queue.collection.docs[job_id]["heartbeat_at"] = utcnow() - timedelta(hours=1)
+    assert queue.claim("w2") is None
+    assert queue.collection.docs == {}
+    assert os.listdir(frame_dir) == []
+
+
+def test_queued_job_is_deleted_when_station_stopped_waiting(queue, frame_dir):
+    job_id = enqueue(queue)
+    with pytest.raises(ImageProcessingError):
+        queue.wait(job_id, timeout=0)
+    assert queue.collection.docs == {}
+    assert os.listdir(frame_dir) == []
+    assert queue.claim("w1") is None
+
+
+@pytest.mark.parametrize(
+    "error, attempts", [(ImageProcessingError("blurred"), 1), (OSError("disk"), 3)]
+)
+def test_worker_retries_only_unexpected_errors(queue, monkeypatch, error, attempts):
+    calls = []
+
+    def analyse_job(job):
+        calls.append(job["attempts"])
+        raise error
+
+    monkeypatch.setattr(job_queue, "analyse_job", analyse_job)
+    monkeypatch.setattr(job_queue, "JOB_IDLE_WAIT", 0.01)
+    job_id = enqueue(queue)
+    stop = threading.Event()
+    worker = threading.Thread(target=run_worker, args=(queue, "w1", stop))
+    worker.start()
+    try:
+        with pytest.raises(ImageProcessingError, match=str(error)):
+            queue.wait(job_id, timeout=5)
+    finally:
+        stop.set()
+        worker.join()
+    assert calls == list(range(1, attempts + 1))
@@ -0,0 +1,42 @@
+import os
+
+import cv2
+import numpy as np
+
+from master_features import MasterFeatureCache, MasterFeatureStore, image_hash
+
+
+def master(shift=0):
+    image = np.full((120, 160, 3), 255, np.uint8)
+    cv2.rectangle(image, (30 + shift, 30), (90 + shift, 80), (0, 0, 0), -1)
+    cv2.circle(image, (120, 60), 15, (0, 0, 0), -1)
+    return image
+
+
+def test_models_sharing_a_photo_get_their_own_features(tmp_path):
+    cache = MasterFeatureCache(store=MasterFeatureStore(str(tmp_path)))
+    image = master()
+    first = cache.get(image, model_id="m1")
+    second = cache.get(image, model_id="m2")
+    assert first is not second
+    assert (first.model_id, second.model_id) == ("m1", "m2")
+    assert cache.get(image, model_id="m1") is first
+
+
+def test_new_photo_replaces_the_models_stored_features(tmp_path):
+    store = MasterFeatureStore(str(tmp_path))
+    cache = MasterFeatureCache(store=store)
+    old, new = master(), master(shift=10)
+    cache.get(old, model_id="m1")
+    cache.get(old, model_id="m2")
+    cache.get(new, model_id="m1")
+    assert os.listdir(tmp_path / "m1") == [image_hash(new)]
+    # Other models keep theirs
+    assert os.listdir(tmp_path / "m2") == [image_hash(old)]
+
+
+def test_unassigned_features_are_kept(tmp_path):
+    cache = MasterFeatureCache(store=MasterFeatureStore(str(tmp_path)))
+    cache.get(master())
+    cache.get(master(shift=10))
+    assert len(os.listdir(tmp_path / "unassigned")) == 2
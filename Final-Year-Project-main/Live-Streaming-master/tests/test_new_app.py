@@ -0,0 +1,134 @@
+import base64
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from defect_heatmap import DefectHeatmapStore
+from inspection_scheduler import InspectionScheduler
+from master_features import MasterFeatureStore
+
+
+def request_body(model_id, master="data:image/png;base64,AAAA"):
+    return {
+        "model_type": "ABC",
+        "model_id": model_id,
+        "master": master,
+        "speculation_id": "t1",
+    }
+
+
+@pytest.fixture
+def fake_inspection(new_app, monkeypatch, tmp_path):
+    """run_inspection replaced by one that returns a one-pixel defect mask."""
+    heatmaps = DefectHeatmapStore(str(tmp_path))
+    monkeypatch.setattr(new_app, "defect_heatmaps", heatmaps)
+
+    def run_inspection(data, on_frame=None, slot=None):
+        mask = np.zeros((4, 4), np.uint8)
+        mask[1, 1] = 255
+        return {"res": "pass", "report": {}}, (data["model_id"], "key", mask)
+
+    monkeypatch.setattr(new_app, "run_inspection", run_inspection)
+    new_app.speculative_inspection.discard()
+    return heatmaps
+
+
+def inspections(heatmaps, model_id):
+    return heatmaps.load(model_id, "key")[1]["inspections"]
+
+
+def test_taken_speculation_is_recorded_once(new_app, fake_inspection):
+    data = request_body("m1")
+    future = new_app.speculative_inspection.start(
+        new_app.inspection_key(data), lambda: new_app.inspect_meter(data)
+    )
+    future.result()
+    assert fake_inspection.load("m1", "key")[0] is None
+    result = new_app.capture_result(data)
+    assert result["report"]["speculative"] is True
+    assert result["report"]["heatmap_inspections"] == 1
+    assert inspections(fake_inspection, "m1") == 1
+
+
+def test_discarded_speculation_is_not_recorded(new_app, fake_inspection):
+    speculated = request_body("m1")
+    new_app.speculative_inspection.start(
+        new_app.inspection_key(speculated), lambda: new_app.inspect_meter(speculated)
+    ).result()
+    # Another model is inspected instead
+    result = new_app.capture_result(request_body("m2"))
+    assert "speculative" not in result["report"]
+    assert fake_inspection.load("m1", "key")[0] is None
+    assert inspections(fake_inspection, "m2") == 1
+
+
+def master_url():
+    with open(os.path.join(os.path.dirname(__file__), "..", "master.png"), "rb") as f:
+        return "data:image/png;base64," + base64.b64encode(f.read()).decode()
+
+
+def test_master_features_are_stored_for_the_model(new_app, tmp_path, monkeypatch):
+    store = MasterFeatureStore(str(tmp_path))
+    monkeypatch.setattr(new_app, "master_store", store)
+    client = new_app.app.test_client()
+    body = {
+        "model_id": "m1",
+        "master": master_url(),
+        "vision_configure": {"detector": "orb", "roi": [[0.1, 0.1, 0.5, 0.5]]},
+    }
+    response = client.post("/master_features", json=body)
+    assert response.status_code == 200
+    settings = new_app.vision_settings(body["vision_configure"])
+    key = response.json["key"]
+    assert response.json["path"] == store.path(
+        "m1", key, settings["detector"], roi=settings["roi"]
+    )
+    # Found by the same lookup an inspection of the model makes
+    stored = store.load(key, "m1", settings["detector"], roi=settings["roi"])
+    assert stored is not None
+    assert len(stored.keypoints) > 0
+    assert client.post("/master_features", json=body).json == response.json
+
+    assert client.delete("/master_features/m1").status_code == 200
+    assert store.find(key, "m1", settings["detector"], roi=settings["roi"]) is None
+
+
+def test_master_features_need_a_model_and_master(new_app):
+    client = new_app.app.test_client()
+    response = client.post("/master_features", json={"model_id": "m1"})
+    assert response.status_code == 400
+
+
+class FakeRemoteJobs:
+    """job_queue stand-in that records the scheduler while its job waits."""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.frames = []
+        self.running_while_waiting = None
+
+    def enqueue(self, master_data, frames, model_name, model_id=None, vision=None):
+        self.frames = frames
+        return "job1"
+
+    def wait(self, job_id):
+        self.running_while_waiting = self.scheduler.status()["running"]
+        image = cv2.imencode(".png", self.frames[0])[1].tobytes()
+        return {"image": image, "diff": None, "res": "pass", "od": 0, "report": {}}
+
+
+def test_remote_inspection_frees_its_slot_while_waiting(new_app, monkeypatch):
+    scheduler = InspectionScheduler(concurrency=1, max_queue=0)
+    remote = FakeRemoteJobs(scheduler)
+    monkeypatch.setattr(new_app, "inspection_scheduler", scheduler)
+    monkeypatch.setattr(new_app, "remote_jobs", remote)
+    data = request_body("m1", master_url())
+    data["vision_configure"] = {"max_frames": 3}
+    result, defects = new_app.inspect_meter(data)
+    assert len(remote.frames) == 3
+    assert remote.running_while_waiting == 0
+    assert result["report"]["job_id"] == "job1"
+    assert result["report"]["queue"]["queue_position"] == 0
+    assert defects[2] is None
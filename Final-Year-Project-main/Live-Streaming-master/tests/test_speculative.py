@@ -0,0 +1,76 @@
+import threading
+
+from speculative import SpeculativeSlot, inspection_key
+
+
+def body(model_id="m1", master="data:image/png;base64,AAAA", vision=None, token="t1"):
+    return {
+        "model_id": model_id,
+        "master": master,
+        "vision_configure": vision,
+        "speculation_id": token,
+    }
+
+
+def test_inspection_key_ignores_settings_order():
+    a = inspection_key(body(vision={"detector": "orb", "max_frames": 5}))
+    b = inspection_key(body(vision={"max_frames": 5, "detector": "orb"}))
+    assert a == b
+    assert inspection_key(body()) == inspection_key(body(vision={}))
+    assert inspection_key(body()) != inspection_key(body(master="data:,BBBB"))
+    assert inspection_key(body()) != inspection_key(body(model_id="m2"))
+    # Another meter of the same model
+    assert inspection_key(body()) != inspection_key(body(token="t2"))
+
+
+def test_take_with_the_same_key_gets_the_result_once():
+    slot = SpeculativeSlot()
+    key = inspection_key(body())
+    slot.start(key, lambda: "result")
+    assert slot.take(key).result() == "result"
+    assert slot.take(key) is None
+    assert (slot.hits, slot.misses) == (1, 0)
+
+
+def test_take_with_another_key_drops_the_speculation():
+    slot = SpeculativeSlot()
+    slot.start(inspection_key(body()), lambda: "result")
+    assert slot.take(inspection_key(body(model_id="m2"))) is None
+    assert slot.take(inspection_key(body())) is None
+    assert (slot.hits, slot.misses) == (0, 1)
+
+
+def test_expired_speculation_is_not_taken():
+    slot = SpeculativeSlot(ttl=0)
+    key = inspection_key(body())
+    slot.start(key, lambda: "result").result()
+    assert slot.take(key) is None
+    assert slot.misses == 1
+
+
+def test_start_always_replaces_the_previous_inspection():
+    slot = SpeculativeSlot()
+    key = inspection_key(body())
+    release = threading.Event()
+    running = slot.start(key, lambda: release.wait(5) and "meter A")
+    queued = slot.start(key, lambda: "meter A again")
+    latest = slot.start(key, lambda: "meter B")
+    assert queued.cancelled()
+    assert slot.take(key) is latest
+    release.set()
+    assert running.result() == "meter A"
+    assert latest.result() == "meter B"
+
+
+def test_discard_and_replace_cancel_queued_inspections():
+    slot = SpeculativeSlot()
+    release = threading.Event()
+    running = slot.start("a", lambda: release.wait(5))
+    # Queued behind the running one on the single worker
+    queued = slot.start("b", lambda: "b")
+    assert not running.cancelled()
+    slot.discard()
+    assert queued.cancelled()
+    assert slot.take("b") is None
+    release.set()
+    assert running.result()
@@ -0,0 +1,33 @@
+import os
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+import ssim_inspection
+from master_features import compute_master_features
+
+SAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def test_reference_masks_are_bounded(monkeypatch):
+    monkeypatch.setattr(ssim_inspection, "REFERENCE_CACHE_SIZE", 2)
+    monkeypatch.setattr(ssim_inspection, "_reference_masks", OrderedDict())
+    path = os.path.join(SAMPLES, "diff_ref.png")
+    first = ssim_inspection.reference_mask((40, 40), path)
+    for size in [(50, 50), (60, 60)]:
+        ssim_inspection.reference_mask(size, path)
+    assert len(ssim_inspection._reference_masks) == 2
+    assert ssim_inspection.reference_mask((60, 60), path).shape == (60, 60)
+    assert ssim_inspection.reference_mask((40, 40), path) is not first
+
+
+def test_master_contours_are_kept_on_the_features():
+    master = cv2.imread(os.path.join(SAMPLES, "master.png"))
+    features = compute_master_features(master)
+    contours = ssim_inspection.master_contours(features)
+    assert ssim_inspection.master_contours(features) is contours
+    expected = cv2.findContours(
+        np.asarray(features.mask_master), cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )[0]
+    assert len(contours) == len(expected) > 0